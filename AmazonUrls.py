@@ -0,0 +1,200 @@
+"""
+Helpers to build and rewrite amazon urls.
+"""
+
+import math
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import Settings as settings
+
+REVIEWS_PER_PAGE = 10  # reviews on a review list page
+
+# query parameters that select the content of a review list page, the others are tracking parameters
+REVIEW_LIST_PARAMETERS = ('filterByStar', 'formatType', 'pageNumber', 'reviewerType', 'sortBy')
+
+# canonical path of the pages scraped, by the id found in their url
+CANONICAL_PATHS = (
+    (re.compile(r'/gp/customer-reviews/([A-Z0-9]+)'), '/gp/customer-reviews/%s'),
+    (re.compile(r'/gp/profile/(amzn1\.account\.[A-Z0-9]+)'), '/gp/profile/%s'),
+    (re.compile(r'/product-reviews/([A-Z0-9]{10})'), '/product-reviews/%s'),
+    (re.compile(r'(?:/dp/|/gp/product/)([A-Z0-9]{10})'), '/dp/%s'),
+)
+
+
+def rebase_url(url):
+    """
+    Send an amazon url to the host configured in Settings.BASE_URL.
+
+    Parameters
+    ----------
+    url : string
+        absolute or relative amazon url
+
+    Returns
+    -------
+    url : string
+        same path and query on the configured host
+    """
+    if not url:
+        return url
+    base = urlsplit(settings.BASE_URL)
+    parts = urlsplit(url)
+    return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, parts.fragment))
+
+
+def review_id(url):
+    """
+    Id of the review of a review detail url (/gp/customer-reviews/<id>/...).
+
+    Parameters
+    ----------
+    url : string
+        url of a review detail page
+
+    Returns
+    -------
+    id : string
+        id of the review, the url itself if it has none
+    """
+    match = re.search(r'/customer-reviews/([A-Z0-9]+)', url or '')
+    return match.group(1) if match else url
+
+
+def asin_from_url(url):
+    """
+    ASIN of the product of an amazon url (/dp/<asin>, /gp/product/<asin>, /product-reviews/<asin> or ASIN=<asin>).
+
+    Parameters
+    ----------
+    url : string
+        url of a product, review list or review detail page
+
+    Returns
+    -------
+    asin : string or None
+        ASIN of the product, None if the url has none
+    """
+    match = re.search(r'(?:/dp/|/gp/product/|/product-reviews/|[?&]ASIN=)([A-Z0-9]{10})', url or '')
+    return match.group(1) if match else None
+
+
+def normalize_url(url):
+    """
+    Canonical form of an amazon url, the same for all the links to a page whatever the host,
+    the slug of the product name or the tracking parameters (ref=...) of the link.
+
+    Product pages become /dp/<asin>, review list pages /product-reviews/<asin> with the
+    parameters that select the reviews (pageNumber, sortBy, ...), review detail pages
+    /gp/customer-reviews/<id> and profiles /gp/profile/<account>. Other urls keep their path
+    without its /ref= part and their query without the ref parameters.
+
+    Parameters
+    ----------
+    url : string
+        absolute or relative amazon url
+
+    Returns
+    -------
+    url : string
+        path and query of the canonical url
+    """
+    parts = urlsplit(url or '')
+    query = parse_qsl(parts.query)
+    for pattern, path in CANONICAL_PATHS:
+        match = pattern.search(parts.path)
+        if match is None:
+            continue
+        path = path % match.group(1)
+        if not path.startswith('/product-reviews/'):
+            return path
+        parameters = dict(query)
+        parameters.setdefault('pageNumber', '1')
+        return path + '?' + urlencode(sorted((key, value) for key, value in parameters.items()
+                                             if key in REVIEW_LIST_PARAMETERS))
+    path = re.sub(r'/ref=[^/]*', '', parts.path)
+    query = sorted((key, value) for key, value in query if not key.startswith('ref') and key != 'ie')
+    return path + ('?' + urlencode(query) if query else '')
+
+
+def reviews_url(asin):
+    """
+    Url of the first page of the review list of a product on the host configured in Settings.BASE_URL.
+
+    Parameters
+    ----------
+    asin : string
+        ASIN of the product
+
+    Returns
+    -------
+    url : string
+        url of the "See all reviews" page of the product
+    """
+    return rebase_url(f'/product-reviews/{asin}/?ie=UTF8&reviewerType=all_reviews')
+
+
+def page_number(url):
+    """
+    Number of the review list page of a url (pageNumber parameter), 1 if it has none.
+    """
+    try:
+        return int(dict(parse_qsl(urlsplit(url or '').query)).get('pageNumber', 1))
+    except ValueError:
+        return 1
+
+
+def review_page_url(url, page, sort_by=None):
+    """
+    Url of another page of a review list.
+
+    Parameters
+    ----------
+    url : string
+        url of a page of the review list
+    page : int
+        number of the page
+    sort_by : string
+        order of the reviews ('recent' or 'helpful'), the one of url if None
+
+    Returns
+    -------
+    url : string
+        url with the pageNumber (and sortBy) parameters set
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query['pageNumber'] = str(page)
+    if sort_by:
+        query['sortBy'] = sort_by
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def review_page_urls(url, total, sort_by=None):
+    """
+    Urls of the pages of a review list after the page of url.
+
+    Parameters
+    ----------
+    url : string
+        url of a page of the review list
+    total : int
+        number of reviews of the list
+    sort_by : string
+        order of the reviews, the one of url if None
+
+    Returns
+    -------
+    urls : list of string
+        urls of the following pages up to the last one, in page order
+    """
+    last = math.ceil(total / REVIEWS_PER_PAGE)
+    return [review_page_url(url, page, sort_by) for page in range(page_number(url) + 1, last + 1)]
+
+
+def review_sort():
+    """
+    Order of the review lists of the sub-products: most recent first in INCREMENTAL mode, so the
+    scrapers can stop at the reviews already saved, Settings.PAGINATION_SORT otherwise.
+    """
+    return 'recent' if settings.INCREMENTAL else settings.PAGINATION_SORT
@@ -1,4 +1,175 @@
+import json
+
 from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import WebDriverException
+
+import Settings as settings
+from Metrics import metrics
+
+# urls of the review detail pages of all the cards on an author profile (see get_review_links)
+REVIEW_LINKS_SCRIPT = """
+var links = [];
+var cards = document.evaluate('//div[@id="profile-at-card-container"]//div[@class="a-row"]', document, null,
+                              XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var i = 0; i < cards.snapshotLength; i++) {
+    var link = cards.snapshotItem(i).querySelector('div.a-section.profile-at-content > p > a');
+    if (link) links.push(link.href);
+}
+return links;
+"""
+
+# one round trip for all the fields of a review detail page (see get_review_details)
+REVIEW_DETAIL_SCRIPT = """
+function text(selector, attribute) {
+    var node = document.querySelector(selector);
+    if (!node) return null;
+    return attribute ? node.getAttribute(attribute) : (node.innerText || '').trim();
+}
+return JSON.stringify({
+    date: text('span[data-hook="review-date"]'),
+    title: text('a[data-hook="review-title"]'),
+    ratings: text('.a-link-normal', 'title'),
+    review: text('span[data-hook="review-body"]'),
+    verified: document.querySelector('span[data-hook="avp-badge"]') !== null,
+    helpful: (document.querySelector('span.cr-vote > div.a-row.a-spacing-small > span') || {}).textContent || null,
+    url: (document.querySelector('a[data-hook="product-link"]') || {}).href || null
+});
+"""
+
+# one round trip for all the review cards of a review list page (see get_review_cards)
+REVIEW_LIST_SCRIPT = """
+function node(card, path) {
+    return document.evaluate(path, card, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+function text(card, path) {
+    var found = node(card, path);
+    return found ? (found.innerText || '').trim() : null;
+}
+var cards = [];
+if (document.getElementById('cm_cr-review_list')) {
+    document.querySelectorAll('div[data-hook="review"]').forEach(function (review) {
+        var card = document.getElementById('customer_review-' + review.id) || review;
+        var reviewer = card.querySelector('div.a-profile-content > span');
+        var date = node(card, './/span[@data-hook="review-date"]');
+        var ratings = node(card, './div[2]/a[1]');
+        var helpful = card.querySelector('span.cr-vote > div.a-row.a-spacing-small > span');
+        var profile = node(card, './/div[@data-hook="genome-widget"]/a');
+        cards.push({
+            id: review.id,
+            reviewer: reviewer ? reviewer.textContent : null,
+            date: date ? date.textContent : null,
+            ratings: ratings ? ratings.getAttribute('title') : null,
+            review: text(card, './div[4]/span'),
+            helpful: helpful ? helpful.textContent : null,
+            verified: node(card, './div[3]/span/a/span') !== null,
+            title: text(card, './div[2]/a[2]/span'),
+            profile: profile ? profile.href : null
+        });
+    });
+}
+return JSON.stringify(cards);
+"""
+
+# captcha page or amazon error page (503) loaded in the browser (see is_blocked)
+BLOCKED_PAGE_SCRIPT = """
+return document.querySelector('form[action*="validateCaptcha"]') !== null ||
+       document.title.indexOf('Something went wrong') >= 0;
+"""
+
+# fetch review detail pages from inside the current page, in parallel, and read them
+# with REVIEW_DETAIL_SCRIPT (see fetch_review_details)
+FETCH_DETAILS_SCRIPT = """
+var urls = arguments[0], done = arguments[arguments.length - 1];
+function read(document) {%s}
+function blocked(document) {%s}
+Promise.all(urls.map(function (url) {
+    return fetch(url, {credentials: 'include'}).then(function (response) {
+        return response.text().then(function (html) {
+            var page = new DOMParser().parseFromString(html, 'text/html');
+            page.querySelectorAll('br').forEach(function (br) { br.replaceWith('\\n'); });
+            var isBlocked = response.status === 429 || response.status === 503 || blocked(page);
+            return {blocked: isBlocked, fields: isBlocked ? null : read(page)};
+        });
+    }).catch(function () { return {blocked: false, fields: null}; });
+})).then(function (pages) { done(JSON.stringify(pages)); });
+""" % (REVIEW_DETAIL_SCRIPT, BLOCKED_PAGE_SCRIPT)
+
+
+def split_review_date(message):
+    """
+    Split the review date message ("Reviewed in Canada on May 1, 2020").
+
+    Parameters
+    ----------
+    message : string
+        text of the review-date element
+
+    Returns
+    -------
+    date: string
+        date the review was posted, or the whole message if not reviewed in Canada
+    canada: bool
+        True if the review was posted in Canada
+    """
+    words = message.split()
+    if len(words) > 2 and words[2].lower() == 'canada':
+        return ' '.join(words[-3:]), True
+    return message, False
+
+
+def review_detail_fields(raw):
+    """
+    Convert the raw values of REVIEW_DETAIL_SCRIPT to the values returned by the getters.
+
+    Parameters
+    ----------
+    raw : dict
+        raw values read from a review detail page
+
+    Returns
+    -------
+    fields: dict
+        date, title, ratings, review, verified_purchase, helpful and url of the review
+    """
+    return {
+        'date': ' '.join(raw['date'].split()[-3:]) if raw['date'] else "",
+        'title': raw['title'] or "",
+        'ratings': raw['ratings'].split()[0] if raw['ratings'] else "",
+        'review': raw['review'] or "",
+        'verified_purchase': "yes" if raw['verified'] else "no",
+        'helpful': raw['helpful'].split()[0] if raw['helpful'] else 0,
+        'url': raw['url'] or "",
+    }
+
+
+def review_card_fields(raw):
+    """
+    Convert the raw values of REVIEW_LIST_SCRIPT to the values returned by the level 3 getters.
+
+    Parameters
+    ----------
+    raw : dict
+        raw values read from one review card
+
+    Returns
+    -------
+    fields: dict
+        id, reviewer, date, canada, ratings, review, helpful, verified_purchase, review_title
+        and author_profile of the review
+    """
+    date, canada = split_review_date(raw['date'] or "")
+    return {
+        'id': raw['id'],
+        'reviewer': raw['reviewer'].split('\n')[0] if raw['reviewer'] else False,
+        'date': date,
+        'canada': canada,
+        'ratings': float(raw['ratings'][0]) if raw['ratings'] else "",
+        'review': raw['review'] or "",
+        'helpful': raw['helpful'].split()[0] if raw['helpful'] else 0,
+        'verified_purchase': raw['verified'],
+        'review_title': raw['title'] or "",
+        'author_profile': raw['profile'] or "",
+    }
 
 
 class AuthorConfiguration:
@@ -25,6 +196,14 @@ class AuthorConfiguration:
         Get the cover image of the author.
     get_category():
         Get category of the product.
+    get_review_links():
+        Get the urls of the review detail pages of all the cards on an author profile.
+    get_review_details():
+        Get all the fields of a review detail page in one call.
+    get_review_cards():
+        Get all the fields of all the reviews of a review list page in one call.
+    fetch_review_details():
+        Fetch review detail pages from inside the current page and get their fields.
     getPageContent():
         Retrieve the info about brand and rank.
     getReviewer():
@@ -53,6 +232,10 @@ class AuthorConfiguration:
         Gives table with rank of the product.
     get_rank():
         If rank is not present in get_extra_info(), then this function will check.
+    get_product_details():
+        Gives brand, rank and category of the product.
+    is_blocked():
+        Check if amazon answered with a captcha or an error page.
     """
 
     def get_author_name(self, driver):
@@ -275,6 +458,76 @@ class AuthorConfiguration:
         except NoSuchElementException:
             return False
 
+    def get_review_links(self, driver):
+        """
+        Get the urls of the review detail pages of all the cards on an author profile.
+
+        Parameters
+        ----------
+        driver : selenium web driver object
+            object of webdriver.
+        Returns
+        -------
+        links: list of string
+            url of each review card, in the order of the profile
+        """
+        return driver.execute_script(REVIEW_LINKS_SCRIPT) or []
+
+    def get_review_details(self, driver):
+        """
+        Get all the fields of a review detail page. The page is read with a single
+        injected script; if it fails the getters above are used one by one.
+
+        Parameters
+        ----------
+        driver : selenium web driver object
+            object of webdriver.
+        Returns
+        -------
+        fields: dict
+            date, title, ratings, review, verified_purchase, helpful and url of the review
+        """
+        if settings.BATCH_EXTRACTION:
+            try:
+                return review_detail_fields(json.loads(driver.execute_script(REVIEW_DETAIL_SCRIPT)))
+            except (WebDriverException, TypeError, ValueError) as exc:
+                print('batch extraction failed, using getters', exc)
+        return {
+            'date': self.get_posted_date(driver),
+            'title': self.get_title(driver),
+            'ratings': self.get_ratings(driver),
+            'review': self.get_reviews(driver),
+            'verified_purchase': self.is_verified_purchase(driver),
+            'helpful': self.get_helpful_count(driver),
+            'url': self.get_product_url(driver),
+        }
+
+    def fetch_review_details(self, driver, urls):
+        """
+        Fetch review detail pages from inside the page loaded in the driver, all at
+        once, and read their fields without opening them in a tab.
+
+        Parameters
+        ----------
+        driver : selenium web driver object
+            object of webdriver.
+        urls : list of string
+            urls of the review detail pages
+        Returns
+        -------
+        pages: list of tuple
+            fields of each review (None if the page could not be read) and whether
+            amazon answered with a captcha or an error page
+        """
+        driver.set_script_timeout(settings.HTTP_TIMEOUT * 2)
+        try:
+            pages = json.loads(driver.execute_async_script(FETCH_DETAILS_SCRIPT, urls))
+        except (WebDriverException, TypeError, ValueError) as exc:
+            print('unable to fetch the review pages', exc)
+            return [(None, False)] * len(urls)
+        return [(review_detail_fields(json.loads(page['fields'])) if page['fields'] else None, page['blocked'])
+                for page in pages]
+
     """
     *******************************************************************************
     Functions for product scraping (level 3)
@@ -368,15 +621,10 @@ class AuthorConfiguration:
 
         path = '//*[@id="customer_review-' + id + '"]//span[@data-hook="review-date"]'
         message = str(driver.find_element_by_xpath(path).get_attribute('textContent'))
-        country = message.split()[2]
-
-        if country.lower() == 'canada':
-            message = message.split()[-3:]
-            date = ' '.join(map(str, message))
-            return date, True
-        else:
+        date, canada = split_review_date(message)
+        if not canada:
             print('not canada')
-            return message, False
+        return date, canada
 
     def isVerifiedPurchase(self, driver, id):
 
@@ -605,4 +853,114 @@ class AuthorConfiguration:
             rank = driver.find_element_by_xpath(path).text
             return rank
         except NoSuchElementException:
-            return None
\ No newline at end of file
+            return None
+
+    def get_product_details(self, driver):
+        """
+        This function gets the brand, rank and category of the product.
+
+        Parameters
+        ----------
+        driver : selenium webdriver object
+            web driver of selenium
+
+        Returns
+        -------
+        details: dict
+            brand, rank (empty strings if not found) and category (None if not found) of the product
+        """
+        product_info = self.get_summary_table(driver)  # table where brand and rank are specified
+
+        brand = []
+        # brand name can be found in one of the two different tables.
+        # if not found in 1st scenario below, then check for other table
+        for i in product_info:
+            row = i.find_element_by_xpath('th').text.lower().strip()
+            if (row is not None) and (row == "brand"):
+                brand.append(i.find_element_by_xpath('td').text)
+        # 2nd scenario to get brand name
+        if len(brand) == 0:
+            rows = self.get_brand(driver)
+            if rows is not None:
+                for row in rows:
+                    try:
+                        bname = row.find_element_by_xpath('span/span[1]').text.lower()
+                    except NoSuchElementException:
+                        continue
+                    if (bname is not None) and (
+                            (('manufacturer' in bname) and len(bname.split()) > 1) or ('brand' in bname)):
+                        print(bname)
+                        try:
+                            bname = row.find_element_by_xpath('span/span[2]').text
+                            brand.append(bname)
+                            print(brand)
+                        except NoSuchElementException:
+                            brand = []
+
+        # get the rank of the product
+        # rank can be found in one of the two tables:
+        # check in 1st table
+        extra_info = self.get_extra_info(driver)
+        rank = []
+        for i in extra_info:
+            row = i.find_element_by_xpath('th').text.lower().strip()
+            if "rank" in row:
+                rank.append(i.find_element_by_xpath('td').text)
+        # if 1st table is not found, check for 2nd table
+        if len(rank) == 0:
+            row = self.get_rank(driver)
+            if row is not None:
+                row = row.split('#')[1].split()[0]
+                rank.append(row)
+
+        categories = self.get_category(driver)
+        return {
+            'brand': brand[0] if len(brand) > 0 else "",
+            'rank': rank[0] if len(rank) > 0 else "",
+            'category': categories[0].text if categories else None,
+        }
+
+    def get_review_cards(self, driver):
+        """
+        This function returns all the fields of all the reviews on a review list page,
+        read with a single injected script.
+
+        Parameters
+        ----------
+        driver : selenium webdriver object
+            web driver of selenium
+
+        Returns
+        -------
+        list of dict or None
+            fields of each review (see review_card_fields), None if the script failed
+        """
+        try:
+            cards = json.loads(driver.execute_script(REVIEW_LIST_SCRIPT))
+        except (WebDriverException, TypeError, ValueError) as exc:
+            print('batch extraction failed', exc)
+            return None
+        return [review_card_fields(card) for card in cards]
+
+    def is_blocked(self, driver):
+        """
+        This function checks if the page loaded in the driver is a captcha or an amazon error page
+
+        Parameters
+        ----------
+        driver : selenium webdriver object
+            web driver of selenium
+
+        Returns
+        -------
+        bool
+            True if amazon is throttling the scraper
+        """
+        try:
+            return bool(driver.execute_script(BLOCKED_PAGE_SCRIPT))
+        except WebDriverException as exc:
+            print('unable to check the page', exc)
+            return False
+
+
+metrics.instrument(AuthorConfiguration, 'extract')  # time each field extraction
@@ -0,0 +1,268 @@
+"""
+asyncio crawl engine.
+
+Author profiles, review detail pages, product pages and review list pages
+are scheduled as tasks that share one pooled http session (HttpFetcher).
+Each host gets a bounded number of concurrent requests and a global cap
+limits the requests in flight, so the crawl runs at the allowed request
+rate instead of waiting on one page at a time. The request rate itself
+is set by the RateController that paces the fetcher.
+
+Only the review cards rendered with an author profile page are visible
+over http; a profile that may load more cards by scrolling is left to the
+browser (main.py) instead of being saved without them.
+"""
+
+import asyncio
+import datetime
+from urllib.parse import urljoin, urlsplit
+
+import HttpFetcher as fetch
+import Settings as settings
+from AmazonUrls import asin_from_url, page_number, review_id, review_sort, reviews_url
+from AmazonUrls import review_page_url, review_page_urls
+from PageParser import PageParser
+
+
+class CrawlEngine:
+    """
+    Schedules page fetches with per-host and global concurrency limits.
+
+    Attributes
+    ----------
+    fetcher : HttpFetcher object
+        pooled http session shared by all the tasks
+    parser : PageParser object
+        reads the fetched pages
+    per_host : int
+        maximum concurrent requests per host
+    max_in_flight : int
+        maximum concurrent requests over all hosts
+    """
+
+    def __init__(self, fetcher=None, per_host=None, max_in_flight=None):
+        """
+        Constructor for the crawl engine, must be called inside the event loop
+
+        Parameters
+        ----------
+        fetcher : HttpFetcher object
+            http session, a new one is created if None
+        per_host : int
+            maximum concurrent requests per host
+        max_in_flight : int
+            maximum concurrent requests over all hosts
+        """
+        self.per_host = per_host or settings.PER_HOST_CONCURRENCY
+        self.max_in_flight = max_in_flight or settings.MAX_IN_FLIGHT
+        self.fetcher = fetcher or fetch.HttpFetcher(pool_size=self.max_in_flight)
+        self.parser = PageParser()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._hosts = {}
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    async def fetch(self, url, kind):
+        """
+        Fetch and parse a page once a slot for its host is free.
+
+        Parameters
+        ----------
+        url : string
+            url of the page
+        kind : string
+            kind of page (see HttpFetcher)
+
+        Returns
+        -------
+        page : lxml element or None
+            parsed page, None if the page needs the browser
+        """
+        async with self._in_flight, self._host_limit(url):
+            html = await asyncio.to_thread(self.fetcher.get_page, url, kind)
+        if html is None:
+            return None
+        return self.parser.parse(html, url)
+
+    async def crawl_review(self, url):
+        """
+        Fetch a review detail page.
+
+        Parameters
+        ----------
+        url : string
+            url of the review detail page
+
+        Returns
+        -------
+        fields : dict or None
+            fields of the review (see AuthorConfiguration.get_review_details) with start and end time
+        """
+        start = datetime.datetime.now()
+        page = await self.fetch(url, fetch.REVIEW_DETAIL)
+        if page is None:
+            return None
+        fields = self.parser.get_review_details(page)
+        fields['review_id'] = review_id(url)
+        fields['start'] = start
+        fields['end'] = datetime.datetime.now()
+        return fields
+
+    async def crawl_author(self, url, watermark=None):
+        """
+        Fetch an author profile and all its review detail pages.
+
+        Parameters
+        ----------
+        url : string
+            url of the author profile
+        watermark : Watermark object
+            newest review of the author saved by a previous run (see Watermarks.py), the reviews
+            from it on, or from the first one older than it, are not kept
+
+        Returns
+        -------
+        author : dict or None
+            name, profile_image, cover_image and reviews of the author, None if the profile needs the browser:
+            its feed loads more cards by scrolling or a review page could not be fetched
+        """
+        page = await self.fetch(url, fetch.PROFILE)
+        if page is None:
+            return None
+        links = self.parser.get_review_links(page)
+        known = None
+        if watermark is not None:  # the profile lists the reviews most recent first
+            known = next((index for index, link in enumerate(links) if watermark.reached(review_id(link))), None)
+        if known is not None:
+            links = links[:known]
+        elif watermark is None and self.parser.has_more_reviews(page):
+            return None
+        reviews = await asyncio.gather(*(self.crawl_review(urljoin(url, link)) for link in links))
+        if any(review is None for review in reviews):
+            return None
+        if watermark is not None and known is None:
+            # the watermark review is not in the feed (deleted since), stop at the first older review
+            older = next((index for index, review in enumerate(reviews)
+                          if watermark.reached(review['review_id'], review['date'])), None)
+            if older is None and self.parser.has_more_reviews(page):
+                return None
+            reviews = reviews[:older]
+        return {
+            'name': self.parser.get_author_name(page),
+            'profile_image': self.parser.get_profile_image(page),
+            'cover_image': self.parser.get_cover_image(page),
+            'reviews': reviews,
+        }
+
+    async def crawl_product(self, url, product_category, details=None, watermark=None):
+        """
+        Fetch a sub-product and, if it belongs to the main product category, its review list pages.
+
+        Parameters
+        ----------
+        url : string
+            url of the sub-product
+        product_category : string
+            category of the main product
+        details : dict
+            details of the sub-product if they are known (see ProductCatalog.py), its product page
+            is not fetched then and the review list is fetched from its first page
+        watermark : Watermark object
+            newest review of the sub-product saved by a previous run (see Watermarks.py), the
+            review list is fetched up to it
+
+        Returns
+        -------
+        product : dict or None
+            details (name, brand, rank, category), start time and review cards of the sub-product,
+            None if the product page or a review list page needs the browser
+        """
+        start = datetime.datetime.now()
+        if details is not None:
+            product = {'details': details, 'start': start, 'cards': [], 'watermark': watermark}
+            if details['category'] is not None and product_category in details['category']:
+                if not await self.crawl_reviews(reviews_url(asin_from_url(url)), product):
+                    return None
+            return product
+        page = await self.fetch(url, fetch.PRODUCT)
+        if page is None:
+            return None
+        details = self.parser.get_product_details(page)
+        details['name'] = self.parser.getProductName(page)
+        product = {'details': details, 'start': start, 'cards': [], 'watermark': watermark}
+        if details['category'] is None or product_category not in details['category']:
+            return product
+
+        url = self.parser.get_all_reviews_url(page)
+        if not url:
+            product['cards'] = self.parser.get_review_cards(page)
+            return product
+        if not await self.crawl_reviews(url, product):
+            return None
+        return product
+
+    async def crawl_reviews(self, url, product):
+        """
+        Fetch the review list pages of a sub-product, up to the last one, the first review from another
+        country or the watermark of the sub-product. With PAGINATION=direct, the pages after the first one
+        are fetched concurrently from their urls, computed from the number of reviews.
+
+        Parameters
+        ----------
+        url : string
+            url of the first review list page
+        product : dict
+            sub-product (see crawl_product), the review cards are added to its cards
+
+        Returns
+        -------
+        bool
+            False if a page could not be fetched, the review list is incomplete
+        """
+        direct = settings.PAGINATION == 'direct'
+        if direct or settings.INCREMENTAL:
+            url = review_page_url(url, page_number(url), review_sort())
+        while url:
+            page = await self.fetch(url, fetch.REVIEW_LIST)
+            if page is None:
+                return False
+            if not self._add_cards(product, page):
+                break
+            total = self.parser.get_total_reviews(page) if direct else None
+            if total is not None:
+                return await self._crawl_pages(review_page_urls(url, total), product)
+            url = self.parser.get_next_page_url(page)
+        return True
+
+    async def _crawl_pages(self, urls, product):
+        # PAGINATION_BATCH pages at a time, their cards added in page order; False if a page is missing
+        for first in range(0, len(urls), settings.PAGINATION_BATCH):
+            window = urls[first:first + settings.PAGINATION_BATCH]
+            pages = await asyncio.gather(*(self.fetch(url, fetch.REVIEW_LIST) for url in window))
+            for page in pages:
+                if page is None:
+                    return False
+                if not self._add_cards(product, page):
+                    return True
+        return True
+
+    def _add_cards(self, product, page):
+        cards = self.parser.get_review_cards(page)
+        watermark = product.get('watermark')
+        if watermark is not None:
+            # the reviews are sorted most recent first, the ones from the watermark on are saved
+            known = next((index for index, card in enumerate(cards) if watermark.reached(card['id'], card['date'])),
+                         None)
+            if known is not None:
+                product['cards'].extend(cards[:known])
+                return False
+        product['cards'].extend(cards)
+        # reviews from other countries come last, stop at the first one
+        return not any(not card['reviewer'] or not card['canada'] for card in cards)
+
+    def close(self):
+        self.fetcher.close()
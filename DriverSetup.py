@@ -1,26 +1,208 @@
+import os
+
 from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException, WebDriverException
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
+import Settings as settings
+from DriverTrace import tracer
+from Metrics import metrics
+from ResourceBlocker import ResourceBlocker
+
+_driver_path = None  # chromedriver binary, resolved once per process
+
+
+def driver_path(refresh=False):
+    """
+    Path of the chromedriver binary. It is taken from Settings.CHROMEDRIVER_PATH,
+    else from the path saved by a previous run, else installed by webdriver-manager
+    (which checks the chrome version online) and saved for the next runs.
+
+    Parameters
+    ----------
+    refresh : bool
+        forget the saved path and install the driver again, e.g. after chrome was updated
+
+    Returns
+    -------
+    path : string
+        path of the chromedriver binary
+    """
+    global _driver_path
+    if settings.CHROMEDRIVER_PATH:
+        return settings.CHROMEDRIVER_PATH
+    if refresh:
+        _driver_path = None
+        if os.path.exists(settings.DRIVER_PATH_CACHE):
+            os.remove(settings.DRIVER_PATH_CACHE)
+    if _driver_path is not None:
+        return _driver_path
+    if os.path.exists(settings.DRIVER_PATH_CACHE):
+        with open(settings.DRIVER_PATH_CACHE) as file:
+            path = file.read().strip()
+        if os.path.exists(path):
+            _driver_path = path
+            return _driver_path
+    _driver_path = ChromeDriverManager().install()
+    with open(settings.DRIVER_PATH_CACHE, 'w') as file:
+        file.write(_driver_path)
+    return _driver_path
+
 
 class DriverSetup:
     """
     Selenium web driver setup.
 
+    One object can be reused for many authors and products: the driver is
+    started once (or on first use with start=False) and restarted when a
+    session breaks.
+
     Attributes
     ----------
     driver : selenium web driver object
-        object of webdriver.
+        object of webdriver, None until started.
+    headless : bool
+        run chrome without a window
+    page_load_strategy : string
+        'normal' waits for all resources, 'eager' for the DOM only, 'none' does not wait
+    blocker : ResourceBlocker object
+        resources blocked in the browser and their counters, kept across restarts
 
     """
     driver = None
 
-    def __init__(self):
+    def __init__(self, start=True, headless=None, page_load_strategy=None):
         """
         Constructor for webdriver initialisation
+
+        Parameters
+        ----------
+        start : bool
+            start the driver now, else on first call to get_driver()
+        headless : bool
+            run chrome without a window, defaults to Settings.HEADLESS
+        page_load_strategy : string
+            defaults to Settings.PAGE_LOAD_STRATEGY
         """
+        self.headless = settings.HEADLESS if headless is None else headless
+        self.page_load_strategy = page_load_strategy or settings.PAGE_LOAD_STRATEGY
+        self.blocker = ResourceBlocker()
+        if start:
+            self.start()
+
+    def options(self):
         opt = Options()
-        # opt.headless = True  # set headless mode to True
-        opt.add_argument('--incognito')
+        opt.headless = self.headless
+        if settings.INCOGNITO:
+            opt.add_argument('--incognito')
         opt.add_argument('--disable-gpu')
-        self.driver = webdriver.Chrome(ChromeDriverManager().install(), options=opt)
+        opt.add_argument('--disable-extensions')
+        opt.add_argument('--disable-dev-shm-usage')
+        opt.add_argument('--no-first-run')
+        opt.add_argument('--no-default-browser-check')
+        opt.add_argument('--window-size=1366,900')
+        prefs = self.blocker.prefs()
+        if prefs:
+            opt.add_experimental_option('prefs', prefs)
+        return opt
+
+    def start(self):
+        """
+        Start chrome.
+
+        Returns
+        -------
+        driver : selenium web driver object
+            the new driver
+        """
+        capabilities = DesiredCapabilities.CHROME.copy()
+        capabilities['pageLoadStrategy'] = self.page_load_strategy
+        if settings.COUNT_BLOCKED and self.blocker.rules:
+            capabilities['goog:loggingPrefs'] = {'performance': 'ALL'}
+        with metrics.phase('driver_launch'):
+            try:
+                self.driver = webdriver.Chrome(driver_path(), options=self.options(),
+                                               desired_capabilities=capabilities)
+            except SessionNotCreatedException as exc:
+                if settings.CHROMEDRIVER_PATH:
+                    raise
+                # the saved driver does not match the chrome version any more (chrome was updated)
+                print('chromedriver does not match chrome, installing it again', exc)
+                self.driver = webdriver.Chrome(driver_path(refresh=True), options=self.options(),
+                                               desired_capabilities=capabilities)
+        metrics.instrument_driver(self.driver)
+        if settings.DRIVER_TRACE:
+            tracer.attach(self.driver)
+        self.blocker.apply(self.driver)
+        return self.driver
+
+    def open_tab(self, url):
+        """
+        Open an url in a new tab, blocked like the first one, and switch to it.
+
+        Parameters
+        ----------
+        url : string
+            page to load in the new tab
+
+        Returns
+        -------
+        handle : string
+            window handle of the new tab
+        """
+        handles = set(self.driver.window_handles)
+        self.driver.execute_script('window.open("about:blank");')
+        WebDriverWait(self.driver, 10).until(lambda driver: len(driver.window_handles) > len(handles))
+        handle = next(handle for handle in self.driver.window_handles if handle not in handles)
+        self.driver.switch_to.window(handle)
+        # the url blocklist is per tab, it is sent before the page loads
+        self.blocker.apply(self.driver)
+        self.driver.get(url)
+        return handle
+
+    def get_driver(self):
+        """
+        The running driver, started if needed.
+        """
+        if self.driver is None:
+            self.start()
+        return self.driver
+
+    def restart(self):
+        """
+        Quit the current session and start a new one.
+
+        Returns
+        -------
+        driver : selenium web driver object
+            the new driver
+        """
+        metrics.count('driver_restarts')
+        self.quit()
+        return self.start()
+
+    def collect_blocked(self):
+        """
+        Update the counters of blocked resources from the performance log.
+        Call it regularly (e.g. once per page) so the log does not pile up in the driver.
+
+        Returns
+        -------
+        stats : dict
+            counters of the blocked resources (see ResourceBlocker.stats)
+        """
+        if self.driver is not None and settings.COUNT_BLOCKED and self.blocker.rules:
+            self.blocker.collect(self.driver)
+        return self.blocker.stats()
+
+    def quit(self):
+        if self.driver is not None:
+            print('blocked resources:', self.collect_blocked())
+            try:
+                self.driver.quit()
+            except WebDriverException as exc:
+                print('driver already closed', exc)
+            self.driver = None
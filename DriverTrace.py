@@ -0,0 +1,189 @@
+"""
+Trace of the WebDriver commands (DRIVER_TRACE).
+
+Every command sent to a traced driver is recorded with its duration, its
+locator strategy and selector (find commands), its url (navigations) and
+the exception it raised, e.g. a NoSuchElementException for a field missing
+from a review card. The commands of the elements go through the driver
+too, so the lookups inside the cards are traced as well.
+
+The commands and the phases timed by Metrics.py are written as one Chrome
+trace file per process and run:
+
+    <DRIVER_TRACE_DIR>/trace-<date>-<time>-<pid>.json
+
+which opens in chrome://tracing or https://ui.perfetto.dev as a flame
+chart, the commands nested in the phase (e.g. extract.getRatings) that
+sent them. The events are streamed to the file, so a killed run still
+leaves a readable trace of the events written so far. When the trace is closed, the DRIVER_TRACE_TOP
+selectors that took the most time are printed with their miss counts.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+import Settings as settings
+from Metrics import metrics
+
+
+class DriverTrace:
+    """
+    Recorder of the WebDriver commands and phases of a process.
+
+    Attributes
+    ----------
+    folder : string
+        folder of the trace files
+    path : string or None
+        trace file of the process, None until a driver is traced
+    selectors : dict
+        [calls, misses, seconds] per (command, strategy, selector) of the find commands
+    """
+
+    def __init__(self, folder=None):
+        """
+        Constructor for the trace, the file is created when the first driver is traced
+
+        Parameters
+        ----------
+        folder : string
+            folder of the trace files, defaults to Settings.DRIVER_TRACE_DIR
+        """
+        self.folder = folder or settings.DRIVER_TRACE_DIR
+        self.path = None
+        self.selectors = {}
+        self._file = None
+        self._separator = ''
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()  # the phases of the http threads are traced too
+
+    def _open(self):
+        os.makedirs(self.folder, exist_ok=True)
+        self.path = os.path.join(self.folder, f'trace-{datetime.datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.json')
+        self._file = open(self.path, 'w')
+        self._file.write('[')  # JSON array format of the trace event format, the closing bracket is optional
+        self._separator = '\n'
+        self._pid = os.getpid()
+        metrics.listeners.append(self.phase)
+        print('tracing the driver commands to', self.path)
+
+    def _write(self, name, category, start, seconds, args=None):
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': round((start - self._origin) * 1e6),
+                 'dur': round(seconds * 1e6), 'pid': self._pid, 'tid': threading.get_ident()}
+        if args:
+            event['args'] = args
+        with self._lock:
+            if self._file is not None:
+                self._file.write(self._separator + json.dumps(event))
+                self._separator = ',\n'
+
+    def attach(self, driver):
+        """
+        Trace the commands of a driver.
+
+        Parameters
+        ----------
+        driver : selenium web driver object
+            driver to trace, its execute method is wrapped
+        """
+        if self._file is None:
+            self._open()
+        execute = driver.execute
+
+        def traced(command, params=None):
+            start = time.perf_counter()
+            error = None
+            try:
+                return execute(command, params)
+            except WebDriverException as exc:
+                error = type(exc).__name__
+                raise
+            finally:
+                self.command(command, params, start, time.perf_counter() - start, error)
+
+        driver.execute = traced
+
+    def command(self, command, params, start, seconds, error=None):
+        """
+        Record a WebDriver command.
+
+        Parameters
+        ----------
+        command : string
+            name of the command (findElement, get, executeScript, ...)
+        params : dict
+            parameters of the command
+        start : float
+            perf_counter time the command was sent
+        seconds : float
+            duration of the command
+        error : string
+            name of the exception raised by the command, None if it succeeded
+        """
+        params = params or {}
+        args = {}
+        if 'using' in params:
+            args['strategy'] = params['using']
+            args['selector'] = params.get('value')
+            with self._lock:
+                stats = self.selectors.setdefault((command, params['using'], params.get('value')), [0, 0, 0.0])
+                stats[0] += 1
+                stats[1] += error == NoSuchElementException.__name__
+                stats[2] += seconds
+        elif 'url' in params:
+            args['url'] = params['url']
+        if error is not None:
+            args['error'] = error
+        self._write(command, 'webdriver', start, seconds, args)
+
+    def phase(self, name, seconds):
+        """
+        Record a phase timed by Metrics.py, which ended now.
+        """
+        self._write(name, 'phase', time.perf_counter() - seconds, seconds)
+
+    def hot_selectors(self, top=None):
+        """
+        Selectors that took the most time.
+
+        Parameters
+        ----------
+        top : int
+            number of selectors, defaults to Settings.DRIVER_TRACE_TOP
+
+        Returns
+        -------
+        selectors : list of dict
+            command, strategy, selector, calls, misses (NoSuchElementException) and seconds
+        """
+        with self._lock:
+            ranked = sorted(self.selectors.items(), key=lambda item: item[1][2], reverse=True)
+        return [{'command': command, 'strategy': strategy, 'selector': selector, 'calls': calls, 'misses': misses,
+                 'seconds': round(seconds, 3)}
+                for (command, strategy, selector), (calls, misses, seconds)
+                in ranked[:top or settings.DRIVER_TRACE_TOP]]
+
+    def close(self):
+        """
+        Finish the trace file and print the hot selectors.
+        """
+        if self._file is None:
+            return
+        metrics.listeners.remove(self.phase)
+        with self._lock:
+            self._file.write('\n]\n')
+            self._file.close()
+            self._file = None
+        print('slowest selectors:')
+        for selector in self.hot_selectors():
+            print(selector)
+        print('trace written to', self.path)
+
+
+tracer = DriverTrace()  # trace of the drivers of the process
@@ -0,0 +1,176 @@
+"""
+Fetch amazon pages over plain http, without a browser.
+
+A single requests session keeps a pool of keep-alive connections, the
+cookies amazon sets and gzip decoding. Pages that can not be used as
+static html (captcha, error pages, pages missing their content) are
+reported so the caller can fall back to the browser. Every request is
+paced by the shared RateController, which slows down on captchas and 503s.
+With PAGE_CACHE, usable pages are kept in the PageCache and read from it
+instead of being fetched again, except the pages listing the newest reviews
+(FRESH_KINDS) with INCREMENTAL, which are always fetched.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import PageCache as pagecache
+import RateController as rate
+import Settings as settings
+from Metrics import metrics
+
+PRODUCT = 'product'
+REVIEW_LIST = 'reviews'
+PROFILE = 'profile'
+REVIEW_DETAIL = 'review'
+
+# markers of a page that needs a browser (captcha or javascript only page)
+BLOCKED_MARKERS = ('/errors/validateCaptcha', 'Enter the characters you see below', 'api-services-support@amazon')
+
+# markers that must be present in a usable page, per kind of page
+CONTENT_MARKERS = {
+    PRODUCT: 'id="productTitle"',
+    REVIEW_LIST: 'id="cm_cr-review_list"',
+    PROFILE: 'id="customer-profile-name-header"',
+    REVIEW_DETAIL: 'data-hook="review-body"',
+}
+
+# pages listing the newest reviews, not read from the cache with INCREMENTAL
+FRESH_KINDS = (REVIEW_LIST, PROFILE)
+
+HEADERS = {
+    'User-Agent': settings.USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-CA,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+
+def is_blocked(html):
+    """
+    Check whether a page is a captcha.
+
+    Parameters
+    ----------
+    html : string
+        body of the page
+
+    Returns
+    -------
+    bool
+        True if amazon answered with a captcha
+    """
+    return any(marker in html for marker in BLOCKED_MARKERS)
+
+
+def requires_browser(html, kind):
+    """
+    Check whether a page has to be loaded in the browser.
+
+    Parameters
+    ----------
+    html : string
+        body of the page
+    kind : string
+        PRODUCT, REVIEW_LIST, PROFILE or REVIEW_DETAIL
+
+    Returns
+    -------
+    bool
+        True if the page is a captcha or does not contain its content
+    """
+    if is_blocked(html):
+        return True
+    marker = CONTENT_MARKERS.get(kind)
+    return marker is not None and marker not in html
+
+
+class HttpFetcher:
+    """
+    Pooled keep-alive http session for amazon pages.
+
+    Attributes
+    ----------
+    session : requests session
+        session shared by all the requests, keeps the cookies and connections
+    timeout : float
+        seconds to wait for a response
+    """
+
+    def __init__(self, pool_size=None, timeout=None):
+        """
+        Constructor for the http session
+
+        Parameters
+        ----------
+        pool_size : int
+            number of keep-alive connections kept per host
+        timeout : float
+            seconds to wait for a response
+        """
+        pool_size = pool_size or settings.HTTP_POOL_SIZE
+        self.timeout = timeout or settings.HTTP_TIMEOUT
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_page(self, url, kind):
+        """
+        Fetch a page.
+
+        Parameters
+        ----------
+        url : string
+            url of the page
+        kind : string
+            PRODUCT, REVIEW_LIST, PROFILE or REVIEW_DETAIL
+
+        Returns
+        -------
+        html : string or None
+            body of the page, None if the request failed or the page needs a browser
+        """
+        if settings.PAGE_CACHE and not (settings.INCREMENTAL and kind in FRESH_KINDS):
+            html = pagecache.cache.get(url)
+            if html is not None:
+                return html
+        rate.controller.wait(url)
+        try:
+            with metrics.phase('http_fetch'):
+                response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as exc:
+            print('request failed', url, exc)
+            metrics.count('http_responses', 'error')
+            return None
+        metrics.count('http_responses', response.status_code)
+        if response.status_code in (429, 503):
+            rate.controller.blocked(url)
+        if response.status_code != 200:
+            print('status', response.status_code, url)
+            return None
+        rate.controller.record(url, is_blocked(response.text))
+        if requires_browser(response.text, kind):
+            print('page needs a browser', url)
+            return None
+        if settings.PAGE_CACHE:
+            pagecache.cache.put(url, response.text)
+        return response.text
+
+    def use_cookies(self, cookies):
+        """
+        Send the cookies of a browser session with the requests.
+
+        Parameters
+        ----------
+        cookies : list of dict
+            cookies as returned by the get_cookies() of a selenium web driver
+        """
+        for cookie in cookies:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'),
+                                     path=cookie.get('path', '/'))
+
+    def close(self):
+        self.session.close()
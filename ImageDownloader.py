@@ -0,0 +1,224 @@
+"""
+Background download of the profile and cover pictures of the authors.
+
+The scrapers only hand (author id, kind, url) jobs to the downloader, the
+pictures are fetched by a pool of threads over one keep-alive session, so
+the browser session never waits on an image. The job queue is bounded
+(IMAGE_QUEUE): when the downloads fall that far behind, the scraper waits
+for a free slot instead of piling up jobs. A failed download is retried
+IMAGE_RETRIES times with an exponential backoff, pictures already on disk
+are not downloaded again and empty urls (picture not found on the page)
+are skipped. With IMAGE_STORE the pictures go to the content-addressed
+ImageStore instead of one file per author.
+"""
+
+import os
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import ImageStore as imagestore
+import Settings as settings
+from Metrics import metrics
+from HttpFetcher import HEADERS
+
+PROFILE = 'profile'
+COVER = 'cover'
+
+_downloader = None  # downloader shared by the scrapers of a process
+
+
+def image_path(kind, id):
+    """
+    File of a picture of an author.
+
+    Parameters
+    ----------
+    kind : string
+        PROFILE or COVER
+    id : string
+        unique id of the reviewer
+
+    Returns
+    -------
+    path : string
+        path of the jpg file
+    """
+    return f'images\\{kind}\\{id}.jpg'
+
+
+def get_downloader():
+    """
+    Downloader shared by the scrapers of the process, started on first use.
+
+    Returns
+    -------
+    downloader : ImageDownloader object
+    """
+    global _downloader
+    if _downloader is None:
+        _downloader = ImageDownloader()
+    return _downloader
+
+
+def close_downloader():
+    """
+    Wait for the pending downloads of the process and stop its downloader.
+    """
+    global _downloader
+    if _downloader is not None:
+        _downloader.close()
+        print('images', _downloader.stats())
+        if _downloader.store is not None:
+            print('image store', _downloader.store.stats())
+        _downloader = None
+
+
+class ImageDownloader:
+    """
+    Thread pool downloading pictures over a pooled http session.
+
+    Attributes
+    ----------
+    session : requests session
+        keep-alive connections shared by the threads
+    jobs : queue.Queue
+        bounded queue of the (id, kind, url) jobs, None stops a thread
+    retries : int
+        attempts after the first one
+    backoff : float
+        seconds before the first retry, doubled for each retry
+    store : ImageStore object or None
+        store of the pictures, None to write one file per author (see image_path)
+    downloaded, present, empty, retried, failed : int
+        counters of the process, present counts the pictures already on disk or in the store
+    """
+
+    def __init__(self, workers=None, queue_size=None, retries=None, backoff=None, timeout=None):
+        """
+        Constructor for the downloader, the threads are started on the first job
+
+        Parameters
+        ----------
+        workers : int
+            number of download threads, defaults to Settings.IMAGE_WORKERS
+        queue_size : int
+            maximum number of pending jobs, defaults to Settings.IMAGE_QUEUE
+        retries : int
+            retries of a failed download, defaults to Settings.IMAGE_RETRIES
+        backoff : float
+            seconds before the first retry, defaults to Settings.IMAGE_BACKOFF
+        timeout : float
+            seconds to wait for a response, defaults to Settings.HTTP_TIMEOUT
+        """
+        self.workers = workers or settings.IMAGE_WORKERS
+        self.retries = settings.IMAGE_RETRIES if retries is None else retries
+        self.backoff = settings.IMAGE_BACKOFF if backoff is None else backoff
+        self.timeout = timeout or settings.HTTP_TIMEOUT
+        self.store = imagestore.get_store() if settings.IMAGE_STORE else None
+        self.jobs = queue.Queue(maxsize=queue_size or settings.IMAGE_QUEUE)
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.session.headers['Accept'] = 'image/avif,image/webp,image/*,*/*;q=0.8'
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.downloaded = 0
+        self.present = 0
+        self.empty = 0
+        self.retried = 0
+        self.failed = 0
+        self._threads = []
+        self._lock = threading.Lock()  # counters updated by the threads
+
+    def submit(self, id, kind, url):
+        """
+        Queue the download of a picture, waiting for a free slot if the queue is full.
+
+        Parameters
+        ----------
+        id : string
+            unique id of the reviewer
+        kind : string
+            PROFILE or COVER
+        url : string
+            url of the picture, empty if it was not found on the page
+        """
+        if not url:
+            self.empty += 1
+            return
+        if self.store is not None:
+            if self.store.has(id, kind) or self.store.add_known(id, kind, url):
+                self.present += 1
+                return
+        elif os.path.exists(image_path(kind, id)):
+            self.present += 1
+            return
+        if not self._threads:
+            self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+        self.jobs.put((id, kind, url))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    break
+                self._download(*job)
+            except Exception as exc:  # e.g. a write error, the thread must live on or submit blocks on a full queue
+                print(f'image {job[2]} failed', exc)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                self.jobs.task_done()
+
+    def _download(self, id, kind, url):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._lock:
+                    self.retried += 1
+                metrics.count('retries', 'image')
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                with metrics.phase('image_download'):
+                    response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.RequestException as exc:
+                print(f'image {url} failed', exc)
+                status = getattr(exc.response, 'status_code', None)
+                if status is not None and status < 500 and status != 429:
+                    break  # the picture does not exist
+                continue
+            if self.store is not None:
+                self.store.put(id, kind, url, response.content)
+            else:
+                path = image_path(kind, id)
+                temporary = f'{path}.{threading.get_ident()}.tmp'
+                with open(temporary, 'wb') as file:
+                    file.write(response.content)
+                os.replace(temporary, path)
+            with self._lock:
+                self.downloaded += 1
+            return
+        with self._lock:
+            self.failed += 1
+
+    def close(self):
+        """
+        Wait for the queued downloads and stop the threads.
+        """
+        for _ in self._threads:
+            self.jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.session.close()
+
+    def stats(self):
+        return {'downloaded': self.downloaded, 'present': self.present, 'empty': self.empty,
+                'retried': self.retried, 'failed': self.failed}
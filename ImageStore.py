@@ -0,0 +1,259 @@
+"""
+Content-addressed store of the author pictures (IMAGE_STORE).
+
+Many authors keep the default avatar and cover of amazon, and writing
+images/profile/<id>.jpg and images/cover/<id>.jpg for each of them stores
+the same bytes over and over. The store keeps each distinct picture once,
+under the sha256 of its bytes, and an index maps the urls and the pictures
+of the authors to these blobs:
+
+    <IMAGE_STORE_DIR>/blobs/<first 2 hex digits>/<sha256>.jpg (or .png, .gif)
+    <IMAGE_STORE_DIR>/index.sqlite
+
+A url already in the index is not downloaded again, and the known default
+pictures (PLACEHOLDERS) are recognized by their url and never downloaded:
+they are indexed as PLACEHOLDER, without a blob. Use ImageStore.path to
+find the file of the picture of an author.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import Settings as settings
+
+PLACEHOLDER = 'placeholder'  # hash of the default pictures, no blob is stored for them
+
+# urls of the default avatar and cover of amazon profiles, by kind of picture
+PLACEHOLDERS = {
+    'profile': re.compile(r'/amazon-avatars-global/default[._]|/default[-_]?avatar|/grey-pixel\.', re.I),
+    'cover': re.compile(r'/default[-_]?cover|/cover[-_]default|/profile/cover/default[._]', re.I),
+}
+
+# extension of a blob by the first bytes of the picture
+SIGNATURES = ((b'\x89PNG', '.png'), (b'GIF8', '.gif'), (b'RIFF', '.webp'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS author_images (
+    author_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    url TEXT,
+    PRIMARY KEY (author_id, kind)
+);
+CREATE INDEX IF NOT EXISTS author_images_sha256 ON author_images (sha256);
+"""
+
+_store = None  # store shared by the downloads of a process
+
+
+def get_store():
+    """
+    Image store of the process, opened on first use.
+
+    Returns
+    -------
+    store : ImageStore object
+        store of Settings.IMAGE_STORE_DIR
+    """
+    global _store
+    if _store is None or _store.pid != os.getpid():  # a sqlite connection must not be used across a fork
+        _store = ImageStore()
+    return _store
+
+
+def is_placeholder(kind, url):
+    """
+    Check whether a picture url is a default picture of amazon.
+
+    Parameters
+    ----------
+    kind : string
+        'profile' or 'cover'
+    url : string
+        url of the picture
+
+    Returns
+    -------
+    bool
+        True if the url is a known default picture
+    """
+    pattern = PLACEHOLDERS.get(kind)
+    return pattern is not None and pattern.search(url) is not None
+
+
+class ImageStore:
+    """
+    Pictures stored once by content hash, with the index of their urls and authors.
+
+    Attributes
+    ----------
+    folder : string
+        folder of the blobs and the index
+    connection : sqlite3 connection
+        index, shared by the download threads under a lock
+    pid : int
+        process that opened the index
+    placeholders, known_urls, duplicates, writes : int
+        counters of the process: default pictures not downloaded, urls found in the index,
+        downloaded pictures already stored and blobs written
+    """
+
+    def __init__(self, folder=None):
+        """
+        Constructor for the store, creates the index if needed
+
+        Parameters
+        ----------
+        folder : string
+            folder of the store, defaults to Settings.IMAGE_STORE_DIR
+        """
+        self.folder = folder or settings.IMAGE_STORE_DIR
+        os.makedirs(self.folder, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.folder, 'index.sqlite'), check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.pid = os.getpid()
+        self.placeholders = 0
+        self.known_urls = 0
+        self.duplicates = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def _query(self, sql, parameters):
+        with self._lock:
+            return self.connection.execute(sql, parameters).fetchone()
+
+    def has(self, id, kind):
+        """
+        Check whether the picture of an author is indexed.
+        """
+        return self._query('SELECT 1 FROM author_images WHERE author_id = ? AND kind = ?', (id, kind)) is not None
+
+    def link(self, id, kind, url, sha256):
+        """
+        Index the picture of an author.
+
+        Parameters
+        ----------
+        id : string
+            unique id of the reviewer
+        kind : string
+            'profile' or 'cover'
+        url : string
+            url of the picture
+        sha256 : string
+            hash of the picture, PLACEHOLDER for a default picture
+        """
+        with self._lock, self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO urls (url, sha256) VALUES (?, ?)', (url, sha256))
+            self.connection.execute('INSERT OR REPLACE INTO author_images (author_id, kind, sha256, url) '
+                                    'VALUES (?, ?, ?, ?)', (id, kind, sha256, url))
+
+    def add_known(self, id, kind, url):
+        """
+        Index the picture of an author without downloading it, if it is a default picture or its url is indexed.
+
+        Parameters
+        ----------
+        id : string
+            unique id of the reviewer
+        kind : string
+            'profile' or 'cover'
+        url : string
+            url of the picture
+
+        Returns
+        -------
+        bool
+            True if the picture is indexed, False if it has to be downloaded
+        """
+        if is_placeholder(kind, url):
+            self.placeholders += 1
+            self.link(id, kind, url, PLACEHOLDER)
+            return True
+        row = self._query('SELECT sha256 FROM urls WHERE url = ?', (url,))
+        if row is None:
+            return False
+        self.known_urls += 1
+        self.link(id, kind, url, row[0])
+        return True
+
+    def put(self, id, kind, url, content):
+        """
+        Store a downloaded picture, unless the same bytes are already stored, and index it.
+
+        Parameters
+        ----------
+        id : string
+            unique id of the reviewer
+        kind : string
+            'profile' or 'cover'
+        url : string
+            url of the picture
+        content : bytes
+            picture
+
+        Returns
+        -------
+        sha256 : string
+            hash of the picture
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        if self._query('SELECT 1 FROM blobs WHERE sha256 = ?', (sha256,)) is not None:
+            self.duplicates += 1
+        else:
+            extension = next((extension for signature, extension in SIGNATURES if content.startswith(signature)),
+                             '.jpg')
+            path = os.path.join('blobs', sha256[:2], sha256 + extension)
+            full_path = os.path.join(self.folder, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            temporary = f'{full_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporary, 'wb') as file:
+                file.write(content)
+            os.replace(temporary, full_path)  # the same blob written by two threads has the same bytes
+            with self._lock, self.connection:
+                self.connection.execute('INSERT OR IGNORE INTO blobs (sha256, path, size) VALUES (?, ?, ?)',
+                                        (sha256, path, len(content)))
+            self.writes += 1
+        self.link(id, kind, url, sha256)
+        return sha256
+
+    def path(self, id, kind):
+        """
+        File of the picture of an author.
+
+        Parameters
+        ----------
+        id : string
+            unique id of the reviewer
+        kind : string
+            'profile' or 'cover'
+
+        Returns
+        -------
+        path : string or None
+            path of the blob, None if the picture is not stored or is a default picture
+        """
+        row = self._query('SELECT b.path FROM author_images a JOIN blobs b ON b.sha256 = a.sha256 '
+                          'WHERE a.author_id = ? AND a.kind = ?', (id, kind))
+        return os.path.join(self.folder, row[0]) if row is not None else None
+
+    def stats(self):
+        return {'placeholders': self.placeholders, 'known_urls': self.known_urls, 'duplicates': self.duplicates,
+                'writes': self.writes}
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,97 @@
+"""
+Append-only journal of the records extracted for one unit of work.
+
+main.py journals each review of an author and ProductMain.py each review
+and review page of the sub-products of an author, as soon as they are
+extracted. When a run stops before the author or the file is saved, the
+next run reads the journal back and only scrapes what is missing. The
+journal is deleted once the csv file is written.
+
+One journal is one JSON Lines file; a line cut short by a crash is ignored
+when the journal is read.
+"""
+
+import json
+import os
+
+import Settings as settings
+
+AUTHORS = 'authors'  # reviews of an author profile, key: <author id>_<product id>
+PRODUCTS = 'products'  # reviews of the sub-products of an author, key: name of the author profile file
+
+
+class Journal:
+    """
+    JSON Lines journal of one author or author profile file.
+
+    Attributes
+    ----------
+    path : string
+        path of the journal file
+    """
+
+    def __init__(self, kind, key, folder=None):
+        """
+        Constructor for the journal
+
+        Parameters
+        ----------
+        kind : string
+            AUTHORS or PRODUCTS
+        key : string
+            name of the unit of work
+        folder : string
+            folder of the journals, defaults to Settings.JOURNAL_DIR
+        """
+        self.path = os.path.join(folder or settings.JOURNAL_DIR, kind, f'{key}.jsonl')
+        self._file = None
+
+    def entries(self):
+        """
+        Entries written by previous runs.
+
+        Returns
+        -------
+        entries : list of dict
+            entries in the order they were written
+        """
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:  # last line of a run that crashed while writing
+                    break
+        return entries
+
+    def append(self, entry):
+        """
+        Write an entry and flush it to disk.
+
+        Parameters
+        ----------
+        entry : dict
+            values that can be serialised to JSON (datetimes are written as strings)
+        """
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(entry, default=str) + '\n')
+        self._file.flush()
+        if settings.JOURNAL_FSYNC:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """
+        Delete the journal, once its records are saved.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
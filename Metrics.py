@@ -0,0 +1,262 @@
+"""
+Timings and counters of a scrape (METRICS).
+
+The phases of the scrapers are timed with a monotonic clock: driver
+launch, navigation, page ready waits, scroll loading of the profiles, tab
+open and close, each field extraction (AuthorConfiguration and PageParser
+methods), http fetches, the sleeps of the RateController and the saves.
+The WebDriver commands are counted by name, with the refreshes, retries,
+driver restarts and blocked pages.
+
+With METRICS_PORT the metrics of the process are served in the Prometheus
+text format at http://127.0.0.1:<port>/metrics, and a JSON summary is
+written to METRICS_SUMMARY when the scraper exits (one file per process,
+the workers of a WorkerPool add their index to the name).
+"""
+
+import contextlib
+import functools
+import inspect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Settings as settings
+
+PREFIX = 'scraper'  # prefix of the prometheus metric names
+
+# WebDriver commands timed as navigation, the other ones are only counted
+NAVIGATION_COMMANDS = ('get', 'refresh', 'goBack', 'goForward')
+
+
+class Metrics:
+    """
+    Phase timers and counters of a process.
+
+    Attributes
+    ----------
+    started : float
+        monotonic time the metrics were created
+    listeners : list
+        functions called with the name and duration of each phase (see DriverTrace.py)
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._phases = {}  # phase: [count, total seconds, max seconds]
+        self._counters = {}  # (name, label): count
+        self._lock = threading.Lock()  # the http fetches and downloads run in threads
+        self._server = None
+        self.listeners = []
+
+    def observe(self, phase, seconds):
+        """
+        Record a duration of a phase.
+
+        Parameters
+        ----------
+        phase : string
+            name of the phase
+        seconds : float
+            duration
+        """
+        for listener in self.listeners:
+            listener(phase, seconds)
+        if not settings.METRICS:
+            return
+        with self._lock:
+            timer = self._phases.get(phase)
+            if timer is None:
+                timer = self._phases[phase] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Time the block of a with statement as a phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """
+        Decorator timing each call of a function as a phase.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def instrument(self, cls, prefix):
+        """
+        Time each call of the public methods of a class, as phases named <prefix>.<method>.
+
+        Parameters
+        ----------
+        cls : class
+            class whose methods are wrapped
+        prefix : string
+            prefix of the phases
+        """
+        for name, function in list(vars(cls).items()):
+            if inspect.isfunction(function) and not name.startswith('_'):
+                setattr(cls, name, self.timed(f'{prefix}.{name}')(function))
+
+    def instrument_driver(self, driver):
+        """
+        Count the WebDriver commands of a driver and time its navigations.
+
+        Parameters
+        ----------
+        driver : selenium web driver object
+            driver whose commands are counted
+        """
+        execute = driver.execute
+
+        def counted(command, params=None):
+            self.count('webdriver_commands', command)
+            if command == 'refresh':
+                self.count('refreshes')
+            if command not in NAVIGATION_COMMANDS:
+                return execute(command, params)
+            with self.phase('navigation'):
+                return execute(command, params)
+
+        driver.execute = counted
+
+    def count(self, name, label=None, n=1):
+        """
+        Increment a counter.
+
+        Parameters
+        ----------
+        name : string
+            name of the counter
+        label : string
+            value of its label (command, kind of retry, ...), None for a counter without label
+        n : int
+            increment
+        """
+        if not settings.METRICS:
+            return
+        with self._lock:
+            self._counters[name, label] = self._counters.get((name, label), 0) + n
+
+    def summary(self):
+        """
+        Timings and counters of the process.
+
+        Returns
+        -------
+        summary : dict
+            uptime, phases (count, total and max seconds of each) and counters
+        """
+        with self._lock:
+            phases = {name: {'count': count, 'seconds': round(total, 3), 'max': round(longest, 3)}
+                      for name, (count, total, longest) in sorted(self._phases.items())}
+            counters = {name if label is None else f'{name}[{label}]': value
+                        for (name, label), value in sorted(self._counters.items(), key=lambda item: str(item[0]))}
+        return {'uptime': round(time.monotonic() - self.started, 3), 'phases': phases, 'counters': counters}
+
+    def prometheus(self):
+        """
+        Timings and counters in the Prometheus text format.
+
+        Returns
+        -------
+        text : string
+            one sample per line
+        """
+        lines = [f'# TYPE {PREFIX}_uptime_seconds gauge',
+                 f'{PREFIX}_uptime_seconds {time.monotonic() - self.started:.3f}',
+                 f'# TYPE {PREFIX}_phase_seconds summary']
+        with self._lock:
+            phases = sorted(self._phases.items())
+            counters = sorted(self._counters.items(), key=lambda item: str(item[0]))
+        for name, (count, total, _) in phases:
+            lines.append(f'{PREFIX}_phase_seconds_sum{{phase="{name}"}} {total:.6f}')
+            lines.append(f'{PREFIX}_phase_seconds_count{{phase="{name}"}} {count}')
+        lines.append(f'# TYPE {PREFIX}_phase_seconds_max gauge')
+        for name, (_, _, longest) in phases:
+            lines.append(f'{PREFIX}_phase_seconds_max{{phase="{name}"}} {longest:.6f}')
+        typed = set()
+        for (name, label), value in counters:
+            if name not in typed:
+                lines.append(f'# TYPE {PREFIX}_{name}_total counter')
+                typed.add(name)
+            labels = '' if label is None else f'{{label="{label}"}}'
+            lines.append(f'{PREFIX}_{name}_total{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port):
+        """
+        Serve the metrics at http://127.0.0.1:<port>/metrics from a background thread.
+
+        Parameters
+        ----------
+        port : int
+            port of the endpoint
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200 if self.path.startswith('/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f'metrics at http://127.0.0.1:{port}/metrics')
+
+    def write_summary(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def start(self):
+        """
+        Serve the metrics of the process if Settings.METRICS_PORT is set.
+        """
+        if settings.METRICS and settings.METRICS_PORT:
+            self.serve(settings.METRICS_PORT)
+
+    def finish(self, name=None):
+        """
+        Write the summary of the process to Settings.METRICS_SUMMARY and stop the endpoint.
+
+        Parameters
+        ----------
+        name : string
+            added to the file name, for the workers of a WorkerPool
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if not settings.METRICS:
+            return
+        path = settings.METRICS_SUMMARY
+        if name:
+            stem, dot, extension = path.rpartition('.')
+            path = f'{stem}.{name}.{extension}' if dot else f'{path}.{name}'
+        self.write_summary(path)
+        print('metrics summary written to', path)
+
+
+metrics = Metrics()  # metrics of the process
+
@@ -0,0 +1,228 @@
+"""
+On-disk cache of the amazon pages (PAGE_CACHE).
+
+A sub-product is visited for every author who reviewed it, and a new run
+fetches everything again. Pages are cached under the sha1 of their
+canonical url (see AmazonUrls.normalize_url), so the links to a page from
+different authors, hosts or tracking parameters share one entry. Each
+entry is one gzip file of the html:
+
+    cache/<first 2 hex digits>/<sha1>.html.gz
+
+An entry expires PAGE_CACHE_TTL seconds after it is written (file
+modification time). Reading an entry updates its access time, and when
+the cache grows over PAGE_CACHE_MAX_MB the least recently used entries are
+deleted. The index of the entries is read from the folder on first use, so
+the processes of a WorkerPool share the entries but each one enforces the
+size cap with its own view of them.
+
+Only usable pages are cached: the fetcher checks their content before
+storing them, and captcha pages are never stored.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+import Settings as settings
+from AmazonUrls import normalize_url
+
+SHRINK = 0.9  # fraction of the size cap kept after an eviction
+
+
+def cache_key(url):
+    """
+    Key of the cache entry of a url.
+
+    Parameters
+    ----------
+    url : string
+        url of the page
+
+    Returns
+    -------
+    key : string
+        sha1 of the canonical url, in hex
+    """
+    return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    Cache of compressed pages with time to live and least recently used eviction.
+
+    Attributes
+    ----------
+    folder : string
+        folder of the entries
+    ttl : float
+        seconds an entry can be used after it is written, 0 for no limit
+    max_bytes : int
+        size cap of the entries on disk
+    hits, misses, expired, writes, evictions : int
+        counters of the process
+    saved_bytes : int
+        uncompressed size of the pages read from the cache instead of fetched
+    """
+
+    def __init__(self, folder=None, ttl=None, max_mb=None):
+        """
+        Constructor for the cache
+
+        Parameters
+        ----------
+        folder : string
+            folder of the entries, defaults to Settings.PAGE_CACHE_DIR
+        ttl : float
+            time to live of an entry in seconds, defaults to Settings.PAGE_CACHE_TTL
+        max_mb : float
+            size cap in MB, defaults to Settings.PAGE_CACHE_MAX_MB
+        """
+        self.folder = folder or settings.PAGE_CACHE_DIR
+        self.ttl = settings.PAGE_CACHE_TTL if ttl is None else ttl
+        self.max_bytes = int((max_mb or settings.PAGE_CACHE_MAX_MB) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.writes = 0
+        self.evictions = 0
+        self.saved_bytes = 0
+        self._entries = None  # key: [size on disk, last access time], read from the folder on first use
+        self._size = 0
+        self._lock = threading.Lock()  # the http fetches run in threads
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], f'{key}.html.gz')
+
+    def _load(self):
+        entries = {}
+        if os.path.isdir(self.folder):
+            self._scan(entries)
+        with self._lock:
+            if self._entries is None:
+                self._entries = entries
+                self._size = sum(size for size, _ in entries.values())
+
+    def _scan(self, entries):
+        for prefix in os.scandir(self.folder):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.endswith('.html.gz'):
+                    stat = entry.stat()
+                    entries[entry.name[:-len('.html.gz')]] = [stat.st_size, stat.st_atime]
+
+    def _remove(self, key):
+        with self._lock:
+            size, _ = self._entries.pop(key, (0, 0))
+            self._size -= size
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def get(self, url):
+        """
+        Read the page of a url from the cache.
+
+        Parameters
+        ----------
+        url : string
+            url of the page
+
+        Returns
+        -------
+        html : string or None
+            cached page, None if it is not cached or expired
+        """
+        if self._entries is None:
+            self._load()
+        key = cache_key(url)
+        path = self.path(key)
+        try:
+            written = os.stat(path).st_mtime
+            if self.ttl and time.time() - written > self.ttl:
+                self.expired += 1
+                self.misses += 1
+                self._remove(key)
+                return None
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                html = file.read()
+        except (OSError, EOFError):  # not cached, or removed or cut short by another process
+            self.misses += 1
+            return None
+        now = time.time()
+        os.utime(path, (now, written))  # access time for the eviction, the modification time is kept for the ttl
+        if key in self._entries:
+            self._entries[key][1] = now
+        self.hits += 1
+        self.saved_bytes += len(html)
+        return html
+
+    def put(self, url, html):
+        """
+        Store the page of a url, evicting the least recently used pages if the cache is full.
+
+        Parameters
+        ----------
+        url : string
+            url of the page
+        html : string
+            body of the page
+        """
+        if self._entries is None:
+            self._load()
+        key = cache_key(url)
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with gzip.open(temporary, 'wt', encoding='utf-8', compresslevel=6) as file:
+            file.write(html)
+        os.replace(temporary, path)  # readers never see a partial entry
+        size = os.path.getsize(path)
+        with self._lock:
+            self._size += size - self._entries.get(key, (0, 0))[0]
+            self._entries[key] = [size, time.time()]
+            self.writes += 1
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache is below SHRINK times its size cap.
+        """
+        with self._lock:
+            oldest = sorted(self._entries.items(), key=lambda item: item[1][1])
+        for key, _ in oldest:
+            if self._size <= self.max_bytes * SHRINK:
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Counters of the cache.
+
+        Returns
+        -------
+        stats : dict
+            hits, misses, hit ratio, expired entries, writes, evictions, entries, size on disk and
+            uncompressed bytes not fetched thanks to the cache
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            'expired': self.expired,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': len(self._entries or ()),
+            'size_mb': round(self._size / 1024 / 1024, 2),
+            'saved_mb': round(self.saved_bytes / 1024 / 1024, 2),
+        }
+
+
+cache = PageCache()  # cache shared by the scrapers of a process
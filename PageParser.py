@@ -0,0 +1,430 @@
+"""
+Driver-free version of AuthorProfileConfig.AuthorConfiguration.
+
+PageParser reads the same fields from a static html page (driver.page_source
+or the body of an http response) with precompiled lxml XPath expressions,
+so pages can be parsed without a browser, e.g. in worker processes.
+Every getter takes the page (html string or the result of PageParser.parse)
+in place of the web driver.
+"""
+
+from lxml import etree, html
+
+from AuthorProfileConfig import split_review_date, review_detail_fields, review_card_fields
+from Metrics import metrics
+
+
+def _cls(name):
+    """
+    XPath predicate for a css class selector.
+    """
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+def _text(node):
+    """
+    Visible text of an element, like WebElement.text.
+    """
+    lines = (' '.join(line.split()) for line in node.text_content().splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def _first(nodes):
+    return nodes[0] if nodes else None
+
+
+# profile and review detail pages
+AUTHOR_NAME = etree.XPath(f'//*[@id="customer-profile-name-header"]'
+                          f'/div[{_cls("a-row")} and {_cls("a-spacing-none")} and {_cls("name-container")}]/span')
+POSTED_DATE = etree.XPath('//span[@data-hook="review-date"]')
+TITLE = etree.XPath('//a[@data-hook="review-title"]')
+RATINGS = etree.XPath(f'(//*[{_cls("a-link-normal")}])[1]/@title')
+REVIEW = etree.XPath('//span[@data-hook="review-body"]')
+HELPFUL = etree.XPath(f'//span[{_cls("cr-vote")}]/div[{_cls("a-row")} and {_cls("a-spacing-small")}]/span')
+VERIFIED = etree.XPath('//span[@data-hook="avp-badge"]')
+PRODUCT_URL = etree.XPath('//a[@data-hook="product-link"]/@href')
+PROFILE_IMAGE = etree.XPath('//*[@id="avatar-image"]/@src')
+COVER_IMAGE = etree.XPath('//*[@id="cover-image-with-cropping"]/@src')
+CATEGORY = etree.XPath('//*[@id="wayfinding-breadcrumbs_feature_div"]/ul')
+REVIEW_LINKS = etree.XPath(f'//div[@id="profile-at-card-container"]//div[@class="a-row"]'
+                           f'//div[{_cls("a-section")} and {_cls("profile-at-content")}]/p/a/@href')
+
+# product and review list pages (level 3). $id is the id of the review.
+PAGE_CONTENT = etree.XPath('//div[@id="cm_cr-review_list"]')
+REVIEW_CARDS = etree.XPath('//div[@data-hook="review"]')
+CARD = etree.XPath('//*[@id=concat("customer_review-", $id)]')
+CARD_REVIEWER = etree.XPath(f'.//div[{_cls("a-profile-content")}]/span')
+CARD_RATINGS = etree.XPath('./div[2]/a[1]/@title')
+CARD_DATE = etree.XPath('.//span[@data-hook="review-date"]')
+CARD_VERIFIED = etree.XPath('./div[3]/span/a/span')
+CARD_REVIEW = etree.XPath('./div[4]/span')
+CARD_HELPFUL = etree.XPath(f'.//span[{_cls("cr-vote")}]/div[{_cls("a-row")} and {_cls("a-spacing-small")}]/span')
+CARD_TITLE = etree.XPath('./div[2]/a[2]/span')
+CARD_PROFILE = etree.XPath('.//div[@data-hook="genome-widget"]/a/@href')
+PRODUCT_NAME = etree.XPath('//*[@id="productTitle"]')
+SUMMARY_TABLE = etree.XPath('//*[@id="productDetails_techSpec_section_1"]//tbody/tr')
+BRAND = etree.XPath('//*[@id="detailBullets_feature_div"]//ul/li')
+EXTRA_INFO = etree.XPath('//*[@id="productDetails_detailBullets_sections1"]//tbody/tr')
+RANK = etree.XPath('//*[@id="SalesRank"]')
+ROW_HEADER = etree.XPath('./th')
+ROW_VALUE = etree.XPath('./td')
+BULLET_LABEL = etree.XPath('./span/span[1]')
+BULLET_VALUE = etree.XPath('./span/span[2]')
+ALL_REVIEWS_URL = etree.XPath('//a[contains(., "See all reviews")]/@href')
+TOTAL_REVIEWS = etree.XPath('//*[@id="filter-info-section"]/span')
+NEXT_PAGE_URL = etree.XPath('//*[@id="cm_cr-pagination_bar"]/ul/li[2]/a/@href')
+
+PROFILE_BATCH = 10  # cards rendered with an author profile page, the next ones are loaded by scrolling
+
+
+class PageParser:
+    """
+    parse():
+        Parse an html page once, to be passed to the getters.
+    get_review_links():
+        Get the urls of the review detail pages on an author profile.
+    has_more_reviews():
+        Check whether an author profile may load more review cards by scrolling.
+    get_review_details():
+        Get all the fields of a review detail page.
+    get_review_cards():
+        Get all the fields of all the reviews of a review list page.
+    get_product_details():
+        Get brand, rank and category of a product page.
+    get_all_reviews_url():
+        Get the url behind the 'See all reviews' link of a product page.
+    get_total_reviews():
+        Get the number of reviews of a review list page.
+    get_next_page_url():
+        Get the url behind the next page button of a review list page.
+
+    All other getters have the same name and return the same values as in
+    AuthorConfiguration, except the table getters (get_summary_table,
+    get_brand, get_extra_info) which return (label, value) text pairs and
+    get_category which returns the text of the breadcrumbs.
+    """
+
+    @staticmethod
+    def parse(page, url=None):
+        """
+        Parse an html page.
+
+        Parameters
+        ----------
+        page : string, bytes or lxml element
+            html of the page
+        url : string
+            url of the page, relative links are made absolute against it
+        Returns
+        -------
+        root: lxml element
+            root of the page
+        """
+        if not isinstance(page, (str, bytes)):
+            return page
+        root = html.fromstring(page)
+        for br in root.iter('br'):
+            br.tail = '\n' + (br.tail or '')
+        if url:
+            root.make_links_absolute(url, resolve_base_href=False)
+        return root
+
+    def get_author_name(self, page):
+        node = _first(AUTHOR_NAME(self.parse(page)))
+        return _text(node) if node is not None else ""
+
+    def get_posted_date(self, page):
+        node = _first(POSTED_DATE(self.parse(page)))
+        if node is None:
+            print("No date found...")
+            return ""
+        return ' '.join(_text(node).split()[-3:])
+
+    def get_title(self, page):
+        node = _first(TITLE(self.parse(page)))
+        if node is None:
+            print("No title found...")
+            return ""
+        return _text(node)
+
+    def get_ratings(self, page):
+        rating = _first(RATINGS(self.parse(page)))
+        return rating.split()[0] if rating else ""
+
+    def get_reviews(self, page):
+        node = _first(REVIEW(self.parse(page)))
+        return _text(node) if node is not None else ""
+
+    def get_helpful_count(self, page):
+        node = _first(HELPFUL(self.parse(page)))
+        return node.text_content().split()[0] if node is not None else 0
+
+    def is_verified_purchase(self, page):
+        return "yes" if VERIFIED(self.parse(page)) else "no"
+
+    def get_product_url(self, page):
+        return _first(PRODUCT_URL(self.parse(page))) or ""
+
+    def get_profile_image(self, page):
+        return _first(PROFILE_IMAGE(self.parse(page))) or ""
+
+    def get_cover_image(self, page):
+        return _first(COVER_IMAGE(self.parse(page))) or ""
+
+    def get_category(self, page):
+        return [_text(node) for node in CATEGORY(self.parse(page))]
+
+    def get_review_links(self, page):
+        """
+        Get the urls of the review detail pages on an author profile.
+
+        Parameters
+        ----------
+        page : string or lxml element
+            html of the profile page
+        Returns
+        -------
+        links: list of string
+            url of each review card, in the order of the profile
+        """
+        return list(REVIEW_LINKS(self.parse(page)))
+
+    def has_more_reviews(self, page):
+        """
+        Check whether an author profile may load more review cards by scrolling: the static page
+        only has the first PROFILE_BATCH cards of the feed.
+
+        Parameters
+        ----------
+        page : string or lxml element
+            html of the profile page
+        Returns
+        -------
+        bool
+            True if the page has a full batch of cards, the rest of the feed needs the browser
+        """
+        return len(self.get_review_links(page)) >= PROFILE_BATCH
+
+    def get_review_details(self, page):
+        """
+        Get all the fields of a review detail page.
+
+        Parameters
+        ----------
+        page : string or lxml element
+            html of the review detail page
+        Returns
+        -------
+        fields: dict
+            date, title, ratings, review, verified_purchase, helpful and url of the review
+        """
+        root = self.parse(page)
+        date, title, review, helpful = (_first(path(root)) for path in (POSTED_DATE, TITLE, REVIEW, HELPFUL))
+        return review_detail_fields({
+            'date': _text(date) if date is not None else None,
+            'title': _text(title) if title is not None else None,
+            'ratings': _first(RATINGS(root)),
+            'review': _text(review) if review is not None else None,
+            'verified': bool(VERIFIED(root)),
+            'helpful': helpful.text_content() if helpful is not None else None,
+            'url': _first(PRODUCT_URL(root)),
+        })
+
+    # ------------------------------------------------------------------
+    # Functions for product scraping (level 3)
+    # ------------------------------------------------------------------
+
+    def _card(self, page, id):
+        return _first(CARD(self.parse(page), id=id))
+
+    def getPageContent(self, page):
+        return PAGE_CONTENT(self.parse(page))
+
+    def getReviewer(self, page, id):
+        card = self._card(page, id)
+        node = _first(CARD_REVIEWER(card)) if card is not None else None
+        return node.text_content().split('\n')[0] if node is not None else False
+
+    def getRatings(self, page, id):
+        card = self._card(page, id)
+        ratings = _first(CARD_RATINGS(card)) if card is not None else None
+        return float(ratings[0]) if ratings else ""
+
+    def getDate(self, page, id):
+        card = self._card(page, id)
+        node = _first(CARD_DATE(card)) if card is not None else None
+        date, canada = split_review_date(node.text_content() if node is not None else "")
+        if not canada:
+            print('not canada')
+        return date, canada
+
+    def isVerifiedPurchase(self, page, id):
+        card = self._card(page, id)
+        return card is not None and bool(CARD_VERIFIED(card))
+
+    def getReview(self, page, id):
+        card = self._card(page, id)
+        node = _first(CARD_REVIEW(card)) if card is not None else None
+        return _text(node) if node is not None else ""
+
+    def peopleFindHelpful(self, page, id):
+        card = self._card(page, id)
+        node = _first(CARD_HELPFUL(card)) if card is not None else None
+        return node.text_content().split()[0] if node is not None else 0
+
+    def getReviewTitle(self, page, id):
+        card = self._card(page, id)
+        node = _first(CARD_TITLE(card)) if card is not None else None
+        return _text(node) if node is not None else ""
+
+    def getProductName(self, page):
+        node = _first(PRODUCT_NAME(self.parse(page)))
+        return _text(node) if node is not None else None
+
+    def getAuthorProfile(self, page, id):
+        card = self._card(page, id)
+        return (_first(CARD_PROFILE(card)) if card is not None else None) or ""
+
+    def get_summary_table(self, page):
+        return [(_text(_first(ROW_HEADER(row))), _text(_first(ROW_VALUE(row))))
+                for row in SUMMARY_TABLE(self.parse(page)) if ROW_HEADER(row) and ROW_VALUE(row)]
+
+    def get_brand(self, page):
+        return [(_text(_first(BULLET_LABEL(row))), _text(_first(BULLET_VALUE(row))))
+                for row in BRAND(self.parse(page)) if BULLET_LABEL(row) and BULLET_VALUE(row)]
+
+    def get_extra_info(self, page):
+        return [(_text(_first(ROW_HEADER(row))), _text(_first(ROW_VALUE(row))))
+                for row in EXTRA_INFO(self.parse(page)) if ROW_HEADER(row) and ROW_VALUE(row)]
+
+    def get_rank(self, page):
+        node = _first(RANK(self.parse(page)))
+        return _text(node) if node is not None else None
+
+    def get_review_cards(self, page):
+        """
+        This function returns all the fields of all the reviews on a review list page.
+
+        Parameters
+        ----------
+        page : string or lxml element
+            html of the review list page
+
+        Returns
+        -------
+        list of dict
+            fields of each review (see AuthorProfileConfig.review_card_fields)
+        """
+        root = self.parse(page)
+        if not PAGE_CONTENT(root):
+            return []
+        cards = []
+        for review in REVIEW_CARDS(root):
+            card = _first(CARD(root, id=review.get('id')))
+            if card is None:
+                card = review
+            reviewer, date, ratings, text, helpful, title = (
+                _first(path(card)) for path in (CARD_REVIEWER, CARD_DATE, CARD_RATINGS, CARD_REVIEW, CARD_HELPFUL,
+                                                CARD_TITLE))
+            cards.append(review_card_fields({
+                'id': review.get('id'),
+                'reviewer': reviewer.text_content() if reviewer is not None else None,
+                'date': date.text_content() if date is not None else None,
+                'ratings': ratings,
+                'review': _text(text) if text is not None else None,
+                'helpful': helpful.text_content() if helpful is not None else None,
+                'verified': bool(CARD_VERIFIED(card)),
+                'title': _text(title) if title is not None else None,
+                'profile': _first(CARD_PROFILE(card)),
+            }))
+        return cards
+
+    def get_product_details(self, page):
+        """
+        Get the brand, rank and category of a product page, as AuthorConfiguration.get_product_details.
+
+        Parameters
+        ----------
+        page : string or lxml element
+            html of the product page
+
+        Returns
+        -------
+        details: dict
+            brand, rank (empty strings if not found) and category (None if not found) of the product
+        """
+        root = self.parse(page)
+        brand = [value for label, value in self.get_summary_table(root) if label.lower().strip() == "brand"]
+        if len(brand) == 0:
+            for label, value in self.get_brand(root):
+                label = label.lower()
+                if (('manufacturer' in label) and len(label.split()) > 1) or ('brand' in label):
+                    brand.append(value)
+
+        rank = [value for label, value in self.get_extra_info(root) if "rank" in label.lower()]
+        if len(rank) == 0:
+            row = self.get_rank(root)
+            if row is not None and '#' in row:
+                rank.append(row.split('#')[1].split()[0])
+
+        categories = self.get_category(root)
+        return {
+            'brand': brand[0] if len(brand) > 0 else "",
+            'rank': rank[0] if len(rank) > 0 else "",
+            'category': categories[0] if categories else None,
+        }
+
+    def get_all_reviews_url(self, page):
+        """
+        Get the url behind the 'See all reviews' link of a product page.
+
+        Parameters
+        ----------
+        page : string or lxml element
+            html of the product page
+
+        Returns
+        -------
+        url: string or None
+            url of the first review list page
+        """
+        return _first(ALL_REVIEWS_URL(self.parse(page)))
+
+    def get_total_reviews(self, page):
+        """
+        Get the number of reviews of a review list page ("Showing 1-10 of 1,234 reviews").
+
+        Parameters
+        ----------
+        page : string or lxml element
+            html of the review list page
+
+        Returns
+        -------
+        total: int or None
+            number of reviews, None if the page does not show it
+        """
+        node = _first(TOTAL_REVIEWS(self.parse(page)))
+        try:
+            return int(node.text_content().split()[-2].replace(',', ''))
+        except (AttributeError, IndexError, ValueError):
+            return None
+
+    def get_next_page_url(self, page):
+        """
+        Get the url behind the next page button of a review list page.
+
+        Parameters
+        ----------
+        page : string or lxml element
+            html of the review list page
+
+        Returns
+        -------
+        url: string or None
+            url of the next review list page, None on the last page
+        """
+        return _first(NEXT_PAGE_URL(self.parse(page)))
+
+
+metrics.instrument(PageParser, 'parse')  # time each field extraction
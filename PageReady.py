@@ -0,0 +1,107 @@
+"""
+Readiness conditions for the pages loaded in the browser.
+
+Instead of sleeping a fixed time after a navigation, the scrapers poll the
+page every READY_POLL seconds (one injected script per poll) until the
+elements they read are rendered, for at most READY_TIMEOUT seconds. A
+captcha or amazon error page ends the wait at once, so the caller can slow
+down (see RateController) instead of waiting for content that never comes.
+"""
+
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.support import expected_conditions as ec
+from selenium.webdriver.support.ui import WebDriverWait
+
+import Settings as settings
+from Metrics import metrics
+from AuthorProfileConfig import BLOCKED_PAGE_SCRIPT
+
+# javascript expressions that are true once the elements read by the scrapers are rendered
+PROFILE = "document.querySelector('#customer-profile-name-header .name-container > span') !== null"
+PROFILE_CARDS = "document.querySelector('#profile-at-card-container div.a-row') !== null"
+REVIEW_DATE = "((document.querySelector('span[data-hook=\"review-date\"]') || {}).textContent || '').trim() !== ''"
+REVIEW_LIST = "document.getElementById('cm_cr-review_list') !== null"
+PAGINATION = "document.getElementById('cm_cr-pagination_bar') !== null"
+PRODUCT_TITLE = "((document.getElementById('productTitle') || {}).textContent || '').trim() !== ''"
+
+READY = 'ready'
+BLOCKED = 'blocked'
+
+_CHECK = """
+var blocked = (function () {%s})();
+if (blocked) return '%s';
+return (%s) ? '%s' : null;
+"""
+
+
+def condition(expression):
+    """
+    Build a WebDriverWait condition from a javascript expression.
+
+    Parameters
+    ----------
+    expression : string
+        javascript expression, true once the page is ready
+
+    Returns
+    -------
+    condition : function
+        takes a driver, returns READY, BLOCKED, or None while the page is not ready
+    """
+    script = _CHECK % (BLOCKED_PAGE_SCRIPT, BLOCKED, expression, READY)
+
+    def check(driver):
+        try:
+            return driver.execute_script(script)
+        except WebDriverException:  # the page is being replaced
+            return None
+
+    return check
+
+
+@metrics.timed('page_ready')
+def wait_for(driver, expression, timeout=None):
+    """
+    Wait until a page is ready, is a captcha or error page, or the timeout expires.
+
+    Parameters
+    ----------
+    driver : selenium web driver object
+        object of webdriver.
+    expression : string
+        javascript expression, one of the conditions of this module or any other
+    timeout : float
+        seconds to wait at most, defaults to Settings.READY_TIMEOUT
+
+    Returns
+    -------
+    state : string or None
+        READY, BLOCKED, or None if the page is still not ready after the timeout
+    """
+    wait = WebDriverWait(driver, timeout or settings.READY_TIMEOUT, poll_frequency=settings.READY_POLL)
+    try:
+        return wait.until(condition(expression))
+    except TimeoutException:
+        print('page not ready after', timeout or settings.READY_TIMEOUT, 'seconds')
+        return None
+
+
+@metrics.timed('page_ready')
+def wait_stale(driver, element, timeout=None):
+    """
+    Wait until an element is removed from the page, i.e. the page that contained it
+    was replaced after a click.
+
+    Returns
+    -------
+    bool
+        True if the element is gone
+    """
+    wait = WebDriverWait(driver, timeout or settings.READY_TIMEOUT, poll_frequency=settings.READY_POLL,
+                         ignored_exceptions=(StaleElementReferenceException,))
+    try:
+        return wait.until(ec.staleness_of(element))
+    except TimeoutException:
+        return False
@@ -0,0 +1,256 @@
+"""
+Parquet output of the scraped reviews (PARQUET=True).
+
+Besides the csv files or the database, the reviews saved by main.py and
+ProductMain.py are streamed to two Parquet datasets under PARQUET_DIR,
+partitioned the hive way by product category and main product:
+
+    parquet/authors/product_category=Electronics/product_id=B07.../part-<run>-<n>.parquet
+
+so a reader filtering on a category only opens the files of its directory:
+
+    pd.read_parquet('parquet/authors', filters=[('product_category', '=', 'Electronics')])
+
+The rows of a partition are buffered and written as one row group every
+PARQUET_ROW_GROUP rows, or earlier for the largest partitions when more
+than PARQUET_MAX_BUFFERED rows are buffered over all of them, and the file of a partition stays open until the
+end of the run (or until more than PARQUET_MAX_OPEN files are open), when
+its footer is written. The columns are typed: ratings as float, helpful
+counts as int, verified purchase as bool, review dates as dates and the
+start/end times as timestamps.
+
+A Parquet file is only readable once closed: the files left open by a run
+that crashes are lost, the csv files or the database stay the reference.
+"""
+
+import datetime
+import os
+import urllib.parse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import Settings as settings
+
+AUTHORS = 'authors'  # reviews of the author profiles (main.py)
+PRODUCTS = 'products'  # reviews of the sub-products of the authors (ProductMain.py)
+
+PARTITIONS = ('product_category', 'product_id')
+
+TYPES = {
+    'string': pa.string(),
+    'float': pa.float32(),
+    'int': pa.int32(),
+    'bool': pa.bool_(),
+    'date': pa.date32(),
+    'timestamp': pa.timestamp('us'),
+}
+
+# columns of each dataset (partition columns excepted) and their type
+COLUMNS = {
+    AUTHORS: {
+        'author_id': 'string', 'review_id': 'string', 'reviewer_name': 'string', 'date_review_posted': 'date',
+        'review_title': 'string', 'reviews': 'string', 'verified_purchase': 'bool', 'people_find_helpful': 'int',
+        'ratings': 'float', 'product_url': 'string', 'start': 'timestamp', 'end': 'timestamp',
+    },
+    PRODUCTS: {
+        'author_id': 'string', 'subproduct_id': 'string', 'subproduct_author_id': 'string', 'review_id': 'string',
+        'reviewer_name': 'string', 'reviewer_profile_url': 'string', 'date': 'date', 'review_title': 'string',
+        'reviews': 'string', 'verified_purchase': 'bool', 'people_find_helpful': 'int', 'ratings': 'float',
+        'product_name': 'string', 'brand_name': 'string', 'rank': 'string', 'start_time': 'timestamp',
+        'end_time': 'timestamp',
+    },
+}
+
+_output = None  # output shared by the scrapers of a process
+
+
+def _typed(values, kind):
+    """
+    Convert a column of scraped values to its Parquet type, values that cannot be read become null.
+    """
+    if kind == 'float':
+        return pd.to_numeric(values, errors='coerce').astype('float32')
+    if kind == 'int':
+        # "One person found this helpful", "1,234 people found this helpful"
+        text = values.astype(str).str.replace(',', '').str.strip().str.lower().replace('one', '1')
+        return pd.to_numeric(text, errors='coerce').astype('Int32')
+    if kind == 'bool':
+        return values.map(lambda value: None if value is None or value != value
+                          else str(value).strip().lower() in ('true', '1', 'yes', 'verified purchase'))
+    if kind == 'date':
+        dates = pd.to_datetime(values, format='%B %d, %Y', errors='coerce')
+        return dates.map(lambda date: None if pd.isna(date) else date.date())
+    if kind == 'timestamp':
+        # datetimes, or their text when they come back from a journal
+        return pd.to_datetime(values.map(lambda value: value if isinstance(value, datetime.datetime)
+                                         else None if value is None or value != value else str(value)),
+                              format='ISO8601', errors='coerce')
+    return values.map(lambda value: None if value is None or value != value else str(value))
+
+
+def _directory(value):
+    # partition values are url encoded in the directory names, as read back by pyarrow
+    return urllib.parse.quote(str(value) if value is not None and value == value else '', safe='')
+
+
+def get_output():
+    """
+    Output shared by the scrapers of the process, opened on first use.
+
+    Returns
+    -------
+    output : ParquetOutput object
+        datasets of Settings.PARQUET_DIR
+    """
+    global _output
+    if _output is None:
+        _output = ParquetOutput()
+    return _output
+
+
+def close_output():
+    """
+    Close the files of the shared output, if it was used.
+    """
+    global _output
+    if _output is not None:
+        _output.close()
+        _output = None
+
+
+class ParquetOutput:
+    """
+    Streaming writer of the partitioned Parquet datasets.
+
+    Attributes
+    ----------
+    folder : string
+        root folder of the datasets
+    row_group : int
+        number of rows of a row group
+    max_open : int
+        number of partition files kept open at most
+    max_buffered : int
+        number of rows buffered at most over all the partitions
+    buffered : int
+        number of rows buffered
+    rows : int
+        number of rows written
+    files : int
+        number of files written
+    """
+
+    def __init__(self, folder=None, row_group=None, max_open=None, max_buffered=None):
+        """
+        Constructor for the output
+
+        Parameters
+        ----------
+        folder : string
+            root folder of the datasets, defaults to Settings.PARQUET_DIR
+        row_group : int
+            rows per row group, defaults to Settings.PARQUET_ROW_GROUP
+        max_open : int
+            partition files kept open at most, defaults to Settings.PARQUET_MAX_OPEN
+        max_buffered : int
+            rows buffered at most over all the partitions, defaults to Settings.PARQUET_MAX_BUFFERED
+        """
+        self.folder = folder or settings.PARQUET_DIR
+        self.row_group = row_group or settings.PARQUET_ROW_GROUP
+        self.max_open = max_open or settings.PARQUET_MAX_OPEN
+        self.max_buffered = max_buffered or settings.PARQUET_MAX_BUFFERED
+        self.buffered = 0
+        self.run = datetime.datetime.now().strftime('%Y%m%d%H%M%S') + f'-{os.getpid()}'
+        self.rows = 0
+        self.files = 0
+        self._buffers = {}  # (dataset, category, product id): list of arrow tables not written yet
+        self._writers = {}  # (dataset, category, product id): open parquet writer, least recently used first
+        self.schemas = {dataset: pa.schema([(name, TYPES[kind]) for name, kind in columns.items()])
+                        for dataset, columns in COLUMNS.items()}
+
+    def table(self, dataset, frame):
+        """
+        Typed arrow table of the columns of a dataset, the missing columns are null.
+
+        Parameters
+        ----------
+        dataset : string
+            AUTHORS or PRODUCTS
+        frame : pandas data frame
+            reviews as saved by main.py or ProductMain.py
+
+        Returns
+        -------
+        table : arrow table
+        """
+        columns = {}
+        for name, kind in COLUMNS[dataset].items():
+            values = frame[name] if name in frame else pd.Series([None] * len(frame), index=frame.index)
+            columns[name] = _typed(values.reset_index(drop=True), kind)
+        return pa.Table.from_pandas(pd.DataFrame(columns), schema=self.schemas[dataset], preserve_index=False)
+
+    def write(self, dataset, frame):
+        """
+        Buffer the reviews of a data frame in their partitions, writing the row groups that are full,
+        then the largest buffers while more than max_buffered rows are buffered.
+
+        Parameters
+        ----------
+        dataset : string
+            AUTHORS or PRODUCTS
+        frame : pandas data frame or None
+            reviews with product_category and product_id columns
+        """
+        if frame is None or len(frame) == 0:
+            return
+        for partition, rows in frame.groupby([frame[column].fillna('').astype(str) if column in frame
+                                              else pd.Series('', index=frame.index) for column in PARTITIONS],
+                                             sort=False):
+            key = (dataset,) + partition
+            buffer = self._buffers.setdefault(key, [])
+            buffer.append(self.table(dataset, rows))
+            self.buffered += len(rows)
+            if sum(len(table) for table in buffer) >= self.row_group:
+                self.flush(key)
+        while self.buffered > self.max_buffered:
+            self.flush(max(self._buffers, key=lambda key: sum(len(table) for table in self._buffers[key])))
+
+    def flush(self, key):
+        """
+        Write the buffered rows of a partition to its file, as row groups of row_group rows.
+        """
+        buffer = self._buffers.pop(key, None)
+        if not buffer:
+            return
+        table = pa.concat_tables(buffer)
+        self.buffered -= len(table)
+        writer = self._writers.pop(key, None)
+        if writer is None:
+            writer = self.open(key)
+        self._writers[key] = writer  # most recently used last
+        writer.write_table(table, row_group_size=self.row_group)
+        self.rows += len(table)
+        while len(self._writers) > self.max_open:
+            self._writers.pop(next(iter(self._writers))).close()
+
+    def open(self, key):
+        dataset, category, product_id = key
+        folder = os.path.join(self.folder, dataset, f'{PARTITIONS[0]}={_directory(category)}',
+                              f'{PARTITIONS[1]}={_directory(product_id)}')
+        os.makedirs(folder, exist_ok=True)
+        self.files += 1
+        path = os.path.join(folder, f'part-{self.run}-{self.files}.parquet')
+        return pq.ParquetWriter(path, self.schemas[dataset], compression='snappy')
+
+    def close(self):
+        """
+        Write the rows still buffered and close the files.
+        """
+        for key in list(self._buffers):
+            self.flush(key)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        print(f'parquet: {self.rows} rows in {self.files} files')
@@ -0,0 +1,113 @@
+"""
+Details of the sub-products already seen, per ASIN (PRODUCT_CATALOG).
+
+Most sub-products are reviewed by several authors, and the product page of
+each one used to be loaded for every author only to read its name, brand,
+rank and category. The details read once are kept in the products table
+(Storage.py) and looked up before a sub-product is loaded (see
+ProductMain.extract_product): a known sub-product of another category is
+skipped without loading anything, and the reviews of a known sub-product
+of the category are read from its review list directly.
+
+The details are saved in the database of STORAGE_PATH with STORAGE=sqlite,
+in the one of PRODUCT_CATALOG_PATH otherwise, and read again once they are
+older than PRODUCT_CATALOG_TTL days. Each process opens its own connection,
+the processes of a WorkerPool share the database.
+"""
+
+import os
+
+import Settings as settings
+import Storage as storage
+
+
+class ProductCatalog:
+    """
+    Details of the sub-products by ASIN, memoized in the process.
+
+    Attributes
+    ----------
+    path : string
+        path of the database
+    ttl : float
+        days the details of a sub-product are used, 0 for no limit
+    hits, misses : int
+        counters of the lookups of the process
+    """
+
+    def __init__(self, path=None, ttl=None):
+        """
+        Constructor for the catalog, the database is opened on first use
+
+        Parameters
+        ----------
+        path : string
+            path of the database, defaults to Settings.STORAGE_PATH with STORAGE=sqlite and to
+            Settings.PRODUCT_CATALOG_PATH otherwise
+        ttl : float
+            days the details are used, defaults to Settings.PRODUCT_CATALOG_TTL
+        """
+        self.path = path or (settings.STORAGE_PATH if settings.STORAGE == 'sqlite' else settings.PRODUCT_CATALOG_PATH)
+        self.ttl = settings.PRODUCT_CATALOG_TTL if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self._details = {}  # asin: details read or saved by the process
+        self._database = None
+        self._pid = None
+
+    def _storage(self):
+        if self._pid != os.getpid():  # a sqlite connection must not be used across a fork
+            self._database = storage.Storage(self.path)
+            self._pid = os.getpid()
+        return self._database
+
+    def get(self, asin):
+        """
+        Details of a sub-product.
+
+        Parameters
+        ----------
+        asin : string
+            ASIN of the sub-product
+
+        Returns
+        -------
+        details : dict or None
+            name, brand, rank and category of the sub-product, None if it is not known or too old
+        """
+        details = self._details.get(asin)
+        if details is None:
+            details = self._storage().get_product(asin, self.ttl)
+            if details is not None:
+                self._details[asin] = details
+        if details is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return details
+
+    def put(self, asin, details):
+        """
+        Save the details of a sub-product, unless its page did not show its category.
+
+        Parameters
+        ----------
+        asin : string
+            ASIN of the sub-product
+        details : dict
+            name, brand, rank and category of the sub-product
+        """
+        if not details or details.get('category') is None:
+            return  # page not loaded, the sub-product must be read again
+        if not settings.PRODUCT_CATALOG and settings.STORAGE != 'sqlite':
+            return  # no database to keep them in
+        self._details[asin] = details
+        self._storage().save_product(asin, details)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0}
+
+
+catalog = ProductCatalog()  # catalog shared by the scrapers of a process
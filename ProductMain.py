@@ -7,72 +7,163 @@ Contents are saved as CSV to 'reviews/'
 
 
 
-import time
+import asyncio
 import datetime
-import random
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
 import AuthorProfileConfig as config
 import DriverSetup as setup
-from selenium.common.exceptions import NoSuchElementException
+import HttpFetcher as fetch
+import PageCache as pagecache
+from ProductCatalog import catalog
+from DriverTrace import tracer
+from Metrics import metrics
+import ParquetOutput as parquet
+import PageReady as ready
+import RateController as rate
+import Settings as settings
+import Storage as storage
+import Watermarks as incremental
+from PageParser import PageParser
+from ReviewBuffer import ReviewBuffer, ProductReview, PRODUCT_REVIEW_COLUMNS
+from AmazonUrls import normalize_url, page_number, rebase_url, review_sort, reviews_url
+from AmazonUrls import review_page_url, review_page_urls
+from CrawlEngine import CrawlEngine
+from Journal import Journal, PRODUCTS
+import WorkerPool as pool
 
 from platform import system  # to check os
 
-configuration = None  # AuthorProfileConfig variable declaration
+configuration = config.AuthorConfiguration()  # holds no state, shared by all the scrapes of the process
 
-os = system()  # get the os
-
-amazon_reviews = {}  # dict to store reviews
+parser = PageParser()  # reads pages fetched over http
 
-flag = True  # to collect reviews within canada only
+os = system()  # get the os
 
 
-# dictionary to store fields
-def initialize_dict():
-    global amazon_reviews
-    amazon_reviews = {
-        'subproduct_author_id': [],
-        'verified_purchase': [],
-        'review_title': [],
-        'reviews': [],
-        'date': [],
-        'reviewer_name': [],
-        'ratings': [],
-        'people_find_helpful': [],
-        'reviewer_profile_url': [],
-        'start_time': [],
-        'end_time': []
-    }
+class ProductScrape:
+    """
+    State of the scrape of the sub-products of one author profile, passed to the
+    functions that collect reviews so that several authors can be scraped in one process.
 
+    Attributes
+    ----------
+    reviews : ReviewBuffer object
+        reviews of all the sub-products, one group per sub-product
+    journal : Journal object or None
+        journal of the author profile file
+    file : string or None
+        name of the author profile file the reviews are saved to, the watermarks of the
+        sub-products are kept per file
+    subproduct : string
+        id of the sub-product being scraped
+    canada : bool
+        False once a review from another country is read, the next ones are not collected
+    watermark : Watermark object or None
+        newest review of the sub-product saved by a previous run (INCREMENTAL), the reviews are
+        collected up to it
+    """
 
-def add_to_dict(id, reviewer, review, review_title, ratings, author_profile, date, verified_purchase, number, start,
-                end):
+    def __init__(self, journal=None, file=None):
+        self.reviews = ReviewBuffer(ProductReview)
+        self.journal = journal
+        self.file = file
+        self.subproduct = None
+        self.canada = True
+        self.watermark = None
+
+    def start(self, subproduct):
+        """
+        Start collecting the reviews of a sub-product.
+
+        Parameters
+        ----------
+        subproduct : string
+            id of the sub-product
+        """
+        self.subproduct = subproduct
+        self.canada = True
+        self.watermark = incremental.watermarks.get(incremental.PRODUCT, subproduct, self.file)
+        self.reviews.begin_group()
+
+    def is_saved(self, review_id, date):
+        """
+        Check whether a review was saved by a previous run, i.e. it is the watermark or older. The
+        next reviews are not collected then, like after a review from another country.
+        """
+        if self.watermark is None or not self.watermark.reached(review_id, date):
+            return False
+        print('reviews saved by a previous run')
+        self.canada = False
+        return True
+
+    def add(self, **values):
+        """
+        Add a review of the current sub-product and journal it.
+
+        Parameters
+        ----------
+        values : dict
+            fields of the review (see ReviewBuffer.PRODUCT_REVIEW_COLUMNS)
+        """
+        record = self.reviews.add(**values)
+        if self.journal is not None:
+            self.journal.append({'type': 'review', 'subproduct': self.subproduct,
+                                 'row': record.as_dict(PRODUCT_REVIEW_COLUMNS)})
+
+    def journal_entry(self, type, **values):
+        """
+        Write an entry about the current sub-product to the journal, if any
+
+        Parameters
+        ----------
+        type: string
+            'details' when the sub-product is in the main product category, 'page' when the reviews
+            of a review page are stored (values: next, url of the next page), 'done' when all the
+            reviews of the sub-product are stored (values: details)
+        """
+        if self.journal is not None:
+            self.journal.append(dict(values, type=type, subproduct=self.subproduct))
+
+
+def resume_products(journal):
     """
-    Store data to dictionary
+    Read the journal of the author profile file written by a previous run.
+    The reviews of a page that was not finished are dropped, the page is read again.
 
-    Attributes
+    Parameters
     ----------
-    id: string
-        unique id of reviewer
-    review: string
-        review posted by author
-    start: datetime
-        start time for extracting a review
-    end: datetime
-        time extraction process ends for a review
-    """
-
-    amazon_reviews['subproduct_author_id'].append(id)
-    amazon_reviews['reviewer_profile_url'].append(author_profile)
-    amazon_reviews['reviewer_name'].append(reviewer)
-    amazon_reviews['date'].append(date)
-    amazon_reviews['ratings'].append(ratings)
-    amazon_reviews['reviews'].append(review)
-    amazon_reviews['people_find_helpful'].append(number)
-    amazon_reviews['review_title'].append(review_title)
-    amazon_reviews['verified_purchase'].append(verified_purchase)
-    amazon_reviews['start_time'].append(start)
-    amazon_reviews['end_time'].append(end)
+    journal: Journal object or None
+        journal of the author profile file
+
+    Returns
+    -------
+    products: dict
+        details, reviews (fields of each review), url of the next review page and whether it is done,
+        per sub-product id
+    """
+    products = {}
+    if journal is None:
+        return products
+    for entry in journal.entries():
+        product = products.setdefault(entry['subproduct'], {'details': None, 'rows': [], 'pending': [],
+                                                            'next': None, 'done': False})
+        if entry['type'] == 'review':
+            product['pending'].append(entry['row'])
+        elif entry['type'] == 'details':
+            product['details'] = entry['details']
+        else:
+            product['rows'].extend(product['pending'])
+            product['pending'] = []
+            if entry['type'] == 'page':
+                product['next'] = entry['next']
+            else:
+                product['details'] = entry['details']
+                product['done'] = True
+    if products:
+        print(f'{len(products)} sub-products resumed from the journal')
+    return products
 
 
 # check if all reviews are not loaded, them load them first
@@ -94,26 +185,37 @@ def checkMoreReviews(driver):
     try:
         isMoreReviews = driver.find_element_by_partial_link_text('See all reviews')
         if isMoreReviews:
+            rate.controller.wait()
             isMoreReviews.click()
-            time.sleep(3)
+            ready.wait_stale(driver, isMoreReviews)  # the product page is replaced by the review list
+            ready.wait_for(driver, ready.REVIEW_LIST)
             return True
     except:
         print('no link to see more reviews')
         return False
 
 
-# fetch reviews and store in a dictionary
-def getReviews(driver):
+# fetch reviews and add them to the scrape
+def getReviews(driver, scrape):
     """
-    This function collects all reviews and stores in dictionary
+    This function collects all reviews of the page and adds them to the scrape
 
     Parameters
     ----------
     driver : selenium webdriver object
         web driver of selenium
+    scrape : ProductScrape object
+        scrape of the author profile
 
     """
-    global flag
+    if settings.BATCH_EXTRACTION:
+        start = datetime.datetime.now()
+        cards = configuration.get_review_cards(driver)  # one round trip for the whole page
+        if cards is not None:
+            # an empty page is checked for a captcha, to slow down if amazon is throttling
+            rate.controller.record(None, not cards and configuration.is_blocked(driver))
+            store_review_cards(scrape, cards, start)
+            return
 
     all_reviews = configuration.getPageContent(driver)
     for rev in all_reviews:
@@ -125,8 +227,8 @@ def getReviews(driver):
             reviewer = configuration.getReviewer(i, unique_id)
             if reviewer:
 
-                date, flag = configuration.getDate(i, unique_id)
-                if not flag:
+                date, scrape.canada = configuration.getDate(i, unique_id)
+                if not scrape.canada or scrape.is_saved(unique_id, date):
                     return
                 ratings = configuration.getRatings(i, unique_id)
                 review = configuration.getReview(i, unique_id)
@@ -137,15 +239,52 @@ def getReviews(driver):
                 id = author_profile.split('/')[-2]
                 id = id.split('.')[-1]
                 end = datetime.datetime.now()
-                add_to_dict(id, reviewer, review, review_title, ratings, author_profile, date, verified_purchase,
-                            number, start, end)
+                scrape.add(subproduct_author_id=id, reviewer_name=reviewer, reviews=review,
+                           review_title=review_title, ratings=ratings, reviewer_profile_url=author_profile, date=date,
+                           verified_purchase=verified_purchase, people_find_helpful=number, start_time=start,
+                           end_time=end, review_id=unique_id)
 
             else:
                 print('no reviews to collect')
-                flag = False
+                scrape.canada = False
                 return
 
 
+def store_review_cards(scrape, cards, start):
+    """
+    This function adds the reviews read by AuthorConfiguration.get_review_cards to the scrape
+
+    Parameters
+    ----------
+    scrape : ProductScrape object
+        scrape of the author profile
+    cards : list of dict
+        fields of each review on the page
+    start : datetime
+        time the page extraction started
+    """
+    for card in cards:
+        if card['reviewer']:
+            scrape.canada = card['canada']
+            if not scrape.canada:
+                print('not canada')
+                return
+            if scrape.is_saved(card['id'], card['date']):
+                return
+            author_profile = card['author_profile']
+            id = author_profile.split('/')[-2]
+            id = id.split('.')[-1]
+            end = datetime.datetime.now()
+            scrape.add(subproduct_author_id=id, reviewer_name=card['reviewer'], reviews=card['review'],
+                       review_title=card['review_title'], ratings=card['ratings'], reviewer_profile_url=author_profile,
+                       date=card['date'], verified_purchase=card['verified_purchase'],
+                       people_find_helpful=card['helpful'], start_time=start, end_time=end, review_id=card['id'])
+        else:
+            print('no reviews to collect')
+            scrape.canada = False
+            return
+
+
 def totalReviews(driver):
     """
     Get total reviews in Canada
@@ -172,33 +311,8 @@ def totalReviews(driver):
         return False
 
 
-# reinitiate driver if all reviews are not fetched and an error occurs
-def reinitiate(driver, url):
-    """
-    This function reinitiates web driver object if some error occurs while
-    scraping reviews
-
-    Parameters
-    ----------
-    driver : selenium webdriver object
-        web driver of selenium
-    url : string
-        url of the page from where to begin with
-
-    Returns
-    -------
-    driver : selenium webdriver object
-        web driver of selenium
-    """
-
-    driver.quit()
-    driver = setup.SetupDriver().driver
-    driver.get(url)
-    return driver
-
-
 # refresh when an error occurs and all reviews are not extracted
-def extractReviews(driver):
+def extractReviews(driver, scrape):
     """
     This function made necessary calls to collect all the reviews
 
@@ -206,54 +320,337 @@ def extractReviews(driver):
     ----------
     driver : selenium webdriver object
         web driver of selenium
+    scrape : ProductScrape object
+        scrape of the author profile
 
     """
 
-    global flag
     # if no reviews are collected, then expand all the reviews
     # and extract each page.
-    if len(amazon_reviews['reviewer_name']) == 0:
-        checkMoreReviews(driver)  # this will expand all the reviews
-        getReviews(driver)
-        if len(amazon_reviews['reviewer_name']) == 0:
+    if scrape.reviews.group_size() == 0:
+        if settings.PAGINATION == 'direct' or settings.INCREMENTAL:
+            open_first_page(driver, scrape)
+        else:
+            checkMoreReviews(driver)  # this will expand all the reviews
+        getReviews(driver, scrape)
+        if scrape.reviews.group_size() == 0:
             return
 
     else:
         # random refresh if gets blocked while scraping
         try:
             print("--------refreshing page to load ---------------------")
+            rate.controller.wait()
             driver.refresh()
-            time.sleep(random.randint(2, 6))
-            getReviews(driver)
+            ready.wait_for(driver, ready.REVIEW_LIST)
+            getReviews(driver, scrape)
         except:
+            metrics.count('retries', 'review_list')
+            rate.controller.wait()
             driver.refresh()
-            time.sleep(random.randint(2, 6))
-            getReviews(driver)
+            ready.wait_for(driver, ready.REVIEW_LIST)
+            getReviews(driver, scrape)
 
+    if settings.PAGINATION == 'direct' and read_pages_direct(driver, scrape):
+        return
     while True:
         try:
             # if reviews are outside of Canada, then discontinue
-            if not flag:
+            if not scrape.canada:
                 print('other countries reviews')
                 return
             # check if reviews are present on next page, by clicking button
             next_button = driver.find_element_by_xpath('//*[@id="cm_cr-pagination_bar"]/ul/li[2]/a')
+            scrape.journal_entry('page', next=next_button.get_attribute('href'))  # resume from the next page
+            rate.controller.wait()
             next_button.click()
-            time.sleep(random.randint(2, 6))
-            getReviews(driver)
+            ready.wait_stale(driver, next_button)  # the pagination bar is replaced with the next page
+            ready.wait_for(driver, ready.REVIEW_LIST)
+            getReviews(driver, scrape)
         except:
             return
     # extractReviews(driver)
 
 
-def extract_product(df):
+def scrape_product_browser(driver, scrape, url, product_category):
     """
-    extract information (all reviews) about an author
+    Load a sub-product in the browser and collect its reviews if it belongs to the main product category
+
+    Parameters
+    ----------
+    driver : selenium webdriver object
+        web driver of selenium
+    scrape : ProductScrape object
+        scrape of the author profile
+    url : string
+        url of the sub-product
+    product_category : string
+        category of the main product
+
+    Returns
+    -------
+    details : dict
+        name, brand, rank and category of the sub-product
+    """
+    rate.controller.wait(url)
+    driver.get(url)
+    state = ready.wait_for(driver, ready.PRODUCT_TITLE)
+    k = 0
+    prod_name = configuration.getProductName(driver)  # retrieves product name
+    # if page is not loaded properly, try to refresh for
+    # at most 3 times. If page is not loaded, then extract other url
+    # 'cause may be the given url is not working or broken
+    while not prod_name:
+        if k > 3:
+            break
+        rate.controller.record(url, state == ready.BLOCKED)
+        rate.controller.wait(url)
+        driver.refresh()
+        state = ready.wait_for(driver, ready.PRODUCT_TITLE)
+        prod_name = configuration.getProductName(driver)
+        k += 1
+
+    details = configuration.get_product_details(driver)  # brand, rank and category
+    details['name'] = prod_name
+    if settings.PAGE_CACHE and prod_name:
+        pagecache.cache.put(url, driver.page_source)  # read from the cache for the next authors
+    # check if category belongs to main product category then only scrape
+    if in_category(details, product_category):
+        scrape.journal_entry('details', details=details)
+        extractReviews(driver, scrape)  # extract the data
+    return details
+
+
+def scrape_product_http(fetcher, scrape, url, product_category):
+    """
+    Fetch a sub-product over http and collect its reviews if it belongs to the main product category
+
+    Parameters
+    ----------
+    fetcher : HttpFetcher object
+        pooled http session
+    scrape : ProductScrape object
+        scrape of the author profile
+    url : string
+        url of the sub-product
+    product_category : string
+        category of the main product
+
+    Returns
+    -------
+    details : dict or None
+        name, brand, rank and category of the sub-product, None if the product page needs the browser
+    resume_url : string or None
+        url of the review page the browser has to continue from, None if all reviews are collected
+    """
+    page = fetcher.get_page(url, fetch.PRODUCT)
+    if page is None:
+        return None, None
+    page = parser.parse(page, url)
+    details = parser.get_product_details(page)
+    details['name'] = parser.getProductName(page)
+    if not in_category(details, product_category):
+        return details, None
+    scrape.journal_entry('details', details=details)
+
+    reviews_url = parser.get_all_reviews_url(page)
+    if not reviews_url:
+        # all the reviews are on the product page
+        store_review_cards(scrape, parser.get_review_cards(page), datetime.datetime.now())
+        return details, None
+    return details, collect_reviews_http(fetcher, scrape, reviews_url)
+
+
+def cached_details(url):
+    """
+    Details of a sub-product read from its page in the page cache, without the browser
+
+    Parameters
+    ----------
+    url : string
+        url of the sub-product
+
+    Returns
+    -------
+    details : dict or None
+        name, brand, rank and category of the sub-product, None if the page is not cached
+    """
+    html = pagecache.cache.get(url)
+    if html is None:
+        return None
+    page = parser.parse(html, url)
+    details = parser.get_product_details(page)
+    details['name'] = parser.getProductName(page)
+    return details
+
+
+def collect_reviews_http(fetcher, scrape, reviews_url):
+    """
+    Fetch the review pages of a sub-product over http, from a given page to the last one
+    or the first review from another country
+
+    Parameters
+    ----------
+    fetcher : HttpFetcher object
+        pooled http session
+    scrape : ProductScrape object
+        scrape of the author profile
+    reviews_url : string
+        url of the first review page to fetch
+
+    Returns
+    -------
+    resume_url : string or None
+        url of the review page the browser has to continue from, None if all reviews are collected
+    """
+    direct = settings.PAGINATION == 'direct'
+    if direct or settings.INCREMENTAL:
+        reviews_url = review_page_url(reviews_url, page_number(reviews_url), review_sort())
+    while reviews_url:
+        page = fetcher.get_page(reviews_url, fetch.REVIEW_LIST)
+        if page is None:
+            return reviews_url
+        start = datetime.datetime.now()
+        page = parser.parse(page, reviews_url)
+        store_review_cards(scrape, parser.get_review_cards(page), start)
+        if not scrape.canada:
+            print('other countries reviews')
+            break
+        total = parser.get_total_reviews(page) if direct else None
+        if total is not None:
+            return collect_pages_direct(fetcher, scrape, review_page_urls(reviews_url, total))
+        reviews_url = parser.get_next_page_url(page)  # the fetcher paces the requests
+        scrape.journal_entry('page', next=reviews_url)  # resume from the next page
+    return None
+
+
+def collect_pages_direct(fetcher, scrape, urls, driver=None):
+    """
+    Fetch review pages concurrently, PAGINATION_BATCH at a time, and add their reviews in page
+    order up to the first review from another country. The fetcher paces the requests.
+
+    Parameters
+    ----------
+    fetcher : HttpFetcher object
+        pooled http session
+    scrape : ProductScrape object
+        scrape of the author profile
+    urls : list of string
+        urls of the review pages, in page order (see AmazonUrls.review_page_urls)
+    driver : selenium webdriver object
+        web driver to load the pages that can not be fetched over http, None to stop at the first one
+
+    Returns
+    -------
+    resume_url : string or None
+        url of the review page the browser has to continue from, None if all reviews are collected
+    """
+    batch = settings.PAGINATION_BATCH
+    with ThreadPoolExecutor(max_workers=batch) as executor:
+        for first in range(0, len(urls), batch):
+            window = urls[first:first + batch]
+            pages = executor.map(lambda url: fetcher.get_page(url, fetch.REVIEW_LIST), window)
+            for done, (url, page) in enumerate(zip(window, pages), first + 1):
+                if page is not None:
+                    start = datetime.datetime.now()
+                    store_review_cards(scrape, parser.get_review_cards(parser.parse(page, url)), start)
+                elif driver is None:
+                    return url
+                else:
+                    rate.controller.wait(url)
+                    driver.get(url)
+                    ready.wait_for(driver, ready.REVIEW_LIST)
+                    getReviews(driver, scrape)
+                scrape.journal_entry('page', next=urls[done] if done < len(urls) else None)
+                if not scrape.canada:
+                    print('other countries reviews')
+                    return None
+    return None
+
+
+def open_first_page(driver, scrape):
+    """
+    Load the first review page of the sub-product, sorted by AmazonUrls.review_sort, unless it is loaded
+
+    Parameters
+    ----------
+    driver : selenium webdriver object
+        web driver of selenium
+    scrape : ProductScrape object
+        scrape of the author profile
+    """
+    url = review_page_url(reviews_url(scrape.subproduct), 1, review_sort())
+    if normalize_url(driver.current_url) != normalize_url(url):
+        rate.controller.wait(url)
+        driver.get(url)
+        ready.wait_for(driver, ready.REVIEW_LIST)
+
+
+def read_pages_direct(driver, scrape):
+    """
+    Read the review pages after the one loaded in the driver from their urls, computed
+    from the number of reviews, concurrently over http with the cookies of the browser
+
+    Parameters
+    ----------
+    driver : selenium webdriver object
+        web driver with a review page loaded
+    scrape : ProductScrape object
+        scrape of the author profile
+
+    Returns
+    -------
+    bool
+        False if the page does not show the number of reviews, the pages are not read then
+    """
+    if not scrape.canada:
+        return True
+    total = totalReviews(driver)
+    if not total:
+        return False
+    fetcher = fetch.HttpFetcher(pool_size=settings.PAGINATION_BATCH)
+    fetcher.use_cookies(driver.get_cookies())
+    collect_pages_direct(fetcher, scrape, review_page_urls(driver.current_url, int(total), review_sort()), driver)
+    fetcher.close()
+    return True
+
+
+def in_category(details, product_category):
+    """
+    Check if a sub-product belongs to the main product category
+
+    Parameters
+    ----------
+    details : dict
+        details of the sub-product
+    product_category : string
+        category of the main product
+
+    Returns
+    -------
+    bool
+        True if the category of the sub-product contains the main product category
+    """
+    return details['category'] is not None and product_category in details['category']
+
+
+def prepare(df):
+    """
+    Remove the main product from the sub-products of an author
 
     Parameters
     ----------
     df: pandas data frame
         dataframe related to an author profile
+
+    Returns
+    -------
+    df: pandas data frame
+        sub-products of the author
+    product_category: string
+        category of the main product
+    product_id: string
+        id of the main product
     """
     # remove the main product
     df = df[~(df['subproduct_id'] == df['product_id'])]
@@ -267,126 +664,191 @@ def extract_product(df):
         # empty string
     except IndexError:
         product_id = ""
+    return df, product_category, product_id
+
+
+def end_product(scrape, df, details, product_category, product_id, subproduct_id):
+    """
+    Set the details of a sub-product on its reviews, the reviews collected since ProductScrape.start
+
+    Parameters
+    ----------
+    scrape : ProductScrape object
+        scrape of the author profile
+    df: pandas data frame
+        dataframe related to an author profile
+    details: dict
+        name, brand and rank of the sub-product
+    product_category: string
+        category of the main product
+    product_id: string
+        id of the main product
+    subproduct_id: string
+        id of the sub-product
+    """
+    try:
+        author_id = df['author_id'].dropna().unique()[0]  # if author id is null then
+        # return empty string
+    except IndexError:
+        author_id = ""
+    scrape.reviews.end_group(product_name=details['name'], brand_name=details['brand'], rank=details['rank'],
+                             product_category=product_category, product_id=product_id, author_id=author_id,
+                             subproduct_id=str(subproduct_id))
+
+
+def extract_product(df, browser=None, name=None, file=None):
+    """
+    extract information (all reviews) about an author
+
+    Parameters
+    ----------
+    df: pandas data frame
+        dataframe related to an author profile
+    browser: DriverSetup object
+        browser session to reuse, if None one is started when needed and quit at the end
+    name: string
+        name of the author profile file, the reviews are journaled under this name to resume
+        after a crash (see Journal.py). No journal if None
+    file: string
+        name of the author profile file the reviews are saved to, for the watermarks (INCREMENTAL),
+        defaults to name
+    """
+    df, product_category, product_id = prepare(df)
     # pytesseract.pytesseract.tesseract_cmd = r'C:\\Users\\Raj\\AppData\\Local\\Tesseract-OCR\\tesseract.exe'
 
-    global configuration
-    driver = setup.DriverSetup().driver  # initialize the web driver instance
-
-    # setup all configurations defined in AmazonConfig file
-    configuration = config.AuthorConfiguration()  # initialize the config file object
-    # load the url from csv
-    initialize_dict()  # initialize the dictionary to store the data
-    print(df.shape)
-    dataframe = None  # this will contain the result of all sub-products related to an author
-    for data in df.itertuples():
-        url = data.product_url  # get the url of sub-product
-
-        # initialize the dictionary
-        initialize_dict()
-        print('-----------------------------')
-        print('take new url')
-        print('-----------------------------')
-        driver.get(url)
-        time.sleep(4)
-        k = 0
-        prod_name = configuration.getProductName(driver)  # retrieves product name
-        # if page is not loaded properly, try to refresh for
-        # at most 3 times. If page is not loaded, then extract other url
-        # 'cause may be the given url is not working or broken
-        while not prod_name:
-            if k > 3:
-                break
-            driver.refresh()
-            time.sleep(4)
-            prod_name = configuration.getProductName(driver)
-            k += 1
-
-        product_info = configuration.get_summary_table(driver)  # table where brand and rank are specified
-
-        brand = []
-        # brand name can be found in one of the two different tables.
-        # if not found in 1st scenario below, then check for other table
-        for i in product_info:
-            row = i.find_element_by_xpath('th').text.lower().strip()
-            if (row is not None) and (row == "brand"):
-                brand.append(i.find_element_by_xpath('td').text)
-        # 2nd scenario to get brand name
-        if len(brand) == 0:
-            rows = configuration.get_brand(driver)
-            if rows is not None:
-                for row in rows:
-                    try:
-                        bname = row.find_element_by_xpath('span/span[1]').text.lower()
-                    except NoSuchElementException:
-                        continue
-                    if (bname is not None) and (
-                            (('manufacturer' in bname) and len(bname.split()) > 1) or ('brand' in bname)):
-                        print(bname)
-                        try:
-                            bname = row.find_element_by_xpath('span/span[2]').text
-                            brand.append(bname)
-                            print(brand)
-                        except NoSuchElementException:
-                            brand = []
-
-        # get the rank of the product
-        # rank can be found in one of the two tables:
-        # check in 1st table
-        extra_info = configuration.get_extra_info(driver)
-        rank = []
-        for i in extra_info:
-            row = i.find_element_by_xpath('th').text.lower().strip()
-            if "rank" in row:
-                rank.append(i.find_element_by_xpath('td').text)
-        # if 1st table is not found, check for 2nd table
-        if len(rank) == 0:
-            row = configuration.get_rank(driver)
-            if row is not None:
-                row = row.split('#')[1].split()[0]
-                rank.append(row)
-
-        categories = configuration.get_category(driver)
-        # check if category belongs to main product category then only scrape
-        if categories:
-            category = categories[0].text
-            if product_category in category:
-                sub_name = str(data.subproduct_id)
-                extractReviews(driver)  # extract the data
+    scrape = ProductScrape(Journal(PRODUCTS, name) if settings.JOURNAL and name else None, file or name)
+    resumed = resume_products(scrape.journal)
+    own_browser = browser is None
+    if own_browser:
+        browser = setup.DriverSetup(start=False)  # the web driver is only started when a page needs the browser
+    fetcher = fetch.HttpFetcher() if settings.FETCH_MODE == 'http' else None
+
+    try:
+        print(df.shape)
+        for data in df.itertuples():
+            url = rebase_url(data.product_url)  # get the url of sub-product
+
+            print('-----------------------------')
+            print('take new url')
+            print('-----------------------------')
+            scrape.start(str(data.subproduct_id))
+            state = resumed.get(scrape.subproduct)
+            details, resume_url = None, None
+            known = catalog.get(scrape.subproduct) if settings.PRODUCT_CATALOG and state is None else None
+            if state is not None and (state['done'] or state['next']):
+                # reviews extracted by a previous run
+                for row in state['rows']:
+                    scrape.reviews.add(**row)
+                details = state['details']
+                if not state['done']:
+                    resume_url = (collect_reviews_http(fetcher, scrape, state['next']) if fetcher is not None
+                                  else state['next'])
+            elif known is not None:
+                # product page read for a previous author: skipped if it is in another category,
+                # otherwise its reviews are read from the review list directly
+                details = known
+                if in_category(details, product_category):
+                    scrape.journal_entry('details', details=details)
+                    resume_url = reviews_url(scrape.subproduct)
+                    if fetcher is not None:
+                        resume_url = collect_reviews_http(fetcher, scrape, resume_url)
+            elif fetcher is not None:
+                details, resume_url = scrape_product_http(fetcher, scrape, url, product_category)
+            elif settings.PAGE_CACHE:
+                # product page cached by a previous author, the browser is only needed for the reviews
+                details = cached_details(url)
+                if details is not None and in_category(details, product_category):
+                    scrape.journal_entry('details', details=details)
+                    resume_url = url
+            if details is None or resume_url is not None:
+                driver = browser.get_driver()
+                if details is None:
+                    details = scrape_product_browser(driver, scrape, url, product_category)
+                else:
+                    # continue from the review page that could not be fetched over http, the first
+                    # review page is opened by extractReviews itself with direct pagination
+                    if scrape.reviews.group_size() or not (settings.PAGINATION == 'direct' or settings.INCREMENTAL):
+                        rate.controller.wait(resume_url)
+                        driver.get(resume_url)
+                    extractReviews(driver, scrape)
+                browser.collect_blocked()  # drain the performance log of the driver
+            if state is None or not state['done']:
+                scrape.journal_entry('done', details=details)
+            if known is None:
+                catalog.put(scrape.subproduct, details)
+
+            if in_category(details, product_category):
                 print('all reviews are collected')
-                # if data is collected then save in a pandas data frame
-                if len(amazon_reviews['reviews']) > 0:
-                    # create data frame
-                    frame = pd.DataFrame.from_dict(amazon_reviews)
-                    # create extra columns for product name, avg rating and total reviews
-                    frame['product_name'] = prod_name  # product name
-                    frame['brand_name'] = brand[0] if len(brand) > 0 else ""
-                    frame['rank'] = rank[0] if len(rank) > 0 else ""
-                    frame['product_id'] = product_id
-                    try:
-                        frame['author_id'] = df['author_id'].dropna().unique()[0] # if author id is null then
-                        # return empty string
-                    except IndexError:
-                        frame['author_id'] = ""
-                    frame['subproduct_id'] = sub_name
-
-                    dataframe = frame if dataframe is None else pd.concat([dataframe, frame])
-
-    driver.quit()
+                end_product(scrape, df, details, product_category, product_id, data.subproduct_id)
+            else:
+                scrape.reviews.drop_group()
+
+    finally:
+        if own_browser:
+            browser.quit()
+        if fetcher is not None:
+            fetcher.close()
+        if scrape.journal is not None:
+            scrape.journal.close()  # kept until the file is saved (see main), to resume after a failure
+    dataframe = scrape.reviews.frame()  # reviews of all the sub-products related to an author
     print(dataframe is None)
     return dataframe
 
 
+async def extract_products_async(authors):
+    """
+    extract information (all reviews) about the sub-products of all the authors
+    concurrently, with the asyncio crawl engine. The files with a sub-product whose pages
+    need the browser are not saved, they stay pending for the browser scraper.
+
+    Parameters
+    ----------
+    authors: iterable of tuple
+        name and sub-products (pandas data frame) of the author profiles not processed yet
+    """
+    engine = CrawlEngine()
+
+    async def crawl_file(file, df):
+        df, product_category, product_id = prepare(df)
+        known = [catalog.get(str(asin)) if settings.PRODUCT_CATALOG else None for asin in df['subproduct_id']]
+        marks = [incremental.watermarks.get(incremental.PRODUCT, asin, file) for asin in df['subproduct_id']]
+        products = await asyncio.gather(*(engine.crawl_product(rebase_url(url), product_category, details, mark)
+                                          for url, details, mark in zip(df['product_url'], known, marks)))
+        scrape = ProductScrape(file=file)
+        complete = True
+        for data, product, details in zip(df.itertuples(), products, known):
+            if product is None:
+                print(f'{data.product_url} needs the browser')
+                complete = False
+                continue
+            if details is None:
+                catalog.put(str(data.subproduct_id), product['details'])
+            if in_category(product['details'], product_category):
+                scrape.start(str(data.subproduct_id))
+                store_review_cards(scrape, product['cards'], product['start'])
+                end_product(scrape, df, product['details'], product_category, product_id, data.subproduct_id)
+        if complete:
+            save_data(scrape.reviews.frame(), file)
+        else:
+            print(f'{file} is left to the browser')
+
+    await asyncio.gather(*(crawl_file(name, df) for name, df in authors))
+    engine.close()
+
+
 def filter_files():
     """
     This function filter the files that are already processed
     Returns
     -------
     files: list
-        list of files not read yet
+        list of files not read yet, all the files with INCREMENTAL (they are refreshed)
     """
     import os
     author_files = os.listdir('reviewers')  # author_profile data
     print((author_files[0]))
+    if settings.INCREMENTAL:
+        return author_files
     prod_files = os.listdir('reviews')  # subproduct data
     print(len(author_files))
     files = list(set(author_files) - set(prod_files))
@@ -394,17 +856,52 @@ def filter_files():
     return files
 
 
+def pending_authors():
+    """
+    Author profiles whose sub-products are not scraped yet: the files of 'reviewers/' not
+    processed yet, or the authors of the database with STORAGE=sqlite
+
+    Yields
+    ------
+    name: string
+        name of the author profile file, id of the author with STORAGE=sqlite
+    df: pandas data frame
+        sub-products of the author
+    """
+    if settings.STORAGE == 'sqlite':
+        database = storage.get_storage()
+        for id in database.pending_authors(refresh=settings.INCREMENTAL):
+            yield id, database.author_products(id)
+        return
+    path = r"reviewers/"
+    for file in filter_files():  # filter the files that are already processed
+        file = file.strip()
+        yield file, pd.read_csv(path + file)
+
+
+@metrics.timed('save.products')
 def save_data(frame, name):
     """
-    This function save the content to given file.
+    This function save the content to given file (or to the database with STORAGE=sqlite), and to
+    the Parquet output with PARQUET.
     Parameters
     ----------
     frame : pandas data frame
-    name : file name to save the content (dataframe)
+    name : file name to save the content (dataframe), id of the author with STORAGE=sqlite
     """
     print(name)
-    if frame is not None:
-        frame.to_csv(f"reviews\{name}.csv")
+    if settings.STORAGE == 'sqlite':
+        storage.get_storage().save_product_reviews(name, frame)
+    elif frame is not None:
+        import os
+        path = f"reviews\{name}.csv"
+        if settings.INCREMENTAL and os.path.exists(path):  # keep the reviews of the previous runs
+            incremental.merge_saved(frame, path).to_csv(path)
+        else:
+            frame.to_csv(path)
+    if settings.PARQUET:
+        parquet.get_output().write(parquet.PRODUCTS, frame)
+    incremental.watermarks.update(incremental.PRODUCT, frame, 'subproduct_id', 'review_id', 'date', name)
 
 
 def main():
@@ -412,17 +909,34 @@ def main():
     Main function
     """
     urls = ""
+    metrics.start()
     # extract_product(['https://www.amazon.ca/Maxpower-Planet-Traffic-Greater-Training/dp/B0749K8SMT?ref=pf_vv_at_pdctrvw_dp&th=1'])
 
-    files = filter_files() # filter the files that are already processed
-    # fl = files[0]
-    # print(fl)
-    path = r"reviewers/"
-    for file in files:
-        file = file.strip()
-        df = pd.read_csv(path+file)
-        frame = extract_product(df)
-        save_data(frame, file)
+    try:
+        if settings.ENGINE == 'async':
+            asyncio.run(extract_products_async(pending_authors()))
+            return
+        if settings.ENGINE == 'pool':
+            workers = pool.WorkerPool()
+            for name, df in pending_authors():
+                workers.add_products(name, df)
+            workers.run()
+            return
+
+        browser = setup.DriverSetup(start=False)  # one browser session for all the files, started when needed
+        for name, df in pending_authors():
+            frame = extract_product(df, browser, name)
+            save_data(frame, name)
+            Journal(PRODUCTS, name).finish()
+        browser.quit()
+    finally:
+        parquet.close_output()  # write the footers of the parquet files
+        if settings.PAGE_CACHE:
+            print('page cache', pagecache.cache.stats())
+        if settings.PRODUCT_CATALOG:
+            print('product catalog', catalog.stats())
+        metrics.finish()
+        tracer.close()
 
 
 if __name__ == '__main__':
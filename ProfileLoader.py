@@ -0,0 +1,193 @@
+"""
+Load the review cards of an author profile (infinite scroll).
+
+Instead of scrolling and sleeping until the page height stops changing,
+an injected asynchronous script scrolls to the bottom and watches the card
+container with a MutationObserver. It returns as soon as new cards are
+inserted, or after PROFILE_QUIET seconds without new cards, which means
+the whole feed is loaded. The cards can be consumed while the feed is
+still loading, and loading stops at the PROFILE_MAX_CARDS and
+PROFILE_MAX_TIME budgets.
+"""
+
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+import Settings as settings
+from Metrics import metrics
+
+# review cards of an author profile
+CARDS_XPATH = '//div[@id="profile-at-card-container"]//div[@class="a-row"]'
+
+SETTLE = 0.2  # seconds to let the rest of a batch of cards arrive after the first one
+
+# cards after the first arguments[1] ones
+CARDS_SCRIPT = """
+var cards = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var found = [];
+for (var i = arguments[1]; i < cards.snapshotLength; i++) found.push(cards.snapshotItem(i));
+return found;
+"""
+
+# urls of the review detail pages of the cards after the first arguments[1] ones, null for a card without link
+LINKS_SCRIPT = """
+var cards = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var found = [];
+for (var i = arguments[1]; i < cards.snapshotLength; i++) {
+    var link = cards.snapshotItem(i).querySelector('div.a-section.profile-at-content > p > a');
+    found.push(link ? link.href : null);
+}
+return found;
+"""
+
+# scroll to the bottom and wait for more than arguments[1] cards, or for a quiet period; returns the number of cards
+LOAD_MORE_SCRIPT = """
+var xpath = arguments[0], known = arguments[1], quiet = arguments[2] * 1000, settle = arguments[3] * 1000;
+var done = arguments[arguments.length - 1];
+function count() {
+    return document.evaluate('count(' + xpath + ')', document, null, XPathResult.NUMBER_TYPE, null).numberValue;
+}
+var container = document.getElementById('profile-at-card-container');
+if (!container || count() > known) { done(count()); return; }
+var quietTimer = setTimeout(finish, quiet), settleTimer = null;
+var observer = new MutationObserver(function () {
+    if (count() <= known) return;
+    clearTimeout(settleTimer);
+    settleTimer = setTimeout(finish, settle);
+});
+function finish() {
+    observer.disconnect();
+    clearTimeout(quietTimer);
+    clearTimeout(settleTimer);
+    done(count());
+}
+observer.observe(container, {childList: true, subtree: true});
+window.scrollTo(0, document.body.scrollHeight - 10);
+window.scrollTo(0, document.body.scrollHeight);
+"""
+
+
+class ProfileLoader:
+    """
+    Loads the review cards of the author profile open in a driver.
+
+    Attributes
+    ----------
+    driver : selenium web driver object
+        driver with the author profile loaded
+    max_cards : int
+        stop after this many cards, 0 for no limit
+    max_time : float
+        stop after waiting this many seconds for the feed, 0 for no limit
+    quiet : float
+        seconds without new cards after which the feed is considered complete
+    loaded : int
+        number of cards returned so far
+    complete : bool
+        True once the end of the feed was reached
+    failed : bool
+        True if the page could not be scrolled (broken session)
+    """
+
+    def __init__(self, driver, max_cards=None, max_time=None, quiet=None):
+        self.driver = driver
+        self.max_cards = settings.PROFILE_MAX_CARDS if max_cards is None else max_cards
+        self.max_time = settings.PROFILE_MAX_TIME if max_time is None else max_time
+        self.quiet = quiet or settings.PROFILE_QUIET
+        self.loaded = 0
+        self.complete = False
+        self.failed = False
+        self.waited = 0.0  # seconds spent waiting for the feed
+
+    def load_more(self, known):
+        """
+        Wait for the feed to have more than known cards.
+
+        Parameters
+        ----------
+        known : int
+            number of cards already on the page
+
+        Returns
+        -------
+        count : int
+            number of cards on the page, known if the feed is complete
+        """
+        start = time.time()
+        self.driver.set_script_timeout(self.quiet + SETTLE + 10)
+        count = self.driver.execute_async_script(LOAD_MORE_SCRIPT, CARDS_XPATH, known, self.quiet, SETTLE)
+        self.waited += time.time() - start
+        metrics.observe('scroll_loading', time.time() - start)
+        return int(count)
+
+    def over_budget(self, count):
+        if self.max_cards and count >= self.max_cards:
+            return True
+        if self.max_time and self.waited >= self.max_time:
+            print(f'profile loading stopped after {self.max_time} seconds')
+            return True
+        return False
+
+    def cards(self):
+        """
+        Review cards of the profile, loading more of them as they are consumed.
+
+        Yields
+        ------
+        card : selenium web element
+            next review card of the profile
+        """
+        return self._feed(CARDS_SCRIPT)
+
+    def links(self):
+        """
+        Urls of the review detail pages of the cards, loading more cards as they are consumed.
+
+        Yields
+        ------
+        link : string or None
+            url of the review detail page of the next card, None if the card has no link
+        """
+        return self._feed(LINKS_SCRIPT)
+
+    def _feed(self, script):
+        try:
+            while True:
+                for card in self.driver.execute_script(script, CARDS_XPATH, self.loaded):
+                    if self.max_cards and self.loaded >= self.max_cards:
+                        return
+                    self.loaded += 1
+                    yield card
+                if self.over_budget(self.loaded):
+                    return
+                if self.load_more(self.loaded) <= self.loaded:
+                    self.complete = True
+                    return
+        except WebDriverException as exc:
+            print(exc)
+            print('not able to load')
+            self.failed = True
+
+    def load_all(self):
+        """
+        Load the whole feed, within the budgets, without reading the cards.
+
+        Returns
+        -------
+        bool
+            False if the page could not be scrolled (broken session)
+        """
+        count = 0
+        try:
+            while not self.over_budget(count):
+                more = self.load_more(count)
+                if more <= count:
+                    self.complete = True
+                    break
+                count = more
+        except WebDriverException as exc:
+            print(exc)
+            print('not able to load')
+            self.failed = True
+        return not self.failed
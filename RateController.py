@@ -0,0 +1,132 @@
+"""
+Central pacing of the requests sent to amazon.
+
+Each host has a token bucket whose rate follows AIMD: every healthy
+response adds RATE_INCREASE requests/sec (up to RATE_MAX), every captcha
+or 503 multiplies the rate by RATE_DECREASE (down to RATE_MIN) and empties
+the bucket. All the deliberate waits of the scrapers go through the shared
+'controller', so one set of settings tunes the whole crawl.
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import Settings as settings
+from Metrics import metrics
+
+
+class _Bucket:
+    __slots__ = ('rate', 'tokens', 'updated', 'ok', 'blocked')
+
+    def __init__(self, rate, tokens):
+        self.rate = rate
+        self.tokens = tokens
+        self.updated = time.monotonic()
+        self.ok = 0
+        self.blocked = 0
+
+
+class RateController:
+    """
+    Token bucket per host with additive increase / multiplicative decrease of the rate.
+
+    Attributes
+    ----------
+    start_rate : float
+        initial requests per second of every host
+    min_rate : float
+        lowest requests per second after backing off
+    max_rate : float
+        highest requests per second while responses are healthy
+    increase : float
+        requests per second added after each healthy response
+    decrease : float
+        factor applied to the rate after a captcha or 503
+    burst : float
+        requests that can be sent back to back after an idle period
+    jitter : float
+        random extra wait, as a fraction of the request interval
+    """
+
+    def __init__(self, start_rate=None, min_rate=None, max_rate=None, increase=None, decrease=None, burst=None,
+                 jitter=None):
+        self.start_rate = start_rate or settings.RATE_START
+        self.min_rate = min_rate or settings.RATE_MIN
+        self.max_rate = max_rate or settings.RATE_MAX
+        self.increase = settings.RATE_INCREASE if increase is None else increase
+        self.decrease = decrease or settings.RATE_DECREASE
+        self.burst = burst or settings.RATE_BURST
+        self.jitter = settings.RATE_JITTER if jitter is None else jitter
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, url):
+        host = urlsplit(url).netloc if url else ''
+        if not host:
+            host = urlsplit(settings.BASE_URL).netloc
+        if host not in self._buckets:
+            self._buckets[host] = _Bucket(self.start_rate, 1.0)
+        return self._buckets[host]
+
+    def wait(self, url=None):
+        """
+        Block until the next request to the host of url is allowed.
+
+        Parameters
+        ----------
+        url : string
+            url about to be requested, None for the amazon host of Settings.BASE_URL
+
+        Returns
+        -------
+        delay : float
+            seconds waited
+        """
+        with self._lock:
+            bucket = self._bucket(url)
+            now = time.monotonic()
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            bucket.tokens -= 1  # reserve a token, a negative balance is the wait of this request
+            delay = max(0.0, -bucket.tokens / bucket.rate) + random.uniform(0, self.jitter) / bucket.rate
+        time.sleep(delay)
+        metrics.observe('sleep.rate_wait', delay)
+        return delay
+
+    def success(self, url=None):
+        """
+        Record a healthy response: the rate of the host grows additively.
+        """
+        with self._lock:
+            bucket = self._bucket(url)
+            bucket.ok += 1
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def blocked(self, url=None):
+        """
+        Record a captcha or 503: the rate of the host drops multiplicatively
+        and the bucket is emptied so the next request waits a full interval.
+        """
+        with self._lock:
+            bucket = self._bucket(url)
+            bucket.blocked += 1
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            bucket.tokens = min(bucket.tokens, 0.0) - 1
+        metrics.count('blocked')
+        print(f'blocked, slowing down to {bucket.rate:.3f} requests/sec')
+
+    def record(self, url, is_blocked):
+        if is_blocked:
+            self.blocked(url)
+        else:
+            self.success(url)
+
+    def stats(self):
+        with self._lock:
+            return {host: {'rate': round(bucket.rate, 3), 'ok': bucket.ok, 'blocked': bucket.blocked}
+                    for host, bucket in self._buckets.items()}
+
+
+controller = RateController()  # shared by all the scrapers of a process
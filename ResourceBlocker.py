@@ -0,0 +1,136 @@
+"""
+Block the resources the scrapers never look at (images, fonts, media,
+ads and tracking) in chrome.
+
+Images are blocked by type, with the chrome content setting that stops
+every image of every tab. The other rules are url patterns given to the
+DevTools protocol (Network.setBlockedURLs): selenium 3 can send DevTools
+commands but can not answer the requestPaused events of Fetch.enable, so
+the resourceType patterns of the Fetch domain can not be used. The url
+blocklist applies to the tab it is sent to: DriverSetup applies it to the
+first tab when chrome starts and to each tab it opens (DriverSetup.open_tab).
+
+The requests are counted from the performance log of the driver, by
+resource type as reported by chrome: the blocked requests per type and the
+bytes actually downloaded per type (encodedDataLength), to compare with a
+run without blocking.
+"""
+
+import json
+from fnmatch import fnmatch
+
+import Settings as settings
+
+# url patterns blocked by each rule (Network.setBlockedURLs syntax, '*' is a wildcard), images are blocked by type
+RULES = {
+    'image': [],
+    'font': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'media': ['*.mp4', '*.webm', '*.m3u8', '*.ts', '*.mp3'],
+    'stylesheet': ['*.css', '*.css?*'],
+    'tracking': ['*fls-na.amazon.*', '*unagi.amazon.*', '*unagi-na.amazon.*', '*aax-us-east.amazon-adsystem.com*',
+                 '*amazon-adsystem.com*', '*doubleclick.net*', '*google-analytics.com*', '*googletagmanager.com*',
+                 '*/uedata?*', '*/rd/uedata*', '*/1/batch/1/OE/*', '*/gp/adbar/*', '*/ah/ajax/counter*'],
+}
+
+# chrome content setting blocking all the images
+IMAGE_PREFS = {'profile.managed_default_content_settings.images': 2}
+
+
+class ResourceBlocker:
+    """
+    Blocklist applied to a driver, with counters of the requests.
+
+    Attributes
+    ----------
+    rules : list of string
+        names of the rules (keys of RULES) that are blocked
+    blocked : dict
+        number of blocked requests per resource type ('tracking' for the tracking rule)
+    bytes_loaded : dict
+        bytes downloaded per resource type by the requests that were not blocked
+    """
+
+    def __init__(self, rules=None):
+        """
+        Constructor for the blocklist
+
+        Parameters
+        ----------
+        rules : list of string
+            names of the rules to block, defaults to Settings.BLOCKED_RESOURCES
+        """
+        if rules is None:
+            rules = [rule.strip() for rule in settings.BLOCKED_RESOURCES.split(',') if rule.strip()]
+        self.rules = [rule for rule in rules if rule in RULES]
+        self.blocked = {}
+        self.bytes_loaded = {}
+        self._requests = {}  # request id -> (url, resource type), until the request ends
+
+    def patterns(self):
+        return [pattern for rule in self.rules for pattern in RULES[rule]]
+
+    def prefs(self):
+        """
+        Chrome preferences of the rules blocked by type.
+        """
+        return dict(IMAGE_PREFS) if 'image' in self.rules else {}
+
+    def apply(self, driver):
+        """
+        Block the url patterns of the rules in the current tab of a driver.
+
+        Parameters
+        ----------
+        driver : selenium web driver object
+            chrome driver
+        """
+        if not self.rules:
+            return
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.patterns()})
+
+    def kind_of(self, url, resource_type):
+        if 'tracking' in self.rules and any(fnmatch(url, pattern) for pattern in RULES['tracking']):
+            return 'tracking'
+        return (resource_type or 'other').lower()
+
+    def collect(self, driver):
+        """
+        Count the blocked and downloaded requests from the performance log of a driver.
+        The driver must be started with performance logging (see DriverSetup).
+
+        Parameters
+        ----------
+        driver : selenium web driver object
+            chrome driver
+        """
+        try:
+            entries = driver.get_log('performance')
+        except Exception as exc:
+            print('performance log not available', exc)
+            return
+        for entry in entries:
+            message = json.loads(entry['message'])['message']
+            method, params = message.get('method'), message.get('params', {})
+            if method == 'Network.requestWillBeSent':
+                self._requests[params['requestId']] = (params['request']['url'], params.get('type'))
+            elif method == 'Network.loadingFinished':
+                kind = self.kind_of(*self._requests.pop(params['requestId'], ('', None)))
+                self.bytes_loaded[kind] = self.bytes_loaded.get(kind, 0) + int(params.get('encodedDataLength', 0))
+            elif method == 'Network.loadingFailed':
+                url, resource_type = self._requests.pop(params['requestId'], ('', None))
+                if params.get('blockedReason'):
+                    kind = self.kind_of(url, params.get('type') or resource_type)
+                    self.blocked[kind] = self.blocked.get(kind, 0) + 1
+
+    def stats(self):
+        """
+        Counters of the blocklist.
+
+        Returns
+        -------
+        stats: dict
+            blocked requests and bytes downloaded, per resource type
+        """
+        return {'blocked': dict(self.blocked), 'bytes_loaded': dict(self.bytes_loaded),
+                'bytes_loaded_total': sum(self.bytes_loaded.values())}
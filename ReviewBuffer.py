@@ -0,0 +1,146 @@
+"""
+Review records and the buffer that turns them into one data frame.
+
+A review is one record object with __slots__ instead of a row spread over a
+dict of parallel lists, and the records are kept by the scrape that
+collects them, not by a module global, so several scrapes can run in one
+process. The data frame is only built when the buffer is saved, once,
+instead of concatenating a frame per sub-product.
+
+The records of the sub-products of an author are grouped: the details of
+a sub-product (name, brand, ...) are set on the records of its group once
+its reviews are collected.
+"""
+
+from operator import attrgetter
+
+import pandas as pd
+
+# columns of the 'reviewers/' files (main.py), before the columns of the author
+AUTHOR_COLUMNS = ('author_id', 'date_review_posted', 'review_title', 'reviews', 'verified_purchase',
+                  'people_find_helpful', 'ratings', 'product_url', 'start', 'end', 'review_id')
+
+# columns of the 'reviews/' files (ProductMain.py) read from a review, then the columns of its sub-product
+PRODUCT_REVIEW_COLUMNS = ('subproduct_author_id', 'verified_purchase', 'review_title', 'reviews', 'date',
+                          'reviewer_name', 'ratings', 'people_find_helpful', 'reviewer_profile_url', 'start_time',
+                          'end_time', 'review_id')
+PRODUCT_COLUMNS = PRODUCT_REVIEW_COLUMNS + ('product_name', 'brand_name', 'rank', 'product_category', 'product_id',
+                                            'author_id', 'subproduct_id')
+
+
+class Review:
+    """
+    Base of the review records, the fields are the columns of the saved files.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name, ""))
+
+    def as_dict(self, columns=None):
+        return {name: getattr(self, name) for name in columns or self.__slots__}
+
+
+class AuthorReview(Review):
+    """
+    Review read from an author profile (main.py).
+    """
+
+    __slots__ = AUTHOR_COLUMNS
+
+
+class ProductReview(Review):
+    """
+    Review read from the review list of a sub-product (ProductMain.py).
+    """
+
+    __slots__ = PRODUCT_COLUMNS
+
+
+class ReviewBuffer:
+    """
+    Records of one unit of work (an author, or the sub-products of an author).
+
+    Attributes
+    ----------
+    record : class
+        AuthorReview or ProductReview
+    records : list
+        records in the order they were added
+    first : int
+        index of the first record of the current group
+    """
+
+    def __init__(self, record):
+        self.record = record
+        self.records = []
+        self.first = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, **values):
+        """
+        Add a record.
+
+        Parameters
+        ----------
+        values : dict
+            fields of the record, the missing ones are empty strings
+
+        Returns
+        -------
+        record : Review object
+            record added
+        """
+        record = self.record(**values)
+        self.records.append(record)
+        return record
+
+    def begin_group(self):
+        self.first = len(self.records)
+
+    def group_size(self):
+        return len(self.records) - self.first
+
+    def end_group(self, **values):
+        """
+        Set fields shared by all the records of the current group and start a new group.
+
+        Parameters
+        ----------
+        values : dict
+            fields to set
+        """
+        for record in self.records[self.first:]:
+            for name, value in values.items():
+                setattr(record, name, value)
+        self.begin_group()
+
+    def drop_group(self):
+        del self.records[self.first:]
+
+    def frame(self, **values):
+        """
+        Build the data frame of the records, with one column per field.
+
+        Parameters
+        ----------
+        values : dict
+            columns added after the fields, with the same value for every row
+
+        Returns
+        -------
+        frame : pandas data frame or None
+            None if there is no record
+        """
+        if not self.records:
+            return None
+        columns = self.record.__slots__
+        frame = pd.DataFrame({name: list(map(attrgetter(name), self.records)) for name in columns},
+                             columns=columns)
+        for name, value in values.items():
+            frame[name] = value
+        return frame
@@ -0,0 +1,208 @@
+"""
+This file holds the run-time settings shared by main.py and ProductMain.py.
+Every setting can be overridden through an environment variable of the
+same name, so a run can be tuned without editing the scrapers.
+"""
+
+from os import environ
+
+
+def _env(name, default):
+    """
+    Read a setting from the environment, converting it to the type of the default.
+
+    Parameters
+    ----------
+    name : string
+        name of the environment variable
+    default : string, int, float or bool
+        value used when the variable is not set
+
+    Returns
+    -------
+    value
+        value of the setting
+    """
+    value = environ.get(name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+# scheme and host every amazon url is sent to. Point it at the local
+# stand-in server (StandInServer.py) to run the scrapers offline.
+BASE_URL = _env('AMAZON_BASE_URL', 'https://www.amazon.ca')
+
+# input files for main.py
+MAIN_PRODUCT_FILES = _env('MAIN_PRODUCT_FILES', r'F:\GuideAnalytics\data_scraper_v2\main_product\*.csv')
+
+# read all the fields of a page with one injected script instead of one
+# WebDriver command per field; the per-field getters are kept as fallback
+BATCH_EXTRACTION = _env('BATCH_EXTRACTION', True)
+
+# 'http' fetches product and review list pages over a pooled http session
+# and only starts the browser for pages that need it, 'browser' always
+# uses the browser
+FETCH_MODE = _env('FETCH_MODE', 'browser')
+HTTP_POOL_SIZE = _env('HTTP_POOL_SIZE', 10)  # keep-alive connections per host
+HTTP_TIMEOUT = _env('HTTP_TIMEOUT', 20.0)  # seconds
+USER_AGENT = _env('USER_AGENT', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                                '(KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36')
+
+# 'async' runs both scrapers on the asyncio crawl engine (CrawlEngine.py)
+# over http, 'pool' on a pool of browser processes (WorkerPool.py), 'sync'
+# keeps the one-page-at-a-time browser loop
+ENGINE = _env('ENGINE', 'sync')
+PER_HOST_CONCURRENCY = _env('PER_HOST_CONCURRENCY', 4)  # requests in flight per host
+MAX_IN_FLIGHT = _env('MAX_IN_FLIGHT', 16)  # requests in flight over all hosts
+
+# ENGINE=pool runs both scrapers on POOL_SIZE browser worker processes
+# (WorkerPool.py). An author with at least 2 * STEAL_CHUNK reviews left, or a
+# file with at least 2 sub-products left, hands half of them to idle workers.
+POOL_SIZE = _env('POOL_SIZE', 4)
+STEAL_CHUNK = _env('STEAL_CHUNK', 10)
+POOL_STATS_EVERY = _env('POOL_STATS_EVERY', 30.0)  # seconds between pool stats
+
+# chrome driver. CHROMEDRIVER_PATH skips webdriver-manager entirely, else
+# the path it installs is saved in DRIVER_PATH_CACHE and reused next time,
+# and installed again when chrome no longer accepts it (chrome update).
+CHROMEDRIVER_PATH = _env('CHROMEDRIVER_PATH', '')
+DRIVER_PATH_CACHE = _env('DRIVER_PATH_CACHE', '.chromedriver_path')
+HEADLESS = _env('HEADLESS', False)
+INCOGNITO = _env('INCOGNITO', True)
+PAGE_LOAD_STRATEGY = _env('PAGE_LOAD_STRATEGY', 'normal')  # 'normal', 'eager' or 'none'
+
+# resources blocked in chrome, comma separated rules of ResourceBlocker.RULES
+# (image, font, media, stylesheet, tracking); empty to load everything. Images
+# are blocked by type, the others by url in every tab. COUNT_BLOCKED reads the
+# performance log to count the blocked requests and the bytes loaded per type.
+# Images are loaded unless 'image' is added: the author pictures come from them
+BLOCKED_RESOURCES = _env('BLOCKED_RESOURCES', 'font,media,tracking')
+COUNT_BLOCKED = _env('COUNT_BLOCKED', True)
+
+# request pacing (RateController.py): a token bucket per host whose rate
+# (requests/sec) grows by RATE_INCREASE after each healthy page and is
+# multiplied by RATE_DECREASE after a captcha or 503. RATE_JITTER adds a
+# random wait of up to that fraction of the request interval.
+RATE_START = _env('RATE_START', 0.2)
+RATE_MIN = _env('RATE_MIN', 0.02)
+RATE_MAX = _env('RATE_MAX', 1.0)
+RATE_INCREASE = _env('RATE_INCREASE', 0.01)
+RATE_DECREASE = _env('RATE_DECREASE', 0.5)
+RATE_BURST = _env('RATE_BURST', 1.0)  # requests allowed back to back after an idle period
+RATE_JITTER = _env('RATE_JITTER', 0.25)
+
+# readiness of the pages loaded in the browser (PageReady.py): the page is
+# polled every READY_POLL seconds until its content is rendered, for at most
+# READY_TIMEOUT seconds
+READY_TIMEOUT = _env('READY_TIMEOUT', 10.0)
+READY_POLL = _env('READY_POLL', 0.1)
+
+# author profile feed (ProfileLoader.py): the feed is complete after
+# PROFILE_QUIET seconds without new cards. Loading stops after
+# PROFILE_MAX_CARDS cards or PROFILE_MAX_TIME seconds, 0 for no limit.
+PROFILE_QUIET = _env('PROFILE_QUIET', 3.0)
+PROFILE_MAX_CARDS = _env('PROFILE_MAX_CARDS', 0)
+PROFILE_MAX_TIME = _env('PROFILE_MAX_TIME', 0.0)
+
+# how main.py reads the review detail pages of an author profile: 'tab'
+# opens each one in a new tab, 'fetch' fetches DETAIL_BATCH of them at a
+# time from inside the profile page, 'http' over the http session with the
+# cookies of the browser
+DETAIL_MODE = _env('DETAIL_MODE', 'tab')
+DETAIL_BATCH = _env('DETAIL_BATCH', 4)
+
+# journal of the extracted reviews (Journal.py), read back to resume an
+# author or a file after a crash. JOURNAL_FSYNC forces each entry to disk,
+# which also survives a power loss but is slower.
+JOURNAL = _env('JOURNAL', True)
+JOURNAL_DIR = _env('JOURNAL_DIR', 'journal')
+JOURNAL_FSYNC = _env('JOURNAL_FSYNC', False)
+
+# where the scraped data is saved: 'csv' writes the files of 'reviewers/'
+# and 'reviews/', 'sqlite' one database (Storage.py) at STORAGE_PATH
+STORAGE = _env('STORAGE', 'csv')
+STORAGE_PATH = _env('STORAGE_PATH', 'amazon.sqlite')
+
+# Parquet output (ParquetOutput.py): with PARQUET the reviews are also
+# written to PARQUET_DIR, partitioned by product_category/product_id, one
+# row group every PARQUET_ROW_GROUP rows of a partition (the largest
+# partitions earlier when more than PARQUET_MAX_BUFFERED rows are buffered),
+# with at most PARQUET_MAX_OPEN partition files open at a time
+PARQUET = _env('PARQUET', False)
+PARQUET_DIR = _env('PARQUET_DIR', 'parquet')
+PARQUET_ROW_GROUP = _env('PARQUET_ROW_GROUP', 10000)
+PARQUET_MAX_OPEN = _env('PARQUET_MAX_OPEN', 64)
+PARQUET_MAX_BUFFERED = _env('PARQUET_MAX_BUFFERED', 50000)
+
+# on-disk page cache (PageCache.py): pages are kept PAGE_CACHE_TTL seconds
+# (0 for no limit) in PAGE_CACHE_DIR, the least recently used ones are
+# deleted over PAGE_CACHE_MAX_MB
+PAGE_CACHE = _env('PAGE_CACHE', True)
+PAGE_CACHE_DIR = _env('PAGE_CACHE_DIR', 'cache')
+PAGE_CACHE_TTL = _env('PAGE_CACHE_TTL', 86400.0)
+PAGE_CACHE_MAX_MB = _env('PAGE_CACHE_MAX_MB', 2048.0)
+
+# details of the sub-products already seen (ProductCatalog.py), kept in the
+# products table of STORAGE_PATH with STORAGE=sqlite, of
+# PRODUCT_CATALOG_PATH otherwise. With PRODUCT_CATALOG a known sub-product
+# of another category is skipped and the reviews of a known one are read
+# without its product page; details older than PRODUCT_CATALOG_TTL days
+# (0 for no limit) are read again
+PRODUCT_CATALOG = _env('PRODUCT_CATALOG', True)
+PRODUCT_CATALOG_PATH = _env('PRODUCT_CATALOG_PATH', 'products.sqlite')
+PRODUCT_CATALOG_TTL = _env('PRODUCT_CATALOG_TTL', 30.0)
+
+# download of the author pictures (ImageDownloader.py): IMAGE_WORKERS
+# threads, at most IMAGE_QUEUE pictures waiting, a failed download is
+# retried IMAGE_RETRIES times after IMAGE_BACKOFF seconds, doubled each time
+IMAGE_WORKERS = _env('IMAGE_WORKERS', 4)
+IMAGE_QUEUE = _env('IMAGE_QUEUE', 256)
+IMAGE_RETRIES = _env('IMAGE_RETRIES', 3)
+IMAGE_BACKOFF = _env('IMAGE_BACKOFF', 1.0)
+
+# content-addressed store of the author pictures (ImageStore.py) in
+# IMAGE_STORE_DIR: each distinct picture is kept once and the default
+# pictures are not downloaded. Off by default: one file per author is
+# written to images\profile and images\cover, as the readers expect
+IMAGE_STORE = _env('IMAGE_STORE', False)
+IMAGE_STORE_DIR = _env('IMAGE_STORE_DIR', 'image_store')
+
+# timings and counters of the scrapers (Metrics.py): served in the
+# Prometheus text format at http://127.0.0.1:METRICS_PORT/metrics if
+# METRICS_PORT is set, and written as JSON to METRICS_SUMMARY at exit
+METRICS = _env('METRICS', True)
+METRICS_PORT = _env('METRICS_PORT', 0)
+METRICS_SUMMARY = _env('METRICS_SUMMARY', 'metrics.json')
+
+# trace of the WebDriver commands (DriverTrace.py): with DRIVER_TRACE each
+# command and phase is written to a Chrome trace file in DRIVER_TRACE_DIR,
+# and the DRIVER_TRACE_TOP slowest selectors are printed at exit
+DRIVER_TRACE = _env('DRIVER_TRACE', False)
+DRIVER_TRACE_DIR = _env('DRIVER_TRACE_DIR', 'traces')
+DRIVER_TRACE_TOP = _env('DRIVER_TRACE_TOP', 20)
+
+# pagination of the review lists of the sub-products: 'next' follows the
+# next page link one page at a time, 'direct' computes the urls of all the
+# pages from the number of reviews and fetches them PAGINATION_BATCH at a
+# time (over http with the browser cookies when FETCH_MODE=browser, a page
+# that can not be fetched is loaded in the browser). PAGINATION_SORT sorts
+# the lists ('recent' or 'helpful'), empty keeps the order of amazon
+PAGINATION = _env('PAGINATION', 'next')
+PAGINATION_SORT = _env('PAGINATION_SORT', '')
+PAGINATION_BATCH = _env('PAGINATION_BATCH', 8)
+
+# incremental refresh (Watermarks.py): with INCREMENTAL the authors and
+# sub-products already saved are scraped again, their reviews sorted by most
+# recent, up to the newest review saved by the previous run (its watermark);
+# the watermarks are kept in the database of STORAGE_PATH with
+# STORAGE=sqlite and in WATERMARK_PATH otherwise, where the csv files of the
+# new reviews are merged with the saved ones
+INCREMENTAL = _env('INCREMENTAL', False)
+WATERMARK_PATH = _env('WATERMARK_PATH', 'watermarks.sqlite')
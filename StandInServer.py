@@ -0,0 +1,506 @@
+"""
+Local stand-in for amazon.ca, used to run main.py and ProductMain.py offline.
+
+It serves synthetic (or recorded) author profiles, review detail pages,
+product pages and review list pages with the same ids, data-hooks and
+table layouts that AuthorProfileConfig.py looks for. Latency, captcha
+pages and 503 errors can be injected to exercise the retry paths.
+
+To run:
+    python StandInServer.py --port 8000 --latency 0.3 --captcha-rate 0.02 --error-rate 0.02
+    set AMAZON_BASE_URL=http://127.0.0.1:8000 and run main.py or ProductMain.py
+
+Pages/sec and reviews/sec served are printed every few seconds and are
+available as JSON at /__stats.
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+CATEGORIES = ['Electronics', 'Home & Kitchen', 'Sports & Outdoors', 'Toys & Games', 'Beauty']
+SUB_CATEGORIES = ['Headphones', 'Cookware', 'Fitness', 'Puzzles', 'Skin Care', 'Accessories']
+WORDS = ['great', 'product', 'quality', 'works', 'battery', 'price', 'shipping', 'love', 'broke', 'after',
+         'week', 'recommend', 'size', 'colour', 'easy', 'setup', 'cheap', 'sturdy', 'would', 'buy', 'again']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+REVIEWS_PER_PAGE = 10  # review list page size, same as amazon
+
+CAPTCHA_PAGE = """<html><head><title>Amazon.ca</title></head><body>
+<h4>Enter the characters you see below</h4>
+<p>Sorry, we just need to make sure you're not a robot.</p>
+<form method="get" action="/errors/validateCaptcha"><input id="captchacharacters" name="field-keywords"></form>
+</body></html>"""
+
+ERROR_PAGE = """<html><head><title>Sorry! Something went wrong!</title></head><body>
+<p>Sorry! Something went wrong on our end. Please go back and try again.</p></body></html>"""
+
+PROFILE_SCRIPT = """<script>
+(function () {
+  var container = document.getElementById('profile-at-card-container');
+  var offset = %(offset)d, total = %(total)d, loading = false;
+  function more() {
+    if (loading || offset >= total) return;
+    if (window.innerHeight + window.scrollY < document.body.scrollHeight - 200) return;
+    loading = true;
+    fetch('/profilewidget/%(author)s?offset=' + offset).then(function (r) { return r.text(); })
+      .then(function (html) {
+        container.insertAdjacentHTML('beforeend', html);
+        offset += %(batch)d;
+        loading = false;
+      });
+  }
+  window.addEventListener('scroll', more);
+})();
+</script>"""
+
+
+def _rng(*key):
+    """
+    Deterministic random generator for a page, so every visit renders the same content.
+    """
+    return random.Random(zlib.crc32('/'.join(map(str, key)).encode()) ^ StandIn.seed)
+
+
+def _token(rng, length):
+    return ''.join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def _sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize()
+
+
+def _date(rng):
+    return f'{rng.choice(MONTHS)} {rng.randint(1, 28)}, {rng.randint(2016, 2021)}'
+
+
+class StandIn:
+    """
+    Synthetic amazon content and fault injection settings.
+
+    Attributes
+    ----------
+    seed : int
+        seed of the generated content
+    latency : float
+        mean delay (seconds) added to each response
+    jitter : float
+        maximum random delay (seconds) added on top of latency
+    captcha_rate : float
+        probability of answering with a captcha page
+    error_rate : float
+        probability of answering with a 503
+    fixtures : string
+        folder with recorded pages (fixtures/<kind>/<key>.html), or None
+    """
+    seed = 0
+    latency = 0.0
+    jitter = 0.0
+    captcha_rate = 0.0
+    error_rate = 0.0
+    fixtures = None
+    min_cards = 5
+    max_cards = 40
+    card_batch = 10
+    max_reviews = 120
+
+    lock = threading.Lock()
+    started = time.time()
+    pages = {}
+    reviews = 0
+    faults = {'captcha': 0, '503': 0}
+
+    @classmethod
+    def count(cls, kind, reviews=0):
+        with cls.lock:
+            cls.pages[kind] = cls.pages.get(kind, 0) + 1
+            cls.reviews += reviews
+
+    @classmethod
+    def stats(cls):
+        with cls.lock:
+            elapsed = max(time.time() - cls.started, 1e-9)
+            pages = sum(cls.pages.values())
+            return {
+                'elapsed': round(elapsed, 2),
+                'pages': dict(cls.pages),
+                'reviews': cls.reviews,
+                'faults': dict(cls.faults),
+                'pages_per_sec': round(pages / elapsed, 3),
+                'reviews_per_sec': round(cls.reviews / elapsed, 3),
+            }
+
+    # ---------------------------------------------------------------- data
+
+    @classmethod
+    def product(cls, asin):
+        rng = _rng('product', asin)
+        category = CATEGORIES[zlib.crc32(asin.encode()) % len(CATEGORIES)]
+        return {
+            'asin': asin,
+            'name': _sentence(rng, 3, 7),
+            'brand': rng.choice(['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli']),
+            'rank': f'#{rng.randint(1, 90000):,} in {category}',
+            'category': category,
+            'sub_category': rng.choice(SUB_CATEGORIES),
+            'total': rng.randint(0, cls.max_reviews),
+        }
+
+    @classmethod
+    def asin(cls, rng):
+        return 'B0' + _token(rng, 8)
+
+    @classmethod
+    def author_cards(cls, author):
+        rng = _rng('author', author)
+        return [('R' + _token(rng, 13), cls.asin(rng)) for _ in range(rng.randint(cls.min_cards, cls.max_cards))]
+
+    @classmethod
+    def review(cls, review_id, asin=None, canada=True):
+        rng = _rng('review', review_id)
+        return {
+            'id': review_id,
+            'asin': asin or cls.asin(rng),
+            'author': _token(rng, 28),
+            'reviewer': _sentence(rng, 1, 2),
+            'rating': rng.randint(1, 5),
+            'title': _sentence(rng, 2, 6),
+            'body': '. '.join(_sentence(rng, 5, 20) for _ in range(rng.randint(1, 5))),
+            'date': _date(rng),
+            'country': 'Canada' if canada else 'the United States',
+            'verified': rng.random() < 0.8,
+            'helpful': rng.choice([0, 0, 0, 1, 2, 5, 13]),
+        }
+
+    # ---------------------------------------------------------------- pages
+
+    @classmethod
+    def card_html(cls, review_id, asin):
+        return f"""<div class="a-row" style="min-height:160px">
+<div class="a-section profile-at-content"><span>{escape(cls.product(asin)['name'])}</span>
+<p><a href="/gp/customer-reviews/{review_id}/ref=pf_vv_at_pdctrvw_srp?ie=UTF8&ASIN={asin}">Read more</a></p>
+</div></div>"""
+
+    @classmethod
+    def profile_page(cls, author):
+        cards = cls.author_cards(author)
+        first = cards[:cls.card_batch]
+        rng = _rng('name', author)
+        body = '\n'.join(cls.card_html(*card) for card in first)
+        script = PROFILE_SCRIPT % {'offset': len(first), 'total': len(cards), 'author': author,
+                                   'batch': cls.card_batch}
+        return f"""<html><head><title>Amazon.ca: Profile</title></head><body>
+<img id="cover-image-with-cropping" src="/images/cover/{author}.jpg">
+<img id="avatar-image" src="/images/profile/{author}.jpg">
+<div id="customer-profile-name-header"><div class="a-row a-spacing-none name-container">
+<span>{escape(_sentence(rng, 2, 2))}</span></div></div>
+<div id="profile-at-card-container">
+{body}
+</div>
+{script}
+</body></html>""", 0
+
+    @classmethod
+    def profile_widget(cls, author, offset):
+        cards = cls.author_cards(author)[offset:offset + cls.card_batch]
+        return '\n'.join(cls.card_html(*card) for card in cards), 0
+
+    @classmethod
+    def detail_page(cls, review_id, asin):
+        review = cls.review(review_id, asin)
+        product = cls.product(review['asin'])
+        badge = '<span data-hook="avp-badge">Verified Purchase</span>' if review['verified'] else ''
+        link = f"/{product['name'].replace(' ', '-')}/dp/{product['asin']}/ref=cm_cr_arp_d_product_top?ie=UTF8"
+        return f"""<html><head><title>Amazon.ca: Customer review</title></head><body>
+<a class="a-link-normal" title="{review['rating']}.0 out of 5 stars" href="#"><i class="a-icon-star"></i></a>
+<a data-hook="review-title" href="#"><span>{escape(review['title'])}</span></a>
+<span data-hook="review-date">Reviewed in {review['country']} on {review['date']}</span>
+{badge}
+<span data-hook="review-body"><span>{escape(review['body'])}</span></span>
+<span class="cr-vote"><div class="a-row a-spacing-small"><span>{review['helpful']} people found this helpful</span>
+</div></span>
+<a data-hook="product-link" href="{link}">
+{escape(product['name'])}</a>
+</body></html>""", 1
+
+    @classmethod
+    def review_card(cls, review):
+        verified = '<span><a href="#"><span data-hook="avp-badge">Verified Purchase</span></a></span>' \
+            if review['verified'] else ''
+        return f"""<div id="{review['id']}" data-hook="review" class="a-section review">
+<div id="customer_review-{review['id']}" class="a-section celwidget">
+<div data-hook="genome-widget" class="a-profile-wrapper">
+<a href="/gp/profile/amzn1.account.{review['author']}/ref=cm_cr_arp_d_gw_btm?ie=UTF8" class="a-profile">
+<div class="a-profile-content"><span class="a-profile-name">{escape(review['reviewer'])}</span></div></a></div>
+<div class="a-row"><a class="a-link-normal" title="{review['rating']}.0 out of 5 stars" href="#">
+<i class="a-icon-star"></i></a> <a data-hook="review-title" class="a-link-normal" href="#">
+<span>{escape(review['title'])}</span></a></div>
+<span data-hook="review-date" class="review-date">Reviewed in {review['country']} on {review['date']}</span>
+<div class="a-row review-format-strip">{verified}</div>
+<div class="a-row review-data"><span data-hook="review-body"><span>{escape(review['body'])}</span></span></div>
+<div class="a-row"><span class="cr-vote"><div class="a-row a-spacing-small">
+<span>{review['helpful']} people found this helpful</span></div></span></div>
+</div></div>"""
+
+    @classmethod
+    def product_reviews(cls, product, start, stop):
+        reviews = []
+        canada = int(product['total'] * 0.8)  # the tail of every product is reviewed outside of canada
+        for n in range(start, min(stop, product['total'])):
+            review_id = 'R' + _token(_rng('product-review', product['asin'], n), 13)
+            reviews.append(cls.review(review_id, product['asin'], canada=n < canada))
+        return reviews
+
+    @classmethod
+    def product_page(cls, asin):
+        product = cls.product(asin)
+        reviews = cls.product_reviews(product, 0, 8)
+        cards = '\n'.join(cls.review_card(review) for review in reviews)
+        return f"""<html><head><title>Amazon.ca: {escape(product['name'])}</title></head><body>
+<div id="wayfinding-breadcrumbs_feature_div"><ul class="a-unordered-list">
+<li><a href="#">{escape(product['category'])}</a></li><li>&rsaquo;</li>
+<li><a href="#">{escape(product['sub_category'])}</a></li></ul></div>
+<span id="productTitle">{escape(product['name'])}</span>
+<table id="productDetails_techSpec_section_1"><tbody>
+<tr><th>Colour</th><td>Black</td></tr><tr><th>Brand</th><td>{product['brand']}</td></tr></tbody></table>
+<table id="productDetails_detailBullets_sections1"><tbody>
+<tr><th>ASIN</th><td>{asin}</td></tr><tr><th>Best Sellers Rank</th><td>{product['rank']}</td></tr></tbody></table>
+<div id="cm_cr-review_list">{cards}</div>
+<a href="/product-reviews/{asin}/ref=cm_cr_dp_d_show_all_btm?ie=UTF8&reviewerType=all_reviews">See all reviews</a>
+</body></html>""", len(reviews)
+
+    @classmethod
+    def review_list_page(cls, asin, page):
+        product = cls.product(asin)
+        start = (page - 1) * REVIEWS_PER_PAGE
+        reviews = cls.product_reviews(product, start, start + REVIEWS_PER_PAGE)
+        cards = '\n'.join(cls.review_card(review) for review in reviews)
+        if start + REVIEWS_PER_PAGE < product['total']:
+            next_page = f'<li class="a-last"><a href="/product-reviews/{asin}/ref=cm_cr_arp_d_paging_btm_next_' \
+                        f'{page + 1}?ie=UTF8&reviewerType=all_reviews&pageNumber={page + 1}">Next page</a></li>'
+        else:
+            next_page = '<li class="a-disabled a-last">Next page</li>'
+        previous = '<li class="a-normal"><a href="#">Previous page</a></li>' if page > 1 \
+            else '<li class="a-disabled">Previous page</li>'
+        return f"""<html><head><title>Amazon.ca:Customer reviews: {escape(product['name'])}</title></head><body>
+<div id="filter-info-section"><span>Showing {start + 1}-{start + len(reviews)} of {product['total']:,} reviews</span>
+</div>
+<div id="cm_cr-review_list">{cards}
+<div id="cm_cr-pagination_bar"><ul class="a-pagination">{previous}{next_page}</ul></div>
+</div>
+</body></html>""", len(reviews)
+
+    @classmethod
+    def fixture(cls, kind, key):
+        """
+        Recorded page for a kind/key pair, or None if there is no recording.
+        """
+        if not cls.fixtures:
+            return None
+        path = os.path.join(cls.fixtures, kind, f'{key}.html')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as file:
+            html = file.read()
+        return html
+
+
+ROUTES = [
+    ('profile', re.compile(r'/gp/profile/amzn1\.account\.(?P<key>[A-Z0-9]+)')),
+    ('widget', re.compile(r'/profilewidget/(?P<key>[A-Z0-9]+)')),
+    ('review', re.compile(r'/gp/customer-reviews/(?P<key>R[A-Z0-9]+)')),
+    ('reviews', re.compile(r'/product-reviews/(?P<key>[A-Z0-9]{10})')),
+    ('product', re.compile(r'/dp/(?P<key>[A-Z0-9]{10})')),
+    ('image', re.compile(r'/images/(?P<kind>profile|cover)/(?P<key>[A-Z0-9]+)\.jpg')),
+]
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves the stand-in pages.
+    """
+    protocol_version = 'HTTP/1.1'  # keep-alive, like amazon
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, body, content_type='text/html; charset=utf-8'):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and content_type.startswith('text'):
+            body = gzip.compress(body, 5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path == '/__stats':
+            return self.send(200, json.dumps(StandIn.stats()), 'application/json')
+
+        for kind, route in ROUTES:
+            match = route.search(parts.path)
+            if match:
+                break
+        else:
+            return self.send(404, '<html><body>Page not found</body></html>')
+
+        delay = StandIn.latency + random.uniform(0, StandIn.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if kind != 'image':
+            dice = random.random()
+            if dice < StandIn.error_rate:
+                with StandIn.lock:
+                    StandIn.faults['503'] += 1
+                return self.send(503, ERROR_PAGE)
+            if dice < StandIn.error_rate + StandIn.captcha_rate:
+                with StandIn.lock:
+                    StandIn.faults['captcha'] += 1
+                return self.send(200, CAPTCHA_PAGE)
+
+        key = match.group('key')
+        if kind == 'image':
+            StandIn.count('image')
+            pixel = _rng('image', match.group('kind'), key).randbytes(2048)
+            return self.send(200, b'\xff\xd8\xff\xe0' + pixel + b'\xff\xd9', 'image/jpeg')
+
+        page = int(query.get('pageNumber', ['1'])[0])
+        html = StandIn.fixture(kind, key if kind != 'reviews' else f'{key}_{page}')
+        reviews = 0
+        if html is None:
+            if kind == 'profile':
+                html, reviews = StandIn.profile_page(key)
+            elif kind == 'widget':
+                html, reviews = StandIn.profile_widget(key, int(query.get('offset', ['0'])[0]))
+            elif kind == 'review':
+                html, reviews = StandIn.detail_page(key, query.get('ASIN', [None])[0])
+            elif kind == 'product':
+                html, reviews = StandIn.product_page(key)
+            else:
+                html, reviews = StandIn.review_list_page(key, page)
+        else:
+            reviews = html.count('data-hook="review"') or int(kind == 'review')
+        StandIn.count(kind, reviews)
+        self.send(200, html)
+
+
+def write_inputs(folder, authors, products):
+    """
+    Write input csv files that point at the stand-in content.
+
+    Parameters
+    ----------
+    folder : string
+        folder containing 'main_product' and 'reviewers'
+    authors : int
+        number of authors per main product
+    products : int
+        number of main products
+    """
+    rng = _rng('inputs')
+    os.makedirs(os.path.join(folder, 'main_product'), exist_ok=True)
+    os.makedirs(os.path.join(folder, 'reviewers'), exist_ok=True)
+    for _ in range(products):
+        product = StandIn.product(StandIn.asin(rng))
+        rows = []
+        for _ in range(authors):
+            author = _token(rng, 28)
+            rows.append({'author_id': author, 'product_id': product['asin'], 'product_category': product['category'],
+                         'reviewer_profile_url': f'https://www.amazon.ca/gp/profile/amzn1.account.{author}/'
+                                                 f'ref=cm_cr_arp_d_gw_btm?ie=UTF8'})
+        with open(os.path.join(folder, 'main_product', f'{product["asin"]}.csv'), 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+        # author profile output, as read by ProductMain.py
+        for row in rows:
+            reviews = []
+            for _, asin in StandIn.author_cards(row['author_id']):
+                sub = StandIn.product(asin)
+                reviews.append({'author_id': row['author_id'], 'product_id': product['asin'],
+                                'product_category': product['category'], 'subproduct_id': asin,
+                                'product_url': f'https://www.amazon.ca/{sub["name"].replace(" ", "-")}/dp/{asin}'
+                                               f'?ref=pf_vv_at_pdctrvw_dp'})
+            name = f'{row["author_id"]}_{product["asin"]}.csv'
+            with open(os.path.join(folder, 'reviewers', name), 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=list(reviews[0]))
+                writer.writeheader()
+                writer.writerows(reviews)
+
+
+def report(every):
+    """
+    Print served pages/sec and reviews/sec every few seconds.
+    """
+    while True:
+        time.sleep(every)
+        print(json.dumps(StandIn.stats()))
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser(description='Local amazon.ca stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra seconds added to every response')
+    parser.add_argument('--captcha-rate', type=float, default=0.0, help='fraction of pages answered with a captcha')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of pages answered with a 503')
+    parser.add_argument('--fixtures', default=None, help='folder with recorded pages: <kind>/<key>.html')
+    parser.add_argument('--max-cards', type=int, default=40, help='maximum review cards per author profile')
+    parser.add_argument('--max-reviews', type=int, default=120, help='maximum reviews per product')
+    parser.add_argument('--write-inputs', default=None, help='write main_product/ and reviewers/ csv files here')
+    parser.add_argument('--authors', type=int, default=20, help='authors per main product for --write-inputs')
+    parser.add_argument('--products', type=int, default=2, help='main products for --write-inputs')
+    parser.add_argument('--report-every', type=float, default=10.0)
+    args = parser.parse_args()
+
+    StandIn.seed = args.seed
+    StandIn.latency = args.latency
+    StandIn.jitter = args.jitter
+    StandIn.captcha_rate = args.captcha_rate
+    StandIn.error_rate = args.error_rate
+    StandIn.fixtures = args.fixtures
+    StandIn.max_cards = args.max_cards
+    StandIn.max_reviews = args.max_reviews
+
+    if args.write_inputs:
+        write_inputs(args.write_inputs, args.authors, args.products)
+        print(f'input files written to {args.write_inputs}')
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=report, args=(args.report_every,), daemon=True).start()
+    print(f'serving amazon stand-in on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(StandIn.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+"""
+SQLite storage of the scraped authors, reviews and products (STORAGE=sqlite).
+
+One database replaces the csv files of 'reviewers/' and 'reviews/'. The
+reviews of both scrapers share one table keyed by reviewer and ASIN, so a
+review seen on an author profile and on a product page is stored once,
+and rows are upserted so a re-run only fills in what is new. Whether an
+author or the sub-products of an author are done is kept in crawl_status,
+so the skip checks are primary key lookups instead of directory scans.
+"""
+
+import datetime
+import sqlite3
+
+import pandas as pd
+
+import Settings as settings
+from AmazonUrls import asin_from_url
+
+AUTHOR = 'author'  # crawl status of an author profile (main.py), key: author id
+PRODUCTS = 'products'  # crawl status of the sub-products of an author (ProductMain.py), key: author id
+
+DONE = 'done'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS authors (
+    author_id TEXT PRIMARY KEY,
+    name TEXT,
+    profile_url TEXT,
+    main_product_id TEXT,
+    product_category TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS author_products (
+    author_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    product_category TEXT,
+    PRIMARY KEY (author_id, product_id)
+);
+CREATE TABLE IF NOT EXISTS products (
+    asin TEXT PRIMARY KEY,
+    name TEXT,
+    brand TEXT,
+    rank TEXT,
+    category TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS reviews (
+    author_id TEXT NOT NULL,
+    asin TEXT NOT NULL,
+    review_id TEXT,
+    main_product_id TEXT,
+    product_category TEXT,
+    reviewer_name TEXT,
+    reviewer_profile_url TEXT,
+    product_url TEXT,
+    date TEXT,
+    title TEXT,
+    review TEXT,
+    ratings TEXT,
+    verified_purchase TEXT,
+    helpful TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    PRIMARY KEY (author_id, asin)
+);
+CREATE INDEX IF NOT EXISTS reviews_asin ON reviews (asin);
+CREATE INDEX IF NOT EXISTS reviews_review_id ON reviews (review_id);
+CREATE INDEX IF NOT EXISTS reviews_main_product_id ON reviews (main_product_id);
+CREATE TABLE IF NOT EXISTS watermarks (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    review_id TEXT,
+    review_date TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (kind, key)
+);
+CREATE TABLE IF NOT EXISTS crawl_status (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+REVIEW_COLUMNS = ('author_id', 'asin', 'review_id', 'main_product_id', 'product_category', 'reviewer_name',
+                  'reviewer_profile_url', 'product_url', 'date', 'title', 'review', 'ratings', 'verified_purchase',
+                  'helpful', 'start_time', 'end_time')
+
+# columns of the data frames of main.py and ProductMain.py stored in each reviews column
+AUTHOR_FRAME_COLUMNS = {
+    'author_id': 'author_id', 'review_id': 'review_id', 'main_product_id': 'product_id',
+    'product_category': 'product_category', 'reviewer_name': 'reviewer_name', 'product_url': 'product_url',
+    'date': 'date_review_posted', 'title': 'review_title', 'review': 'reviews', 'ratings': 'ratings',
+    'verified_purchase': 'verified_purchase', 'helpful': 'people_find_helpful', 'start_time': 'start',
+    'end_time': 'end',
+}
+PRODUCT_FRAME_COLUMNS = {
+    'author_id': 'subproduct_author_id', 'asin': 'subproduct_id', 'review_id': 'review_id',
+    'main_product_id': 'product_id', 'product_category': 'product_category', 'reviewer_name': 'reviewer_name',
+    'reviewer_profile_url': 'reviewer_profile_url', 'date': 'date', 'title': 'review_title', 'review': 'reviews',
+    'ratings': 'ratings', 'verified_purchase': 'verified_purchase', 'helpful': 'people_find_helpful',
+    'start_time': 'start_time', 'end_time': 'end_time',
+}
+
+# columns of a review set by the author profile it was read from, a sub-product row of the same review keeps them
+AUTHOR_OWNED_COLUMNS = ('main_product_id', 'product_category')
+
+_storage = None  # storage shared by the scrapers of a process
+
+
+def _now():
+    return datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
+
+
+def _value(value):
+    """
+    Value of a data frame cell as stored in sqlite (NaN as NULL, other types as text).
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def _upsert(table, columns, key, keep=()):
+    """
+    INSERT statement that keeps the stored values a new row does not have, and the stored values
+    of the columns in keep whenever there are some.
+    """
+    updates = ', '.join(f'{column} = COALESCE({table}.{column}, excluded.{column})' if column in keep
+                        else f'{column} = COALESCE(excluded.{column}, {table}.{column})'
+                        for column in columns if column not in key)
+    return (f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))}) '
+            f'ON CONFLICT ({", ".join(key)}) DO UPDATE SET {updates}')
+
+
+# set the crawl status of a key
+STATUS_UPSERT = _upsert('crawl_status', ('kind', 'key', 'status', 'updated_at'), ('kind', 'key'))
+
+# move the watermark of a key forward, never back to an older review
+WATERMARK_UPSERT = ('INSERT INTO watermarks (kind, key, review_id, review_date, updated_at) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (kind, key) DO UPDATE SET review_id = excluded.review_id, '
+                    'review_date = excluded.review_date, updated_at = excluded.updated_at '
+                    'WHERE watermarks.review_date IS NULL OR excluded.review_date > watermarks.review_date')
+
+
+def get_storage():
+    """
+    Storage shared by the scrapers of the process, opened on first use.
+
+    Returns
+    -------
+    storage : Storage object
+        database of Settings.STORAGE_PATH
+    """
+    global _storage
+    if _storage is None:
+        _storage = Storage()
+    return _storage
+
+
+class Storage:
+    """
+    SQLite database of authors, reviews, products and crawl status.
+
+    Attributes
+    ----------
+    path : string
+        path of the database file
+    connection : sqlite3 connection
+        connection to the database
+    """
+
+    def __init__(self, path=None):
+        """
+        Constructor for the storage, creates the tables if needed
+
+        Parameters
+        ----------
+        path : string
+            path of the database file, defaults to Settings.STORAGE_PATH
+        """
+        self.path = path or settings.STORAGE_PATH
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def done_keys(self, kind, keys):
+        """
+        Keys among the given ones that are done.
+
+        Parameters
+        ----------
+        kind : string
+            AUTHOR or PRODUCTS
+        keys : iterable of string
+            keys to look up
+
+        Returns
+        -------
+        done : set of string
+            keys whose status is done
+        """
+        keys = list(keys)
+        done = set()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.connection.execute(
+                f'SELECT key FROM crawl_status WHERE kind = ? AND status = ? AND key IN ({placeholders})',
+                [kind, DONE] + chunk)
+            done.update(key for key, in rows)
+        return done
+
+    def is_done(self, kind, key):
+        return bool(self.done_keys(kind, [key]))
+
+    def set_status(self, kind, key, status):
+        with self.connection:
+            self.connection.execute(STATUS_UPSERT, (kind, key, status, _now()))
+
+    def _save_reviews(self, frame, columns, defaults, keep=()):
+        rows = []
+        for record in frame.to_dict('records'):
+            row = dict(defaults)
+            row.update({column: _value(record.get(source)) for column, source in columns.items()})
+            if row.get('asin') is None:
+                row['asin'] = asin_from_url(row.get('product_url'))
+            if row['author_id'] is None or row['asin'] is None:
+                continue
+            rows.append(tuple(row.get(column) for column in REVIEW_COLUMNS))
+        self.connection.executemany(_upsert('reviews', REVIEW_COLUMNS, ('author_id', 'asin'), keep), rows)
+
+    def save_author(self, id, name, profile_url, products, frame):
+        """
+        Save an author, the main products listing it, its reviews and mark it done, in one transaction.
+        The first main product is the one of the author and of its reviews.
+
+        Parameters
+        ----------
+        id : string
+            unique id of reviewer
+        name : string
+            name of the author
+        profile_url : string
+            url of the author profile
+        products : list of tuple
+            id and category of each main product listing the author
+        frame : pandas data frame or None
+            reviews of the author (data frame of main.save_author)
+        """
+        product_id, product_category = products[0]
+        with self.connection:
+            self.connection.execute(
+                _upsert('authors', ('author_id', 'name', 'profile_url', 'main_product_id', 'product_category',
+                                    'updated_at'), ('author_id',)),
+                (id, _value(name), _value(profile_url), _value(product_id), _value(product_category), _now()))
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO author_products (author_id, product_id, product_category) VALUES (?, ?, ?)',
+                [(id, _value(product), _value(category)) for product, category in products])
+            if frame is not None:
+                self._save_reviews(frame, AUTHOR_FRAME_COLUMNS, {'reviewer_profile_url': _value(profile_url)})
+            self.connection.execute(STATUS_UPSERT, (AUTHOR, id, DONE, _now()))
+
+    def save_product(self, asin, details):
+        """
+        Save the details of a product.
+
+        Parameters
+        ----------
+        asin : string
+            ASIN of the product
+        details : dict
+            name, brand, rank and category of the product
+        """
+        with self.connection:
+            self.connection.execute(
+                _upsert('products', ('asin', 'name', 'brand', 'rank', 'category', 'updated_at'), ('asin',)),
+                (asin, _value(details.get('name')), _value(details.get('brand')), _value(details.get('rank')),
+                 _value(details.get('category')), _now()))
+
+    def get_product(self, asin, max_age=None):
+        """
+        Read the details of a product.
+
+        Parameters
+        ----------
+        asin : string
+            ASIN of the product
+        max_age : float
+            days the details are valid after they are saved, no limit if None or 0
+
+        Returns
+        -------
+        details : dict or None
+            name, brand, rank and category of the product, None if it is not saved or too old
+        """
+        row = self.connection.execute('SELECT name, brand, rank, category, updated_at FROM products WHERE asin = ?',
+                                      (asin,)).fetchone()
+        if row is None:
+            return None
+        name, brand, rank, category, updated_at = row
+        if max_age:
+            oldest = datetime.datetime.now() - datetime.timedelta(days=max_age)
+            if updated_at is None or updated_at < oldest.isoformat(sep=' ', timespec='seconds'):
+                return None
+        return {'name': name, 'brand': brand, 'rank': rank, 'category': category}
+
+    def get_watermark(self, kind, key):
+        """
+        Read the newest review seen of a product or an author.
+
+        Parameters
+        ----------
+        kind : string
+            'product' (key: ASIN) or 'author' (key: author id)
+        key : string
+            ASIN or author id
+
+        Returns
+        -------
+        watermark : tuple or None
+            id and date (YYYY-MM-DD) of the review, None if nothing is seen yet
+        """
+        return self.connection.execute('SELECT review_id, review_date FROM watermarks WHERE kind = ? AND key = ?',
+                                       (kind, key)).fetchone()
+
+    def save_watermarks(self, kind, watermarks):
+        """
+        Save the newest reviews seen of products or authors, unless older ones than the saved ones.
+
+        Parameters
+        ----------
+        kind : string
+            'product' or 'author'
+        watermarks : dict
+            (review id, date YYYY-MM-DD) by ASIN or author id
+        """
+        with self.connection:
+            self.connection.executemany(WATERMARK_UPSERT, [(kind, key, review_id, date, _now())
+                                                           for key, (review_id, date) in watermarks.items()])
+
+    def save_product_reviews(self, key, frame):
+        """
+        Save the reviews of the sub-products of an author and mark them done, in one transaction.
+
+        Parameters
+        ----------
+        key : string
+            id of the author
+        frame : pandas data frame or None
+            reviews of the sub-products (data frame of ProductMain.extract_product)
+        """
+        with self.connection:
+            if frame is not None:
+                self._save_reviews(frame, PRODUCT_FRAME_COLUMNS, {}, AUTHOR_OWNED_COLUMNS)
+            self.connection.execute(STATUS_UPSERT, (PRODUCTS, key, DONE, _now()))
+
+    def pending_authors(self, refresh=False):
+        """
+        Authors whose profile is scraped but not their sub-products.
+
+        Parameters
+        ----------
+        refresh : bool
+            all the authors whose profile is scraped, their sub-products done or not (INCREMENTAL)
+
+        Returns
+        -------
+        keys : list of string
+            ids of the authors
+        """
+        rows = self.connection.execute(
+            'SELECT a.key FROM crawl_status a LEFT JOIN crawl_status p ON p.kind = ? AND p.key = a.key '
+            'WHERE a.kind = ? AND a.status = ? AND (? OR p.status IS NULL OR p.status != ?) ORDER BY a.updated_at',
+            (PRODUCTS, AUTHOR, DONE, refresh, DONE))
+        return [key for key, in rows]
+
+    def author_products(self, id):
+        """
+        Products reviewed by an author, in the layout of the 'reviewers/' files read by ProductMain.py.
+
+        Parameters
+        ----------
+        id : string
+            id of the author
+
+        Returns
+        -------
+        df : pandas data frame
+            author_id, product_id, product_category, subproduct_id and product_url of each product
+        """
+        return pd.read_sql_query(
+            'SELECT r.author_id, a.main_product_id AS product_id, a.product_category, r.asin AS subproduct_id, '
+            'r.product_url FROM reviews r JOIN authors a ON a.author_id = r.author_id '
+            'WHERE r.author_id = ? AND r.product_url IS NOT NULL', self.connection, params=(id,))
+
+    def close(self):
+        self.connection.close()
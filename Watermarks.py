@@ -0,0 +1,190 @@
+"""
+Newest review seen per sub-product and per author, for the incremental
+refresh (INCREMENTAL).
+
+After the reviews of an author or of sub-products are saved, the id and
+date of the newest review of each author and each ASIN are kept in the
+watermarks table, the ones of the ASINs per author profile file (the same
+sub-product is saved in the file of each author listing it) (Storage.py), of the database of STORAGE_PATH with
+STORAGE=sqlite and of WATERMARK_PATH otherwise. With INCREMENTAL the
+authors and sub-products already scraped are visited again, their review
+lists sorted by most recent, and the scrapers stop at the first review
+that is the watermark or older than it, the same way they stop at the
+first review from another country. A daily refresh then only reads the
+reviews posted since the last run.
+"""
+
+import datetime
+import os
+
+import pandas as pd
+
+import Settings as settings
+import Storage as storage
+
+PRODUCT = 'product'  # watermark of a sub-product, key: ASIN
+AUTHOR = 'author'  # watermark of an author profile, key: author id
+
+
+def review_day(date):
+    """
+    Day of a review date as written by the scrapers ("May 1, 2020").
+
+    Returns
+    -------
+    day : string or None
+        date as YYYY-MM-DD, None if it can not be read
+    """
+    try:
+        return datetime.datetime.strptime(str(date).strip(), '%B %d, %Y').date().isoformat()
+    except ValueError:
+        return None
+
+
+def merge_saved(frame, path):
+    """
+    Reviews of a csv file refreshed with INCREMENTAL: the new ones followed by the ones saved
+    by the previous runs, each review once.
+
+    Parameters
+    ----------
+    frame : pandas data frame
+        reviews read by this run
+    path : string
+        csv file saved by a previous run
+
+    Returns
+    -------
+    frame : pandas data frame
+        reviews to write to the file. The saved rows without review id (files written before
+        the review ids were saved) can not be matched and are all kept
+    """
+    merged = pd.concat([frame, pd.read_csv(path, index_col=0)], ignore_index=True)
+    ids = merged['review_id']
+    return merged[ids.isna() | (ids == '') | ~ids.duplicated()]
+
+
+class Watermark:
+    """
+    Newest review seen of a sub-product or an author.
+
+    Attributes
+    ----------
+    review_id : string
+        id of the review
+    day : string or None
+        date of the review as YYYY-MM-DD
+    """
+
+    __slots__ = ('review_id', 'day')
+
+    def __init__(self, review_id, day):
+        self.review_id = review_id
+        self.day = day
+
+    def reached(self, review_id, date=None):
+        """
+        Check whether a review is the watermark or older, the reviews after it in a list sorted
+        by most recent are already saved.
+
+        Parameters
+        ----------
+        review_id : string
+            id of the review
+        date : string
+            date of the review ("May 1, 2020"), if known
+
+        Returns
+        -------
+        bool
+            True if the review is the watermark or was posted before its day
+        """
+        if review_id and review_id == self.review_id:
+            return True
+        day = review_day(date) if date else None
+        return day is not None and self.day is not None and day < self.day
+
+
+class Watermarks:
+    """
+    Watermarks of the sub-products and authors, read from and saved to the database.
+
+    Attributes
+    ----------
+    path : string
+        path of the database
+    """
+
+    def __init__(self, path=None):
+        """
+        Constructor for the watermarks, the database is opened on first use
+
+        Parameters
+        ----------
+        path : string
+            path of the database, defaults to Settings.STORAGE_PATH with STORAGE=sqlite and to
+            Settings.WATERMARK_PATH otherwise
+        """
+        self.path = path or (settings.STORAGE_PATH if settings.STORAGE == 'sqlite' else settings.WATERMARK_PATH)
+        self._database = None
+        self._pid = None
+
+    def _storage(self):
+        if self._pid != os.getpid():  # a sqlite connection must not be used across a fork
+            self._database = storage.Storage(self.path)
+            self._pid = os.getpid()
+        return self._database
+
+    @staticmethod
+    def _key(key, scope):
+        return str(key) if scope is None else f'{scope}/{key}'
+
+    def get(self, kind, key, scope=None):
+        """
+        Watermark of a sub-product or an author.
+
+        Parameters
+        ----------
+        kind : string
+            PRODUCT or AUTHOR
+        key : string
+            ASIN or author id
+        scope : string
+            author profile file of the sub-product
+
+        Returns
+        -------
+        watermark : Watermark object or None
+            None outside INCREMENTAL mode or if nothing is saved yet
+        """
+        if not settings.INCREMENTAL:
+            return None
+        row = self._storage().get_watermark(kind, self._key(key, scope))
+        return Watermark(*row) if row is not None else None
+
+    def update(self, kind, frame, key_column, id_column, date_column, scope=None):
+        """
+        Move the watermarks forward to the newest reviews of a saved data frame.
+
+        Parameters
+        ----------
+        kind : string
+            PRODUCT or AUTHOR
+        frame : pandas data frame or None
+            reviews just saved
+        key_column, id_column, date_column : string
+            columns of the ASIN or author id, the review id and the review date
+        scope : string
+            author profile file the sub-products are saved to
+        """
+        if frame is None or frame.empty:  # recorded on every run, the first INCREMENTAL run reads them
+            return
+        reviews = pd.DataFrame({'key': frame[key_column].astype(str), 'review_id': frame[id_column],
+                                'day': frame[date_column].map(review_day)}).dropna(subset=['day'])
+        # the first of the newest reviews of each key, the lists are sorted by most recent
+        newest = reviews.sort_values('day', ascending=False, kind='stable').drop_duplicates('key')
+        self._storage().save_watermarks(kind, {self._key(key, scope): (review_id, day) for key, review_id, day
+                                               in newest[['key', 'review_id', 'day']].values})
+
+
+watermarks = Watermarks()  # watermarks shared by the scrapers of a process
@@ -0,0 +1,159 @@
+"""
+Index of the author profiles to scrape, built from all the main product files.
+
+A reviewer listed under several main products is in the index once, with
+every main product that lists it, so its profile is scraped once and its
+reviews are saved for each of these main products (see main.save_author).
+The authors already saved for all their main products are removed from the
+index before scraping; with STORAGE=csv, an author saved for some of them
+only is copied from its saved file instead of being scraped again. With
+INCREMENTAL the saved authors stay in the index, to read their new reviews.
+"""
+
+import glob
+
+import pandas as pd
+
+import Settings as settings
+import Storage as storage
+
+
+class AuthorWork:
+    """
+    An author profile to scrape and the main products it is scraped for.
+
+    Attributes
+    ----------
+    id : string
+        unique id of the reviewer
+    url : string
+        url of the author profile
+    products : list of tuple
+        id and category of each main product listing the author, in the order of the input files
+    saved : string or None
+        file of the author already saved for one of its main products, STORAGE=csv only
+    """
+
+    __slots__ = ('id', 'url', 'products', 'saved')
+
+    def __init__(self, id, url):
+        self.id = id
+        self.url = url
+        self.products = []
+        self.saved = None
+
+    @property
+    def key(self):
+        # name of the journal of the author, the one of its first main product
+        return f'{self.id}_{self.products[0][0]}'
+
+
+def saved_file(id, product_id):
+    return f"reviewers\\{id}_{product_id}.csv"
+
+
+class WorkIndex:
+    """
+    Deduplicated authors of the main product files.
+
+    Attributes
+    ----------
+    authors : dict
+        AuthorWork per author id, in the order the authors are first listed
+    entries : int
+        number of author rows read from the input files
+    """
+
+    def __init__(self):
+        self.authors = {}
+        self.entries = 0
+
+    @classmethod
+    def from_files(cls, files):
+        """
+        Build the index of main product files.
+
+        Parameters
+        ----------
+        files : list of string
+            paths of the main product files
+
+        Returns
+        -------
+        index : WorkIndex object
+            authors of all the files, without the ones already saved
+        """
+        index = cls()
+        for file in sorted(files):
+            index.add(pd.read_csv(file))
+        index.remove_scraped()
+        print(index)
+        return index
+
+    def add(self, df):
+        """
+        Add the authors of a main product file.
+
+        Parameters
+        ----------
+        df : pandas data frame
+            list containing url of an author profile
+        """
+        try:
+            product_category = df['product_category'].dropna().unique()[0]
+            product_id = df['product_id'].dropna().unique()[0]
+        except IndexError:  # empty file
+            return
+        for id, url in df[['author_id', 'reviewer_profile_url']].dropna().drop_duplicates('author_id').values:
+            self.entries += 1
+            author = self.authors.get(id)
+            if author is None:
+                author = self.authors[id] = AuthorWork(id, url)
+            if (product_id, product_category) not in author.products:
+                author.products.append((product_id, product_category))
+
+    def remove_scraped(self):
+        """
+        Remove the authors already saved for all their main products, none with INCREMENTAL.
+        """
+        if settings.INCREMENTAL:
+            return
+        if settings.STORAGE == 'sqlite':
+            for id in storage.get_storage().done_keys(storage.AUTHOR, list(self.authors)):
+                del self.authors[id]
+            return
+        saved = set(glob.glob("reviewers\\*.csv"))
+        for id, author in list(self.authors.items()):
+            files = [saved_file(id, product_id) for product_id, _ in author.products]
+            done = [file in saved for file in files]
+            if all(done):
+                del self.authors[id]
+            elif any(done):
+                author.saved = files[done.index(True)]
+                author.products = [product for product, is_saved in zip(author.products, done) if not is_saved]
+
+    def pop_saved(self):
+        """
+        Remove the authors saved for some of their main products from the index.
+
+        Returns
+        -------
+        authors : list of AuthorWork
+            authors to copy from their saved file, see main.copy_author
+        """
+        authors = [author for author in self.authors.values() if author.saved is not None]
+        for author in authors:
+            del self.authors[author.id]
+        return authors
+
+    def __len__(self):
+        return len(self.authors)
+
+    def __iter__(self):
+        return iter(list(self.authors.values()))
+
+    def __str__(self):
+        copies = sum(author.saved is not None for author in self.authors.values())
+        return (f'{len(self.authors) - copies} author profiles to scrape and {copies} to copy, '
+                f'from {self.entries} entries of the main product files')
+
@@ -0,0 +1,372 @@
+"""
+Pool of browser worker processes.
+
+Each worker keeps one browser for its whole life and takes tasks from a
+shared queue: author profiles from 'main_product/' and the sub-products of
+the files of 'reviewers/'. A worker scraping an author with many reviews, or
+a file with several sub-products, hands the second half of what is left back
+to the queue whenever another worker is idle, so one prolific author does not
+keep the rest of the pool waiting. Each sub-product is journaled on its own
+(see Journal.py), so the next run resumes the work of a worker that crashed.
+Results are merged and saved by the parent process.
+Each worker paces its own requests with its RateController, so the pool
+sends up to POOL_SIZE times the rate of one worker.
+"""
+
+import datetime
+import multiprocessing
+import queue
+import time
+from collections import deque
+
+import pandas as pd
+
+import DriverSetup as setup
+import PageReady as ready
+from ProfileLoader import ProfileLoader
+import PageCache as pagecache
+import ProductMain
+import RateController as rate
+import Settings as settings
+import Watermarks as incremental
+from DriverTrace import tracer
+from Metrics import metrics
+import main as author_profile
+from AmazonUrls import rebase_url, review_id
+from Journal import Journal, PRODUCTS
+from ReviewBuffer import ReviewBuffer, AuthorReview
+
+AUTHOR = 'author'  # scrape an author profile
+DETAILS = 'details'  # scrape review pages handed over by another worker
+PRODUCT = 'product'  # scrape the sub-products of an author profile file
+SUBPRODUCTS = 'subproducts'  # scrape sub-products handed over by another worker
+
+
+def product_journal(name, subproduct):
+    """
+    Key of the journal of a sub-product of an author profile file (see Journal.py).
+    """
+    return f'{name}_{subproduct}'
+
+
+def read_detail(driver, position, link):
+    """
+    Load a review detail page and extract its fields.
+
+    Parameters
+    ----------
+    driver : selenium web driver object
+        object of webdriver.
+    position : int
+        position of the review on the author profile
+    link : string
+        url of the review detail page
+
+    Returns
+    -------
+    review: tuple
+        position and fields of the review, with start and end time
+    """
+    rate.controller.wait()
+    start = datetime.datetime.now()
+    driver.get(rebase_url(link))
+    fields = author_profile.read_review(driver)
+    fields['review_id'] = review_id(link)
+    fields['start'] = start
+    fields['end'] = datetime.datetime.now()
+    return position, fields
+
+
+def scrape_author(driver, task, tasks, idle):
+    """
+    Scrape an author profile, sharing its review pages with idle workers.
+
+    Returns
+    -------
+    payload: dict
+        name of the author, number of review chunks handed over and reviews scraped
+    """
+    _, key, url = task
+    id = key[1]
+    rate.controller.wait()
+    driver.get(rebase_url(url))
+    author_profile.save_images(driver, id)
+    ready.wait_for(driver, ready.PROFILE_CARDS)
+    loader = ProfileLoader(driver)
+    if not loader.load_all():
+        raise RuntimeError('profile could not be loaded')
+    name = author_profile.configuration.get_author_name(driver)
+
+    links = author_profile.configuration.get_review_links(driver)
+    if loader.max_cards:
+        links = links[:loader.max_cards]
+    watermark = incremental.watermarks.get(incremental.AUTHOR, id)
+    if watermark is not None:  # the reviews from the newest one saved by a previous run on are known
+        links = next((links[:index] for index, link in enumerate(links) if watermark.reached(review_id(link))),
+                     links)
+    links = deque(enumerate(links))
+    reviews = []
+    splits = 0
+    while links:
+        if idle.value > 0 and tasks.empty() and len(links) >= 2 * settings.STEAL_CHUNK:
+            stolen = [links.pop() for _ in range(len(links) // 2)]
+            tasks.put((DETAILS, key, stolen[::-1]))
+            splits += 1
+        review = read_detail(driver, *links.popleft())
+        if watermark is not None and watermark.reached(review[1]['review_id'], review[1]['date']):
+            break  # the watermark review is gone from the feed, this one and the next ones are saved
+        reviews.append(review)
+    return {'name': name, 'splits': splits, 'reviews': reviews}
+
+
+def read_product(browser, name, position, df):
+    """
+    Scrape the reviews of one sub-product, journaled on its own.
+
+    Returns
+    -------
+    frame: tuple
+        position of the sub-product in the file and its reviews
+    """
+    subproduct = str(df['subproduct_id'].iloc[0])
+    return position, ProductMain.extract_product(df, browser, product_journal(name, subproduct), name)
+
+
+def scrape_products(browser, task, tasks, idle):
+    """
+    Scrape the sub-products of an author profile file, sharing them with idle workers.
+
+    Returns
+    -------
+    payload: dict
+        number of sub-product chunks handed over and reviews of each sub-product
+    """
+    _, key, df = task
+    rows = deque((position, df.iloc[[position]]) for position in range(len(df)))
+    frames = []
+    splits = 0
+    while rows:
+        if idle.value > 0 and tasks.empty() and len(rows) >= 2:
+            stolen = [rows.pop() for _ in range(len(rows) // 2)]
+            tasks.put((SUBPRODUCTS, key, stolen[::-1]))
+            splits += 1
+        frames.append(read_product(browser, key[1], *rows.popleft()))
+    return {'splits': splits, 'frames': frames}
+
+
+def worker(index, tasks, results, idle):
+    """
+    Worker process: take tasks from the shared queue until a None task is received.
+
+    Parameters
+    ----------
+    index : int
+        index of the worker in the pool
+    tasks : multiprocessing queue
+        shared queue of tasks
+    results : multiprocessing queue
+        queue of results read by the parent process
+    idle : multiprocessing value
+        number of workers waiting for a task
+    """
+    browser = setup.DriverSetup()  # one browser for the life of the worker
+    driver = browser.driver
+    while True:
+        with idle.get_lock():
+            idle.value += 1
+        task = tasks.get()
+        with idle.get_lock():
+            idle.value -= 1
+        if task is None:
+            break
+
+        kind, key = task[0], task[1]
+        failed = False
+        try:
+            if kind == AUTHOR:
+                payload = scrape_author(driver, task, tasks, idle)
+            elif kind == DETAILS:
+                payload = {'reviews': [read_detail(driver, *link) for link in task[2]]}
+            elif kind == PRODUCT:
+                payload = scrape_products(browser, task, tasks, idle)
+            else:
+                payload = {'frames': [read_product(browser, key[1], *row) for row in task[2]]}
+        except Exception as exc:
+            print(f'worker {index} failed on {key}', exc)
+            payload = None
+            failed = True
+            driver = browser.restart()
+        results.put((index, kind, key, payload, failed))
+    browser.quit()
+    author_profile.images.close_downloader()
+    if settings.PAGE_CACHE:
+        print(f'worker {index} page cache', pagecache.cache.stats())
+    if settings.PRODUCT_CATALOG:
+        print(f'worker {index} product catalog', ProductMain.catalog.stats())
+    metrics.finish(f'worker{index}')
+    tracer.close()
+
+
+class WorkerPool:
+    """
+    Pool of browser worker processes fed by a shared queue.
+
+    Attributes
+    ----------
+    size : int
+        number of worker processes
+    """
+
+    def __init__(self, size=None):
+        """
+        Constructor for the pool
+
+        Parameters
+        ----------
+        size : int
+            number of worker processes
+        """
+        self.size = size or settings.POOL_SIZE
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.idle = multiprocessing.Value('i', 0)
+        self.workers = []
+        self.done = [0] * self.size  # tasks finished per worker
+        self.reviews = [0] * self.size  # reviews scraped per worker
+        self.pending = {}
+        self.started = time.time()
+
+    def queue_depth(self):
+        try:
+            return self.tasks.qsize()
+        except NotImplementedError:  # not available on macOS
+            return -1
+
+    def stats(self):
+        """
+        Pool size, queue depth and throughput of each worker.
+
+        Returns
+        -------
+        stats: dict
+            current stats of the pool
+        """
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            'pool_size': self.size,
+            'alive': sum(process.is_alive() for process in self.workers),
+            'idle': self.idle.value,
+            'queue_depth': self.queue_depth(),
+            'pending': len(self.pending),
+            'workers': [{'tasks': done, 'reviews': reviews, 'tasks_per_min': round(60 * done / elapsed, 2),
+                         'reviews_per_min': round(60 * reviews / elapsed, 2)}
+                        for done, reviews in zip(self.done, self.reviews)],
+        }
+
+    def add_authors(self, index):
+        """
+        Queue the authors of the work index.
+
+        Parameters
+        ----------
+        index: WorkIndex object
+            authors to scrape and the main products listing them
+        """
+        for author in index:
+            key = (AUTHOR, author.id)
+            self.pending[key] = {'expected': None, 'received': 0, 'name': "", 'reviews': [], 'url': author.url,
+                                 'products': author.products}
+            self.tasks.put((AUTHOR, key, author.url))
+
+    def add_products(self, name, df):
+        """
+        Queue the sub-products of an author profile.
+
+        Parameters
+        ----------
+        name: string
+            name of the author profile file, id of the author with STORAGE=sqlite
+        df: pandas data frame
+            sub-products of the author
+        """
+        key = (PRODUCT, name)
+        self.pending[key] = {'expected': None, 'received': 0, 'frames': {},
+                             'subproducts': [str(subproduct) for subproduct in df['subproduct_id']]}
+        if df.empty:
+            self.complete(key)
+            return
+        self.tasks.put((PRODUCT, key, df))
+
+    def receive(self, index, kind, key, payload, failed=False):
+        """
+        Merge a result and save the author or file once all its parts are in. An author or file
+        with a failed task is not saved, it will be queued again on the next run (the sub-products
+        resume from their journals).
+        """
+        self.done[index] += 1
+        state = self.pending.get(key)
+        if state is None:  # the author or file failed earlier, it will be queued again on the next run
+            return
+        state['received'] += 1
+        if failed or payload is None:
+            print(f'{key[1]} is not saved, some of its {"sub-products" if key[0] == PRODUCT else "reviews"} failed')
+            self.pending.pop(key)
+            return
+        if key[0] == PRODUCT:
+            for position, frame in payload['frames']:
+                state['frames'][position] = frame
+                self.reviews[index] += 0 if frame is None else len(frame)
+            if kind == PRODUCT:
+                state['expected'] = 1 + payload['splits']
+        else:
+            state['reviews'].extend(payload['reviews'])
+            self.reviews[index] += len(payload['reviews'])
+            if kind == AUTHOR:
+                state['expected'] = 1 + payload['splits']
+                state['name'] = payload['name']
+        if state['received'] == state['expected']:
+            self.complete(key)
+
+    def complete(self, key):
+        state = self.pending.pop(key)
+        if key[0] == PRODUCT:
+            frames = [state['frames'][position] for position in sorted(state['frames'])
+                      if state['frames'][position] is not None]
+            ProductMain.save_data(pd.concat(frames) if frames else None, key[1])
+            for subproduct in state['subproducts']:
+                Journal(PRODUCTS, product_journal(key[1], subproduct)).finish()
+            return
+
+        id = key[1]
+        reviews = ReviewBuffer(AuthorReview)
+        for _, review in sorted(state['reviews'], key=lambda review: review[0]):
+            author_profile.add_review(reviews, id, review, review['start'], review['end'], review['review_id'])
+        author_profile.save_author(reviews, id, state['name'], state['products'], state['url'])
+
+    def run(self):
+        """
+        Start the workers and wait until every queued author and file is saved.
+        """
+        self.started = time.time()
+        self.workers = [multiprocessing.Process(target=worker, args=(index, self.tasks, self.results, self.idle))
+                        for index in range(self.size)]
+        for process in self.workers:
+            process.start()
+
+        last_stats = time.time()
+        while self.pending:
+            try:
+                self.receive(*self.results.get(timeout=settings.POOL_STATS_EVERY))
+            except queue.Empty:
+                if not any(process.is_alive() for process in self.workers):
+                    print('all workers stopped')
+                    break
+            if time.time() - last_stats >= settings.POOL_STATS_EVERY:
+                print(self.stats())
+                last_stats = time.time()
+
+        for _ in self.workers:
+            self.tasks.put(None)
+        for process in self.workers:
+            process.join()
+        print(self.stats())
@@ -4,14 +4,32 @@ Required files are read from 'main_product/' folder in 'data_scraper_v2'
 Contents are saved as CSV in 'reviewers/'
 """
 
-import time
+import asyncio
 import datetime
-import random
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import glob
 import AuthorProfileConfig as config
 import DriverSetup as setup
-from selenium.webdriver.common.keys import Keys
+import PageReady as ready
+from ProfileLoader import ProfileLoader
+import RateController as rate
+import HttpFetcher as fetch
+import ImageDownloader as images
+from DriverTrace import tracer
+from Metrics import metrics
+import PageCache as pagecache
+import ParquetOutput as parquet
+from ReviewBuffer import ReviewBuffer, AuthorReview
+from WorkIndex import WorkIndex, saved_file
+import Settings as settings
+import Storage as storage
+import Watermarks as incremental
+from AmazonUrls import rebase_url, review_id
+from CrawlEngine import CrawlEngine
+from Journal import Journal, AUTHORS
+from PageParser import PageParser
+import WorkerPool as pool
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
 import os
@@ -20,231 +38,511 @@ from selenium.common.exceptions import TimeoutException
 
 from platform import system  # to check os
 
-from urllib.request import urlretrieve  # to download image
+configuration = config.AuthorConfiguration()  # holds no state, shared by all the scrapes of the process
 
-configuration = None
+parser = PageParser()  # reads the review pages fetched over http
 
 os = system()  # get the os
 
-amazon_reviews = {}
 
+def add_review(reviews, id, fields, start, end, review_id=""):
+    """
+    Add a review to the reviews of an author
 
-# dictionary to store fields
-def initialize_dict():
-    global amazon_reviews
-    amazon_reviews = {
-        'author_id': [],
-        'date_review_posted': [],
-        'review_title': [],
-        'reviews': [],
-        'verified_purchase': [],
-        'people_find_helpful': [],
-        'ratings': [],
-        'product_url': [],
-        'start': [],
-        'end': []
-    }
+    Parameters
+    ----------
+    reviews: ReviewBuffer object
+        reviews of the author
+    id: string
+        unique id of reviewer
+    fields: dict
+        date, title, ratings, review, verified_purchase, helpful and url of the review
+    start: datetime
+        start time for extracting a review
+    end: datetime
+        time extraction process ends for a review
+    review_id: string
+        id of the review
+    """
+    reviews.add(author_id=id, date_review_posted=fields['date'], review_title=fields['title'],
+                ratings=fields['ratings'], reviews=fields['review'], verified_purchase=fields['verified_purchase'],
+                people_find_helpful=fields['helpful'], product_url=fields['url'], start=start, end=end,
+                review_id=review_id)
 
 
-def add_to_dict(id, date, title, ratings, review, verified_purchase, helpful, url, start, end):
+def resume_author(reviews, id, key):
     """
-    Store data to dictionary
+    Open the journal of an author and add the reviews journaled by a previous run
 
-    Attributes
+    Parameters
     ----------
+    reviews: ReviewBuffer object
+        reviews of the author
     id: string
         unique id of reviewer
-    date: string
-        date the review was posted
-    title: string
-        title related to review
-    ratings: strings
-        ratings related to reviews
-    review: string
-        review posted by author
-    verified_purchase: string
-        whether it's a verified purchased or not
-    helpful: string
-        number of people found the review helpful
-    url: string
-        product url of the review
+    key: string
+        name of the journal (see WorkIndex.AuthorWork.key)
+
+    Returns
+    -------
+    journal: Journal object or None
+        journal of the author, None if journaling is off
+    done: set of string
+        ids of the reviews already extracted
+    """
+    done = set()
+    journal = Journal(AUTHORS, key) if settings.JOURNAL else None
+    if journal is None:
+        return journal, done
+    for entry in journal.entries():
+        add_review(reviews, id, entry, entry['start'], entry['end'], entry['review_id'])
+        done.add(entry['review_id'])
+    if done:
+        print(f'{len(done)} reviews resumed from the journal')
+    return journal, done
+
+
+def store_review(reviews, journal, id, link, fields, start, end):
+    """
+    Add the fields of a review to the reviews and to the journal of the author
+
+    Parameters
+    ----------
+    reviews: ReviewBuffer object
+        reviews of the author
+    journal: Journal object or None
+        journal of the author
+    id: string
+        unique id of reviewer
+    link: string
+        url of the review detail page
+    fields: dict
+        date, title, ratings, review, verified_purchase, helpful and url of the review
     start: datetime
         start time for extracting a review
     end: datetime
         time extraction process ends for a review
     """
-
-    amazon_reviews['author_id'].append(id)
-    amazon_reviews['date_review_posted'].append(date)
-    amazon_reviews['review_title'].append(title)
-    amazon_reviews['ratings'].append(ratings)
-    amazon_reviews['reviews'].append(review)
-    amazon_reviews['verified_purchase'].append(verified_purchase)
-    amazon_reviews['people_find_helpful'].append(helpful)
-    amazon_reviews['product_url'].append(url)
-    amazon_reviews['start'].append(start)
-    amazon_reviews['end'].append(end)
+    add_review(reviews, id, fields, start, end, review_id(link))
+    if journal is not None:
+        journal.append(dict(fields, review_id=review_id(link), start=start, end=end))
 
 
-def extract_author_profile(df):
+def extract_author_profile(index, browser=None):
     """
-    extract information (all reviews) about an author
+    extract information (all reviews) about the authors of the work index, each one once
 
     Parameters
     ----------
-    df: pandas data frame
-        list containing url of an author profile
+    index: WorkIndex object
+        authors to scrape and the main products listing them
+    browser: DriverSetup object
+        browser session to reuse, if None one is started and quit at the end
     """
-    global configuration
-    files = glob.glob("reviewers\*.csv")  # contents for author profile
-    files = list(map(lambda x: x.split("\\")[1].split('_')[0], files))  # extracts the author_id from the file name
-    df = df[~df['author_id'].isin(files)]  # remove the authors that are al ready scraped
-    product_category = df['product_category'].dropna().unique()[0]
-    product_id = df['product_id'].unique()[0]
-
-    driver = setup.DriverSetup().driver
+    own_browser = browser is None
+    if own_browser:
+        browser = setup.DriverSetup()
+    driver = browser.get_driver()
     # load the url from csv
 
-    for url in df['reviewer_profile_url'].dropna().unique():
+    journal = None
+    try:
+        for author in index:
+            id, url = author.id, author.url
+            print(url)
+            print(id)
+
+            # reviews of the author, with the ones extracted by a previous run if any
+            reviews = ReviewBuffer(AuthorReview)
+            journal, done = resume_author(reviews, id, author.key)
+            # newest review saved by a previous run, the feed is read up to it (INCREMENTAL)
+            watermark = incremental.watermarks.get(incremental.AUTHOR, id)
+
+            # url = 'https://www.amazon.ca/gp/profile/amzn1.account.AE3X4B27XTAPBJLVXZX4YVM6KPBQ/ref=cm_cr_dp_d_gw_tr?ie=UTF8'
+            rate.controller.wait()
+            driver.get(rebase_url(url))
+
+            rate.controller.record(None, ready.wait_for(driver, ready.PROFILE) == ready.BLOCKED)
+
+            save_images(driver, id)
+
+            ready.wait_for(driver, ready.PROFILE_CARDS)
+
+            # get author name
+            author_name = configuration.get_author_name(driver)
+            print(author_name)
+
+            # review cards for each review, the feed keeps loading while the first ones are scraped
+            loader = ProfileLoader(driver)
+            broken = False  # a tab could not be closed
+            if settings.DETAIL_MODE != 'tab':
+                read_reviews_in_page(driver, loader, reviews, journal, id, done, watermark)
+            else:
+                for review in loader.cards():
+                    # check for more_reviews hyperlink to expand the review
+                    # without that, the review can not be extracted completely
+                    path = 'div.a-section.profile-at-content > p > a'
+                    try:
+                        more_review = review.find_element_by_css_selector(path)
+                    except NoSuchElementException:
+                        print('Unable to locate the element (path can be wrong)')
+                        break
+                    link = more_review.get_attribute('href')
+                    if watermark is not None and watermark.reached(review_id(link)):
+                        break
+                    if review_id(link) in done:
+                        continue
+
+                    # if review is expanded then extract all the required information
+                    if more_review:
+                        rate.controller.wait()  # pace the review detail pages
+                        start = datetime.datetime.now()
+                        current_window = driver.current_window_handle  # get the current window
+
+                        with metrics.phase('tab_open'):
+                            # open the review in a new tab, with the resources blocked like the first one
+                            browser.open_tab(link)
+
+                        # extract the information once the review is rendered
+                        fields = read_review(driver)
+                        # the watermark review may be gone from the feed, the ones older than it are saved
+                        older = watermark is not None and watermark.reached(review_id(link), fields['date'])
+
+                        end = datetime.datetime.now()
+                        # store to the reviews and journal
+                        if not older:
+                            store_review(reviews, journal, id, link, fields, start, end)
+                        with metrics.phase('tab_close'):
+                            driver.close()  # closes new tab
+                            try:
+                                WebDriverWait(driver, 10).until(ec.number_of_windows_to_be(1))
+                            except TimeoutException:
+                                print('time out occurred')
+                                broken = True
+                                break
+                            driver.switch_to.window(current_window)
+                        if older:
+                            break
+
+            if loader.failed or broken:
+                if journal is not None:
+                    journal.close()  # kept, the next run resumes the author from it
+                driver = browser.restart()  # the session is broken, continue with a new one
+                continue
+
+            browser.collect_blocked()  # drain the performance log of the driver
+
+            # if reviews are present then save to csv file.
+            if not save_author(reviews, id, author_name, author.products, url):
+                if journal is not None:
+                    journal.close()  # kept, the next run resumes the author from it
+                driver = browser.restart()
+                continue
+            if journal is not None:
+                journal.finish()  # the reviews are in the csv file now
+    finally:
+        if journal is not None:
+            journal.close()
+        if own_browser:
+            browser.quit()
+
+
+def save_images(driver, id):
+    """
+    Queue the download of the profile and cover pictures of the author on the current page
+    (see ImageDownloader.py)
 
-        print(url)
+    Parameters
+    ----------
+    driver : selenium web driver object
+        object of webdriver.
+    id: string
+        unique id of reviewer
+    """
+    # profile picture
+    img = configuration.get_profile_image(driver)
+    if not img:
+        rate.controller.wait()
+        driver.refresh()
+        ready.wait_for(driver, ready.PROFILE)
+        img = configuration.get_profile_image(driver)
+    images.get_downloader().submit(id, images.PROFILE, img)
 
-        id = df.author_id[df['reviewer_profile_url'].isin([url])].to_list()[0]  # get the author id
-        print(id)
+    # cover picture
+    img = configuration.get_cover_image(driver)
+    images.get_downloader().submit(id, images.COVER, img)
 
-        # id = url.split('/')[-2]
-        # id = id.split('.')[-1]
 
-        # initialize the dictionary
-        initialize_dict()
+def read_review(driver):
+    """
+    Extract the fields of the review detail page loaded in the driver once it is
+    rendered, refreshing once if it is not. The rate controller is told whether
+    the page was a captcha or error page.
 
-        # url = 'https://www.amazon.ca/gp/profile/amzn1.account.AE3X4B27XTAPBJLVXZX4YVM6KPBQ/ref=cm_cr_dp_d_gw_tr?ie=UTF8'
-        driver.get(url)
+    Parameters
+    ----------
+    driver : selenium web driver object
+        object of webdriver.
 
-        # setup all configurations defined in AmazonConfig file
-        configuration = config.AuthorConfiguration()
+    Returns
+    -------
+    fields: dict
+        date, title, ratings, review, verified_purchase, helpful and url of the review
+    """
+    state = ready.wait_for(driver, ready.REVIEW_DATE)
+    if state == ready.READY:
+        fields = configuration.get_review_details(driver)
+        if fields['date']:
+            rate.controller.success()
+            return fields
+    rate.controller.record(None, state == ready.BLOCKED)
+    rate.controller.wait()
+    driver.refresh()
+    ready.wait_for(driver, ready.REVIEW_DATE)
+    return configuration.get_review_details(driver)
+
+
+def read_reviews_in_page(driver, loader, reviews, journal, id, done, watermark=None):
+    """
+    Read the review detail pages of the cards of an author profile without opening tabs and
+    add them to the reviews of the author. The pages are fetched DETAIL_BATCH at a time from inside the
+    profile page (DETAIL_MODE 'fetch') or over an http session with the cookies of the
+    browser (DETAIL_MODE 'http'). The pages that can not be read are tried once more at the end.
 
-        # profile picture
-        img = configuration.get_profile_image(driver)
-        if not img:
-            driver.refresh()
-            time.sleep(2)
-            img = configuration.get_profile_image(driver)
-        urlretrieve(img, f'images\profile\{id}.jpg')
-
-        # cover picture
-        img = configuration.get_cover_image(driver)
-        urlretrieve(img, f'images\cover\{id}.jpg')
-
-        # scroll till the end to load all the reviews
-        # idea: scroll till the end, then scroll up a little to load otherwise it won't load
-        # all the reviews. Do this recursively till the page height is fixed
-        time.sleep(3)
-        try:
-            SCROLL_PAUSE_TIME = 0.5
-            # get the height of the page
-            last_height = driver.execute_script("return document.body.scrollHeight")
-
-            while True:
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")  # scroll to bottom
-                time.sleep(SCROLL_PAUSE_TIME)
-                height = driver.execute_script("return document.body.scrollHeight")  # get the height of page
-                driver.execute_script(f"window.scrollTo(0,{height - 10});")  # scroll a little and wait to load reviews
-                time.sleep(2)
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")  # scroll to end
-                new_height = driver.execute_script("return document.body.scrollHeight")  # get the final page after
-                # loading reviews
-                if new_height == last_height:  # check if height of pages are similar stop
-                    break
-                last_height = new_height  # change the old page height to new height
-        except Exception as exc:
-            print(exc)
-            print('not able to load')
-            driver.quit()
-
-        # scraping reviews
-        driver.execute_script("window.scrollTo(0,0);")
-        time.sleep(3)
-
-        # get author name
-        author_name = configuration.get_author_name(driver)
-        print(author_name)
-
-        path = '//div[@id="profile-at-card-container"]//div[@class="a-row"]'  # review cards for each review
-        try:
-            reviews = driver.find_elements_by_xpath(path)
-        except NoSuchElementException:
-            print('No such element found, re-look the path')
-            driver.quit()
-            return
-        for review in reviews:
-            time.sleep(random.randint(4, 7))
-            # check for more_reviews hyperlink to expand the review
-            # without that, the review can not be extracted completely
-            path = 'div.a-section.profile-at-content > p > a'
-            try:
-                more_review = review.find_element_by_css_selector(path)
-            except NoSuchElementException:
-                print('Unable to locate the element (path can be wrong)')
+    Parameters
+    ----------
+    driver : selenium web driver object
+        object of webdriver, with the author profile loaded.
+    loader : ProfileLoader object
+        feed of the author profile
+    reviews: ReviewBuffer object
+        reviews of the author
+    journal: Journal object or None
+        journal of the author
+    id: string
+        unique id of reviewer
+    done: set of string
+        ids of the reviews already extracted, skipped
+    watermark: Watermark object or None
+        newest review saved by a previous run (INCREMENTAL), the cards from it on are not read
+    """
+    fetcher = None
+    if settings.DETAIL_MODE == 'http':
+        fetcher = fetch.HttpFetcher(pool_size=settings.DETAIL_BATCH)
+        fetcher.use_cookies(driver.get_cookies())
+
+    failed = []
+    batch = []
+    older = False  # a review older than the watermark was read
+    for link in loader.links():
+        if watermark is not None and link and watermark.reached(review_id(link)):
+            break  # the feed is sorted by most recent, the next reviews are saved
+        if link and review_id(link) not in done:
+            batch.append(link)
+        if len(batch) == settings.DETAIL_BATCH:
+            older = read_batch(driver, fetcher, batch, reviews, journal, id, watermark, failed)
+            batch = []
+            if older:
                 break
+    if batch and not older:
+        read_batch(driver, fetcher, batch, reviews, journal, id, watermark, failed)
+    for start in range(0, len(failed), settings.DETAIL_BATCH):
+        retry = failed[start:start + settings.DETAIL_BATCH]
+        metrics.count('retries', 'review_detail', len(retry))
+        unread = []
+        read_batch(driver, fetcher, retry, reviews, journal, id, watermark, unread)
+        for link in unread:
+            print('unable to read the review', link)
+    if fetcher is not None:
+        fetcher.close()
+
+
+def read_batch(driver, fetcher, links, reviews, journal, id, watermark=None, failed=None):
+    """
+    Fetch review detail pages concurrently and add their fields to the reviews of the author
 
-            # if review is expanded then extract all the required information
-            if more_review:
-                start = datetime.datetime.now()
-                current_window = driver.current_window_handle  # get the current window
+    Parameters
+    ----------
+    driver : selenium web driver object
+        object of webdriver, with the author profile loaded.
+    fetcher : HttpFetcher object or None
+        http session, None to fetch from inside the page
+    links : list of string
+        urls of the review detail pages
+    reviews: ReviewBuffer object
+        reviews of the author
+    journal: Journal object or None
+        journal of the author
+    id: string
+        unique id of reviewer
+    watermark: Watermark object or None
+        newest review saved by a previous run (INCREMENTAL), the reviews older than it are not added
+    failed: list of string
+        the urls of the pages that could not be read are appended to it
+
+    Returns
+    -------
+    older: bool
+        True if a review older than the watermark was read, the next ones of the feed are saved
+    """
+    start = datetime.datetime.now()
+    if fetcher is None:
+        for _ in links:
+            rate.controller.wait()  # pace the review detail pages
+        pages = configuration.fetch_review_details(driver, links)
+        for _, blocked in pages:
+            rate.controller.record(None, blocked)
+    else:
+        # the fetcher paces the requests and tells the rate controller about captchas
+        with ThreadPoolExecutor(len(links)) as executor:
+            htmls = list(executor.map(lambda link: fetcher.get_page(link, fetch.REVIEW_DETAIL), links))
+        pages = [(parser.get_review_details(parser.parse(html, link)) if html else None, False)
+                 for link, html in zip(links, htmls)]
+    end = datetime.datetime.now()
+
+    for link, (fields, _) in zip(links, pages):
+        if fields is None or not fields['date']:
+            if failed is not None:
+                failed.append(link)
+            continue
+        if watermark is not None and watermark.reached(review_id(link), fields['date']):
+            return True  # the watermark review is gone from the feed, this one and the next ones are saved
+        store_review(reviews, journal, id, link, fields, start, end)
+    return False
+
+
+@metrics.timed('save.author')
+def save_author(reviews, id, author_name, products, profile_url=None):
+    """
+    Save the reviews of an author to a csv file per main product listing it (or
+    to the database with STORAGE=sqlite), and to the Parquet output with PARQUET, if any
 
-                if os == 'Windows' or os == 'Linux':
-                    more_review.send_keys(Keys.CONTROL + Keys.ENTER)  # open link in new tab keyboard shortcut
-                else:
-                    more_review.send_keys(Keys.COMMAND + Keys.ENTER)
-                WebDriverWait(driver, 10).until(ec.number_of_windows_to_be(2))
-                driver.switch_to.window(driver.window_handles[1])  # new tab is at index 1
-
-                time.sleep(random.randint(4, 7))
-                # extract info
-
-                date = configuration.get_posted_date(driver)
-                if not date:
-                    driver.refresh()
-                    time.sleep(2)
-                    date = configuration.get_posted_date(driver)
-                # extract the information
-                title = configuration.get_title(driver)
-                ratings = configuration.get_ratings(driver)
-                review = configuration.get_reviews(driver)
-                verified_purchase = configuration.is_verified_purchase(driver)
-                helpful = configuration.get_helpful_count(driver)
-                url = configuration.get_product_url(driver)
-
-                end = datetime.datetime.now()
-                # store to dictionary
-                add_to_dict(id, date, title, ratings, review, verified_purchase, helpful, url, start, end)
-                time.sleep(3)
-                driver.close()  # closes new tab
-                try:
-                    WebDriverWait(driver, 10).until(ec.number_of_windows_to_be(1))
-                except TimeoutException:
-                    print('time out occurred')
-                    return
-                driver.switch_to.window(current_window)
-
-        # if reviews are present then save to csv file.
-        if len(amazon_reviews['reviews']) > 0:
-            frame = pd.DataFrame.from_dict(amazon_reviews)
-            frame['reviewer_name'] = author_name
-            frame['product_category'] = product_category
-            frame['product_id'] = product_id
+    Parameters
+    ----------
+    reviews: ReviewBuffer object
+        reviews of the author
+    id: string
+        unique id of reviewer
+    author_name: string
+        name of the author
+    products: list of tuple
+        id and category of each main product listing the author
+    profile_url: string
+        url of the author profile
+
+    Returns
+    -------
+    bool
+        False if a file could not be written
+    """
+    product_id, product_category = products[0]
+    frame = reviews.frame(reviewer_name=author_name, product_category=product_category, product_id=product_id)
+    if frame is None:
+        return True
+    if settings.STORAGE == 'sqlite':
+        storage.get_storage().save_author(id, author_name, profile_url, products, frame)
+        print(f'{id} is saved')
+    if not save_frames(frame, id, products):
+        return False
+    incremental.watermarks.update(incremental.AUTHOR, frame, 'author_id', 'review_id', 'date_review_posted')
+    return True
+
+
+def save_frames(frame, id, products):
+    """
+    Write the reviews of an author once per main product listing it: a csv file
+    each (not with STORAGE=sqlite), and a partition each of the Parquet output with PARQUET
 
+    Parameters
+    ----------
+    frame: pandas data frame
+        reviews of the author
+    id: string
+        unique id of reviewer
+    products: list of tuple
+        id and category of each main product listing the author
+
+    Returns
+    -------
+    bool
+        False if a file could not be written
+    """
+    for product_id, product_category in products:
+        frame['product_category'] = product_category
+        frame['product_id'] = product_id
+        if settings.STORAGE != 'sqlite':
+            import os
             try:
-                frame.to_csv(f"reviewers\{id}_{product_id}.csv")
+                path = saved_file(id, product_id)
+                if settings.INCREMENTAL and os.path.exists(path):  # keep the reviews of the previous runs
+                    incremental.merge_saved(frame, path).to_csv(path)
+                else:
+                    frame.to_csv(path)
                 print(f'Author{product_id}.csv is saved')
             except Exception as exp:
                 print("Permission denied, if the file already exist then delete first")
                 print(exp)
-                driver.quit()
-                return
+                return False
+        if settings.PARQUET:
+            parquet.get_output().write(parquet.AUTHORS, frame)
+    return True
+
+
+def copy_author(author):
+    """
+    Save an author for the main products it is not saved for yet from the csv
+    file saved for another one, without scraping it again
+
+    Parameters
+    ----------
+    author: AuthorWork object
+        author with a saved file (see WorkIndex.pop_saved)
+    """
+    print(f'{author.id} is copied from {author.saved}')
+    save_frames(pd.read_csv(author.saved, index_col=0), author.id, author.products)
 
-    driver.quit()
+
+async def extract_author_profiles_async(index):
+    """
+    extract information (all reviews) about all the authors of all the main products
+    concurrently, with the asyncio crawl engine
+
+    Parameters
+    ----------
+    index: WorkIndex object
+        authors to scrape and the main products listing them
+
+    Returns
+    -------
+    left: list of AuthorWork
+        authors that need the browser (their feed loads more cards by scrolling or a page
+        could not be fetched) or that could not be saved
+    """
+    engine = CrawlEngine()
+    left = []
+
+    async def crawl(work):
+        return work, await engine.crawl_author(rebase_url(work.url),
+                                               incremental.watermarks.get(incremental.AUTHOR, work.id))
+
+    # save each author as soon as all its pages are fetched
+    for task in asyncio.as_completed([crawl(work) for work in index]):
+        work, author = await task
+        id = work.id
+        if author is None:
+            print(f'{id} needs the browser')
+            left.append(work)
+            continue
+        for kind in (images.PROFILE, images.COVER):
+            images.get_downloader().submit(id, kind, author[f'{kind}_image'])
+
+        reviews = ReviewBuffer(AuthorReview)
+        for review in author['reviews']:
+            add_review(reviews, id, review, review['start'], review['end'], review['review_id'])
+        if not save_author(reviews, id, author['name'], work.products, work.url):
+            left.append(work)
+    engine.close()
+    return left
 
 
 def main():
@@ -252,11 +550,35 @@ def main():
     Main function
     """
 
-    files = glob.glob(r'F:\GuideAnalytics\data_scraper_v2\main_product\*.csv')
+    # each author once, with all the main products listing it
+    metrics.start()
+    index = WorkIndex.from_files(glob.glob(settings.MAIN_PRODUCT_FILES))
+
+    try:
+        for author in index.pop_saved():
+            copy_author(author)
+        if settings.ENGINE == 'async':
+            left = asyncio.run(extract_author_profiles_async(index))
+            if left:
+                print(f'{len(left)} authors left to the browser')
+                extract_author_profile(left)
+            return
+        if settings.ENGINE == 'pool':
+            workers = pool.WorkerPool()
+            workers.add_authors(index)
+            workers.run()
+            return
 
-    for file in files:
-        df = pd.read_csv(file)
-        extract_author_profile(df)  # extract the author_profile
+        browser = setup.DriverSetup()  # one browser session for all the authors
+        extract_author_profile(index, browser)  # extract the author_profile
+        browser.quit()
+    finally:
+        parquet.close_output()  # write the footers of the parquet files
+        images.close_downloader()  # wait for the pictures still downloading
+        metrics.finish()
+        tracer.close()
+        if settings.PAGE_CACHE:
+            print('page cache', pagecache.cache.stats())
 
     # extract_author_profile(['https://www.amazon.ca/gp/profile/amzn1.account.AGH7OYWNBYDRL7AN5LTSZ3HIK6LQ/ref=cm_cr_arp_d_gw_btm?ie=UTF8'])
 
@@ -0,0 +1,65 @@
+"""
+Tests of the incremental refresh when the watermark review is not in the feed of the author any more.
+"""
+
+import asyncio
+
+from CrawlEngine import CrawlEngine
+from PageParser import PROFILE_BATCH
+from Watermarks import Watermark
+
+# reviews of the author, most recent first; the watermark review (RGONE, March 1, 2020) was deleted
+DATES = ['June 3, 2021', 'January 9, 2021', 'July 14, 2020', 'March 2, 2020', 'February 27, 2020',
+         'December 1, 2019', 'August 8, 2019', 'May 5, 2019', 'April 1, 2019', 'January 2, 2019',
+         'November 11, 2018', 'October 10, 2018']
+IDS = [f'R{index:02d}' for index in range(len(DATES))]
+
+
+class StubFetcher:
+    """
+    Serves the profile of the author, with its first PROFILE_BATCH cards, and its review detail pages.
+    """
+
+    def get_page(self, url, kind):
+        if '/gp/profile/' in url:
+            cards = ''.join(f'<div class="a-row"><div class="a-section profile-at-content">'
+                            f'<p><a href="/gp/customer-reviews/{id}/ref=pf_vv_at_pdctrvw_srp">Read more</a></p>'
+                            f'</div></div>' for id in IDS[:PROFILE_BATCH])
+            return f'<html><body><div id="profile-at-card-container">{cards}</div></body></html>'
+        date = DATES[IDS.index(url.split('/customer-reviews/')[1].split('/')[0])]
+        return (f'<html><body><span data-hook="review-date">Reviewed in Canada on {date}</span>'
+                f'<a data-hook="review-title" href="#"><span>Title</span></a></body></html>')
+
+    def close(self):
+        pass
+
+
+def crawl_author(watermark):
+    async def crawl():
+        engine = CrawlEngine(fetcher=StubFetcher())
+        return await engine.crawl_author('http://localhost/gp/profile/amzn1.account.A1', watermark)
+
+    return asyncio.run(crawl())
+
+
+def test_reached_by_id_or_older_date():
+    watermark = Watermark('RGONE', '2020-03-01')
+    assert watermark.reached('RGONE')
+    assert not watermark.reached('R03')
+    assert not watermark.reached('R03', 'March 2, 2020')
+    assert not watermark.reached('R04', 'March 1, 2020')  # same day, may be newer than the watermark
+    assert watermark.reached('R04', 'February 27, 2020')
+
+
+def test_crawl_author_stops_at_older_review_when_watermark_is_missing():
+    author = crawl_author(Watermark('RGONE', '2020-03-01'))
+    assert author is not None
+    assert [review['review_id'] for review in author['reviews']] == IDS[:4]
+
+
+def test_crawl_author_leaves_long_feed_without_watermark_to_browser():
+    assert crawl_author(None) is None
+
+
+def test_crawl_author_leaves_feed_newer_than_watermark_to_browser():
+    assert crawl_author(Watermark('RGONE', '2017-01-01')) is None